@@ -0,0 +1,58 @@
+"""
+Reads a region heavy copper pour and times the region storage: the deep copy
+every G37 used to make, and reading into lists or a compact RegionStore.
+
+    python -m benchmarks.bench_regions [regions]
+"""
+
+import copy
+import gc
+import os
+import sys
+import tempfile
+import time
+
+import pygerber.gerber_layer as gl
+
+from benchmarks import corpus
+
+
+def timed(name, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed:8.2f} s")
+    return result
+
+
+def main(regions=50_000):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "pour.gbr")
+        with open(path, "w") as f:
+            f.write(corpus.pours(regions))
+
+        def read(compact):
+            layer = gl.GerberLayer(compact=compact)
+            layer.read(path)
+            return layer
+
+        # Neither layer is alive while the other is read, so the garbage
+        # collector doesn't walk one layer's tuples while timing the other
+        listed = timed("GerberLayer.read", lambda: read(False))
+        timed(
+            "deepcopy of every region",
+            lambda: [copy.deepcopy(r) for r in listed.collection_of_region],
+        )
+        del listed
+        gc.collect()
+        compact = timed("GerberLayer.read compact", lambda: read(True))
+        store = compact.collection_of_region
+        print(
+            f"{len(store)} regions, {len(store.contours)} operations "
+            f"in {store.nbytes() / 2**20:.1f} MiB of arrays"
+        )
+        timed("primitive_bounds compact", compact.primitive_bounds)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
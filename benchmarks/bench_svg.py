@@ -0,0 +1,60 @@
+"""
+Compares the svgwrite based renderer with the streaming SVG writer on a pad
+heavy layer.
+
+    python -m benchmarks.bench_svg [flashes]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import pygerber.gerber_layer as gl
+import pygerber.renderers.svg as svg
+import pygerber.renderers.svg_stream as svg_stream
+
+from benchmarks import corpus
+
+
+def timed(name, func, path):
+    start = time.perf_counter()
+    func(path)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"{name:<24} {elapsed:8.2f} s {size / 2**20:10.1f} MiB")
+    return elapsed, size
+
+
+def main(flashes=200_000):
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "pads.gbr")
+        with open(source, "w") as f:
+            f.write(corpus.pads(flashes))
+        layer = gl.GerberLayer()
+        layer.read(source)
+
+        def tree(path):
+            renderer = svg.SvgLayerRenderer()
+            renderer.add_layer(layer)
+            renderer.save(path)
+
+        def stream(path):
+            with svg_stream.SvgStreamRenderer(path) as renderer:
+                renderer.add_layer(layer)
+
+        before = timed("SvgLayerRenderer", tree, os.path.join(folder, "tree.svg"))
+        after = timed("SvgStreamRenderer", stream, os.path.join(folder, "stream.svg"))
+        print(
+            f"time: {before[0] / after[0]:.1f}x faster, "
+            f"size: {before[1] / after[1]:.1f}x smaller"
+        )
+        timed(
+            "render_file",
+            lambda path: svg_stream.render_file(source, path),
+            os.path.join(folder, "file.svg"),
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
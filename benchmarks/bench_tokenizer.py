@@ -0,0 +1,115 @@
+"""
+Compares the per-command lookup path with the single pass tokenizer, and
+GerberLayer.read end to end against the same read in another checkout.
+
+    python -m benchmarks.bench_tokenizer [commands] [baseline checkout]
+
+e.g. with the baseline checked out by
+    git worktree add /tmp/baseline <commit before the tokenizer>
+"""
+
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygerber.standards.gerber as gf
+import pygerber.tokenizer as tokenizer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READ = """
+import sys, time
+import pygerber.gerber_layer as gl
+start = time.perf_counter()
+layer = gl.GerberLayer()
+layer.read(sys.argv[1])
+print(len(layer.operations), time.perf_counter() - start)
+"""
+HEADER = "%MOMM*%\n%FSLAX46Y46*%\nG75*\n%ADD10C,0.150000*%\n%LPD*%\nG01*\nD10*\n"
+
+
+def synthetic_traces(commands: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = [HEADER, "X0Y0D02*\n"]
+    for _ in range(commands):
+        lines.append(f"X{rng.randrange(10**8)}Y{rng.randrange(10**8)}D01*\n")
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def legacy_tokenize(text: str):
+    """
+    Simulated: a rewrite of the lookup + elif + findall work done per command
+    before the tokenizer, not the old parser itself
+    """
+    count = 0
+    for line in io.StringIO(text).readlines():
+        buffer = line.strip()
+        if buffer.startswith("%") and buffer.endswith("%"):
+            buffer = buffer[1:-1]
+        if buffer.endswith("*"):
+            buffer = buffer[:-1]
+        op_type, content = gf.GerberFormat.lookup(buffer)
+        if op_type in [
+            gf.GerberFormat.OPERATION_FLASH,
+            gf.GerberFormat.OPERATION_MOVE,
+            gf.GerberFormat.OPERATION_INTERP,
+        ]:
+            values = re.findall(r"[A-Z]([\+|-]*\d+)", content)
+            (float(values[0]), float(values[1]))
+        count += 1
+    return count
+
+
+def single_pass_tokenize(text: str):
+    count = 0
+    for _ in tokenizer.tokenize(io.StringIO(text)):
+        count += 1
+    return count
+
+
+def read_in(root: str, path: str):
+    """Times GerberLayer.read of path in a new process importing from root"""
+    env = dict(os.environ, PYTHONPATH=root)
+    command = [sys.executable, "-c", READ, path]
+    output = subprocess.run(command, env=env, capture_output=True, check=True)
+    count, elapsed = output.stdout.split()
+    return int(count), float(elapsed)
+
+
+def report(name, count, elapsed):
+    print(
+        f"{name:<26} {count:>9} commands {elapsed:8.2f} s {count / elapsed:>12,.0f} /s"
+    )
+    return count / elapsed
+
+
+def timed(name, func, *args):
+    start = time.perf_counter()
+    count = func(*args)
+    return report(name, count, time.perf_counter() - start)
+
+
+def main(commands=1_000_000, baseline=None):
+    text = synthetic_traces(commands)
+    before = timed("simulated lookup", legacy_tokenize, text)
+    after = timed("single pass tokenizer", single_pass_tokenize, text)
+    print(f"tokenizer speedup over the simulated loop: {after / before:.1f}x")
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "traces.gbr")
+        with open(path, "w") as f:
+            f.write(text)
+
+        after = report("GerberLayer.read", *read_in(ROOT, path))
+        if baseline:
+            before = report("baseline GerberLayer.read", *read_in(baseline, path))
+            print(f"GerberLayer.read speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]], *sys.argv[2:3])
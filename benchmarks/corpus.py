@@ -0,0 +1,175 @@
+"""
+Seeded generators of synthetic Gerber and drill files. The same kind, size and
+seed always give the same text.
+
+    python -m benchmarks.corpus folder [size] [seed]
+"""
+
+import os
+import random
+import sys
+
+HEADER = "%MOMM*%\n%FSLAX46Y46*%\nG75*\n"
+UNITS = 10**6  # file units per mm in the 4.6 format
+BOARD = 100 * UNITS  # side of the square board, in file units
+
+PAD_APERTURES = (
+    "%ADD10C,0.150000*%\n%ADD11R,1.500000X0.800000*%\n"
+    "%ADD12C,0.600000*%\n%ADD13O,1.200000X0.600000*%\n"
+)
+MACROS = (
+    "%AMRoundRect*\n"
+    "4,1,4,$2,$3,$4,$5,$6,$7,$8,$9,$2,$3,0*\n"
+    "1,1,$1+$1,$2,$3*\n1,1,$1+$1,$4,$5*\n1,1,$1+$1,$6,$7*\n1,1,$1+$1,$8,$9*\n"
+    "20,1,$1+$1,$2,$3,$4,$5,0*\n20,1,$1+$1,$4,$5,$6,$7,0*\n"
+    "20,1,$1+$1,$6,$7,$8,$9,0*\n20,1,$1+$1,$8,$9,$2,$3,0*%\n"
+    "%AMPAD2*\n$3=$1x0.5*\n$4=($2-$1)/2*\n21,1,$1,$2,0,0,0*\n"
+    "1,1,$3x2,0,$4*\n1,1,$3x2,0,-$4*%\n"
+)
+DRILL_TOOLS = (0.3, 0.4, 0.6, 0.8, 1.0, 1.2, 3.2)
+
+
+def _point(rng) -> str:
+    return f"X{rng.randrange(BOARD)}Y{rng.randrange(BOARD)}"
+
+
+def pads(flashes: int, seed: int = 0) -> str:
+    """Mostly flashes of a few apertures, with a short trace every ten pads"""
+    rng = random.Random(seed)
+    lines = [HEADER, PAD_APERTURES, "%LPD*%\nG01*\n"]
+    for index in range(flashes):
+        x, y = rng.randrange(BOARD), rng.randrange(BOARD)
+        lines.append(f"D{11 + index % 3}*\nX{x}Y{y}D03*\n")
+        if index % 10 == 0:
+            lines.append(f"D10*\nX{x}Y{y}D02*\nX{x + UNITS}Y{y}D01*\n")
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def traces(draws: int, seed: int = 0) -> str:
+    """Routed nets: walks of horizontal, vertical and 45 degree segments"""
+    rng = random.Random(seed)
+    lines = [HEADER, "%ADD10C,0.150000*%\n%ADD11C,0.250000*%\n%LPD*%\nG01*\n"]
+    directions = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1)]
+    drawn = 0
+    while drawn < draws:
+        x, y = rng.randrange(BOARD), rng.randrange(BOARD)
+        lines.append(f"D{10 + rng.randrange(2)}*\nX{x}Y{y}D02*\n")
+        for _ in range(min(rng.randrange(2, 20), draws - drawn)):
+            dx, dy = rng.choice(directions)
+            step = rng.randrange(UNITS // 4, 5 * UNITS)
+            x = min(max(x + dx * step, 0), BOARD)
+            y = min(max(y + dy * step, 0), BOARD)
+            lines.append(f"X{x}Y{y}D01*\n")
+            drawn += 1
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def pours(regions: int, seed: int = 0) -> str:
+    """Small polygons with 4 to 12 corners, every fifth one in clear polarity"""
+    rng = random.Random(seed)
+    lines = [HEADER, "%ADD10C,0.150000*%\n%LPD*%\nG01*\n"]
+    for index in range(regions):
+        lines.append("%LPC*%\n" if index % 5 == 4 else "%LPD*%\n")
+        x, y = rng.randrange(BOARD), rng.randrange(BOARD)
+        corners = [
+            (x + rng.randrange(UNITS), y + rng.randrange(UNITS))
+            for _ in range(rng.randrange(4, 13))
+        ]
+        lines.append(f"G36*\nX{x}Y{y}D02*\n")
+        lines.extend(f"X{cx}Y{cy}D01*\n" for cx, cy in corners)
+        lines.append(f"X{x}Y{y}D01*\nG37*\n")
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def macros(flashes: int, seed: int = 0) -> str:
+    """Flashes of KiCad style macro apertures, in 50 sizes of each macro"""
+    rng = random.Random(seed)
+    lines = [HEADER, MACROS]
+    for index in range(50):
+        half = 0.2 + index * 0.02
+        corners = f"{-half}X{half}X{half}X{half}X{half}X{-half}X{-half}X{-half}"
+        lines.append(f"%ADD{10 + index}RoundRect,0.05X{corners}*%\n")
+        lines.append(f"%ADD{60 + index}PAD2,{0.4 + index * 0.01}X1.4*%\n")
+    lines.append("%LPD*%\n")
+    for _ in range(flashes):
+        lines.append(f"D{10 + rng.randrange(100)}*\n{_point(rng)}D03*\n")
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def arcs(draws: int, seed: int = 0) -> str:
+    """Chains of quarter circles in both directions, with a line every eighth"""
+    rng = random.Random(seed)
+    lines = [HEADER, "%ADD10C,0.200000*%\n%LPD*%\nD10*\n"]
+    drawn = 0
+    while drawn < draws:
+        x, y = rng.randrange(BOARD), rng.randrange(BOARD)
+        lines.append(f"X{x}Y{y}D02*\n")
+        for _ in range(min(rng.randrange(4, 16), draws - drawn)):
+            r = rng.randrange(UNITS // 2, 3 * UNITS)
+            if rng.randrange(8) == 0:
+                x += r
+                lines.append(f"G01*\nX{x}Y{y}D01*\n")
+            else:
+                # Quarter turn about a center r to the left or right
+                mode, side = rng.choice([("G02", -1), ("G03", 1)])
+                lines.append(f"{mode}*\nX{x + r}Y{y + side * r}I0J{side * r}D01*\n")
+                x, y = x + r, y + side * r
+            drawn += 1
+    lines.append("M02*\n")
+    return "".join(lines)
+
+
+def drill(hits: int, seed: int = 0) -> str:
+    """Hits with decimal millimeter coordinates, grouped by tool as exported"""
+    rng = random.Random(seed)
+    lines = ["M48\n;synthetic drill file\nMETRIC\n"]
+    lines.extend(f"T{n:02d}C{d}\n" for n, d in enumerate(DRILL_TOOLS, 1))
+    lines.append("%\nG05\n")
+    # Small vias are by far the most common holes
+    weights = [2**-n for n in range(len(DRILL_TOOLS))]
+    counts = [0] * len(DRILL_TOOLS)
+    for tool in rng.choices(range(len(DRILL_TOOLS)), weights, k=hits):
+        counts[tool] += 1
+    for tool, count in enumerate(counts, 1):
+        if not count:
+            continue
+        lines.append(f"T{tool:02d}\n")
+        for _ in range(count):
+            x, y = rng.randrange(BOARD) / UNITS, rng.randrange(BOARD) / UNITS
+            lines.append(f"X{x:.3f}Y{y:.3f}\n")
+    lines.append("M30\n")
+    return "".join(lines)
+
+
+GERBER_KINDS = {
+    "pads": pads,
+    "traces": traces,
+    "pours": pours,
+    "macros": macros,
+    "arcs": arcs,
+}
+KINDS = dict(GERBER_KINDS, drill=drill)
+EXTENSIONS = {"drill": ".drl"}
+
+
+def write_file(folder: str, kind: str, size: int, seed: int = 0) -> str:
+    """Writes one generated file to folder and returns its path"""
+    extension = EXTENSIONS.get(kind, ".gbr")
+    path = os.path.join(folder, f"{kind}_{size}_{seed}{extension}")
+    with open(path, "w") as f:
+        f.write(KINDS[kind](size, seed))
+    return path
+
+
+def main(folder, size=10_000, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    for kind in KINDS:
+        print(write_file(folder, kind, size, seed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], *[int(arg) for arg in sys.argv[2:]])
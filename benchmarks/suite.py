@@ -0,0 +1,245 @@
+"""
+Times reading, writing and rendering generated layers of every corpus kind,
+each case in a fresh process, and reports operations per second, peak RSS and
+traced memory per operation.
+
+    python -m benchmarks.suite [--scale 1] [--seed 0] [--only read]
+        [--json results.json] [--baseline previous.json]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import pygerber
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.renderers.svg as svg
+
+from benchmarks import corpus
+
+# Primitives per generated Gerber layer, and hits per drill file, at scale 1
+SIZES = {
+    "pads": 20_000,
+    "traces": 50_000,
+    "pours": 10_000,
+    "macros": 20_000,
+    "arcs": 20_000,
+}
+DRILL_SIZES = (1_000, 30_000, 1_000_000)
+RSS_UNITS = 1 if sys.platform == "darwin" else 1024  # bytes per ru_maxrss unit
+REGRESSION = 0.9  # ops/s ratios to the baseline below this are flagged
+
+
+class Case(NamedTuple):
+    name: str
+    kind: str
+    size: int
+
+
+class Result(NamedTuple):
+    name: str
+    kind: str
+    size: int
+    operations: int
+    seconds: float
+    ops_per_second: float
+    peak_rss_mib: Optional[float]
+    peak_bytes_per_op: float  # traced memory at its peak during the run
+    retained_bytes_per_op: float  # traced memory still held by the result
+
+
+def _gerber_operations(layer: gl.GerberLayer) -> int:
+    return len(layer.operations) + len(layer.collection_of_region)
+
+
+def _read_gerber(path, folder, compact=False):
+    def run():
+        layer = gl.GerberLayer(compact=compact)
+        layer.read(path)
+        return _gerber_operations(layer), layer
+
+    return run
+
+
+def _write_gerber(path, folder):
+    layer = gl.GerberLayer(compact=True)
+    layer.read(path)
+
+    def run():
+        layer.write(f"{folder}/written.gbr")
+        return _gerber_operations(layer), None
+
+    return run
+
+
+def _render_svg(path, folder):
+    layer = gl.GerberLayer()
+    layer.read(path)
+
+    def run():
+        renderer = svg.SvgLayerRenderer()
+        renderer.add_layer(layer)
+        renderer.save(f"{folder}/layer.svg")
+        return _gerber_operations(layer), None
+
+    return run
+
+
+def _read_drill(path, folder, compact=False):
+    def run():
+        layer = drl.DrillLayer(compact=compact)
+        layer.read(path)
+        return len(layer.operations), layer
+
+    return run
+
+
+def _write_drill(path, folder):
+    layer = drl.DrillLayer(compact=True)
+    layer.read(path)
+
+    def run():
+        layer.write(f"{folder}/written.drl")
+        return len(layer.operations), None
+
+    return run
+
+
+ACTIONS = {
+    "GerberLayer.read": _read_gerber,
+    "GerberLayer.read compact": lambda path, folder: _read_gerber(path, folder, True),
+    "GerberLayer.write": _write_gerber,
+    "SvgLayerRenderer": _render_svg,
+    "DrillLayer.read": _read_drill,
+    "DrillLayer.read compact": lambda path, folder: _read_drill(path, folder, True),
+    "DrillLayer.write": _write_drill,
+}
+
+
+def cases(scale=1.0) -> List[Case]:
+    found = []
+    for kind, size in SIZES.items():
+        size = max(1, int(size * scale))
+        for name in ACTIONS:
+            # Regions aren't written, a pour layer has nothing else
+            skip = name == "GerberLayer.write" and kind == "pours"
+            if name.startswith("DrillLayer") or skip:
+                continue
+            found.append(Case(name, kind, size))
+    for size in DRILL_SIZES:
+        size = max(1, int(size * scale))
+        for name in ACTIONS:
+            if name.startswith("DrillLayer"):
+                found.append(Case(name, "drill", size))
+    return found
+
+
+def measure(case: Case, seed=0) -> Result:
+    """Runs a case once timed, then once more traced by tracemalloc"""
+    with tempfile.TemporaryDirectory() as folder:
+        path = corpus.write_file(folder, case.kind, case.size, seed)
+        run = ACTIONS[case.name](path, folder)
+        start = time.perf_counter()
+        operations, _ = run()
+        seconds = time.perf_counter() - start
+        peak_rss = None
+        if resource is not None:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            peak_rss = peak * RSS_UNITS / 2**20
+
+        run = ACTIONS[case.name](path, folder)
+        tracemalloc.start()
+        try:
+            _, result = run()
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del result
+
+    count = max(operations, 1)
+    return Result(
+        *case,
+        operations,
+        seconds,
+        operations / seconds if seconds else float("inf"),
+        peak_rss,
+        peak / count,
+        retained / count,
+    )
+
+
+def run_cases(selected: List[Case], seed=0) -> List[Result]:
+    """Measures every case in a new process, one at a time"""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in selected:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(measure, case, seed).result()
+        results.append(result)
+        print(_row(result), flush=True)
+    return results
+
+
+def _row(result: Result, baseline: Optional[dict] = None) -> str:
+    rss = "-" if result.peak_rss_mib is None else f"{result.peak_rss_mib:.0f}"
+    row = (
+        f"{result.name:<26} {result.kind:<7} {result.size:>9} "
+        f"{result.ops_per_second:>12,.0f} ops/s {rss:>6} MiB "
+        f"{result.peak_bytes_per_op:>8.0f} B/op peak "
+        f"{result.retained_bytes_per_op:>6.0f} B/op kept"
+    )
+    if baseline:
+        ratio = result.ops_per_second / baseline["ops_per_second"]
+        row += f"  x{ratio:.2f}" + (" REGRESSION" if ratio < REGRESSION else "")
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="size multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", default="", help="run cases with this in name")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare to results of a previous run")
+    args = parser.parse_args(argv)
+
+    selected = [case for case in cases(args.scale) if args.only in case.name]
+    results = run_cases(selected, args.seed)
+    if args.baseline:
+        with open(args.baseline) as f:
+            previous = {
+                (r["name"], r["kind"], r["size"]): r for r in json.load(f)["results"]
+            }
+        print(f"\nCompared to {args.baseline}:")
+        for result in results:
+            baseline = previous.get((result.name, result.kind, result.size))
+            print(_row(result, baseline))
+    if args.json:
+        report = {
+            "pygerber": pygerber.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "scale": args.scale,
+            "results": [result._asdict() for result in results],
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
+import concurrent.futures
+import io
 import logging
 import os
-import tempfile
 import zipfile
 
-import layers.drill_layer as drl
-import layers.gerber_layer as gl
-import standard.gerber
-import standard.nc_drill
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.standards.gerber
+import pygerber.standards.nc_drill
 
 FILE_EXT_TO_LAYER = {
-    k: gl.GerberLayer for k in standard.gerber.FILE_EXT_TO_NAME
-}.update({k: drl.DrillLayer for k in standard.nc_drill.FILE_EXTENSIONS})
+    k: gl.GerberLayer for k in pygerber.standards.gerber.FILE_EXT_TO_NAME
+}
+FILE_EXT_TO_LAYER.update(
+    {
+        f".{k.lower()}": drl.DrillLayer
+        for k in pygerber.standards.nc_drill.FILE_EXTENSIONS
+    }
+)
 
 STANDARD_COLOR_SET = {
     "background": "black",
@@ -25,26 +32,66 @@ STANDARD_COLOR_SET = {
 }
 
 
+def _load_layer(archive, filename, layer_type, cache=None):
+    """
+    Parses one layer, reading it straight out of the zip archive if there is one.
+    Runs in a worker process so it must be importable and return a picklable layer.
+    """
+    kwargs = {"compact": True}
+    if archive is None and cache is not None:
+        return cache.read(filename, layer_type, **kwargs)
+    layer = layer_type(**kwargs)
+    if archive is None:
+        layer.read(filename)
+        return layer
+    with zipfile.ZipFile(archive, "r") as zipped:
+        with io.TextIOWrapper(zipped.open(filename), encoding="utf-8") as f:
+            layer.read(f)
+    return layer
+
+
 class Board:
     def __init__(self, filepath):
+        self.path = filepath
         self.files = {}
+        self.layers = {}
+        self._archive = None
         extension = os.path.splitext(filepath)[1].lower()
-        if extension == "zip":
-            temp_path = tempfile.mkdtemp()
-            logging.info(f"Extracting files to {temp_path}")
+        if extension == ".zip":
+            self._archive = filepath
             with zipfile.ZipFile(filepath, "r") as zipped:
-                zipped.extractall(temp_path)
-                self.read_in_files_from_folder(temp_path)
+                self.read_in_files(zipped.namelist())
         elif os.path.isdir(self.path):
             self.read_in_files_from_folder(filepath)
         else:
             raise ValueError(f"Unknown file: {filepath}")
 
     def read_in_files_from_folder(self, path):
-        for _, _, files in os.walk(path):
-            for filename in files:
-                extension = os.path.splitext(filename)[1].upper()
-                if extension in FILE_EXT_TO_LAYER:
-                    self.files[FILE_EXT_TO_LAYER[extension]] = filename
-                else:
-                    logging.info(f"Unknown file type: {filename}")
+        for root, _, files in os.walk(path):
+            self.read_in_files([os.path.join(root, filename) for filename in files])
+
+    def read_in_files(self, filenames):
+        for filename in filenames:
+            extension = os.path.splitext(filename)[1].lower()
+            if extension in FILE_EXT_TO_LAYER:
+                self.files[filename] = FILE_EXT_TO_LAYER[extension]
+            else:
+                logging.info(f"Unknown file type: {filename}")
+
+    def load(self, parallel=None, cache=None):
+        """
+        Parses every layer of the board. With parallel=N the layers are parsed in
+        a pool of N worker processes, so the board loads in about the time of its
+        largest layer. Layers read from a folder are looked up in the LayerCache
+        if one is given.
+        """
+        jobs = [
+            (self._archive, name, layer, cache) for name, layer in self.files.items()
+        ]
+        if not parallel or parallel <= 1:
+            layers = [_load_layer(*job) for job in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=parallel) as pool:
+                layers = list(pool.map(_load_layer, *zip(*jobs)))
+        self.layers = {job[1]: layer for job, layer in zip(jobs, layers)}
+        return self.layers
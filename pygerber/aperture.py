@@ -1,8 +1,10 @@
 import enum
+import functools
 import logging
 import math
 import re
-from typing import Any, Dict, List, NamedTuple, Tuple
+import warnings
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
 
 
 class ApertureCircle(NamedTuple):
@@ -51,6 +53,37 @@ APERTURES = [
 ]
 
 
+def shape_extent(shape) -> Tuple[float, float]:
+    """
+    Half width and half height of the box around a shape (or list of macro
+    shapes), measured from the flash point
+    """
+    if isinstance(shape, list):
+        extents = [shape_extent(s) for s in shape] or [(0, 0)]
+        return max(e[0] for e in extents), max(e[1] for e in extents)
+    if isinstance(shape, ApertureCircle):
+        return shape.r + abs(shape.cx), shape.r + abs(shape.cy)
+    if isinstance(shape, ApertureRectangle):
+        c, s = abs(math.cos(shape.rotation)), abs(math.sin(shape.rotation))
+        w, h = shape.width / 2, shape.height / 2
+        return w * c + h * s + abs(shape.cx), w * s + h * c + abs(shape.cy)
+    if isinstance(shape, AperturePolygon):
+        r = shape.diameter / 2
+        return r + abs(shape.cx), r + abs(shape.cy)
+    if isinstance(shape, ApertureOutline):
+        if not shape.points:
+            return 0, 0
+        if shape.rotation:
+            r = max(math.hypot(x, y) for x, y in shape.points)
+            return r, r
+        return max(abs(x) for x, _ in shape.points), max(
+            abs(y) for _, y in shape.points
+        )
+    if hasattr(shape, "extent"):  # block apertures
+        return shape.extent()
+    raise NotImplementedError(shape)
+
+
 class MacroPrimitive(enum.Enum):
     COMMENT = 0
     CIRCLE = 1
@@ -69,36 +102,171 @@ class Aperture(NamedTuple):
     rotation: float = 0
     hole: float = 0
     comments: List[str] = []
+    parameters: Tuple[float, ...] = ()  # AD parameters of macro apertures
+
+    def extent(self) -> Tuple[float, float]:
+        """Half width and half height of the aperture around its flash point"""
+        hx, hy = shape_extent(self.shape)
+        if self.rotation:  # macro rotation is about the origin, in degrees
+            r = math.hypot(hx, hy)
+            return r, r
+        return hx, hy
+
+
+_EXPRESSION_TOKEN = re.compile(
+    r"\s*(?:(?P<number>\d+\.?\d*|\.\d+)|\$(?P<variable>\d+)|(?P<operator>[-+xX/()]))"
+)
+MACRO_CACHE_SIZE = 1024  # compiled macros kept for AM statements read again
+_ASSIGNMENT = re.compile(r"^\$(\d+)\s*=(.*)$", re.DOTALL)
+
+
+def compile_expression(expression: str) -> Tuple[str, List[int]]:
+    """
+    Translates a macro arithmetic expression, e.g. "$1x0.5+$2", to Python source
+    over the variable list v. Returns the source and the variables it reads.
+    Operands and binary operators must alternate and parentheses balance.
+    """
+    source, variables, position = [], [], 0
+    operand, depth = True, 0  # whether an operand is expected next
+    expression = expression.strip()
+    error = f"Invalid macro expression: {expression!r}"
+    while position < len(expression):
+        match = _EXPRESSION_TOKEN.match(expression, position)
+        if not match:
+            raise ValueError(error)
+        position = match.end()
+        operator = match["operator"]
+        if match["number"] or match["variable"]:
+            if not operand:
+                raise ValueError(error)
+            operand = False
+            if match["number"]:
+                source.append(repr(float(match["number"])))
+            else:
+                variables.append(int(match["variable"]))
+                source.append(f"v[{int(match['variable'])}]")
+            continue
+        if operator == "(":
+            if not operand:
+                raise ValueError(error)
+            depth += 1
+        elif operator == ")":
+            if operand or not depth:
+                raise ValueError(error)
+            depth -= 1
+        elif operand and operator not in "+-":  # only signs are unary
+            raise ValueError(error)
+        else:
+            operand = True
+        source.append("*" if operator in "xX" else operator)
+    if not source:
+        raise ValueError(f"Empty macro expression: {expression!r}")
+    if operand or depth:
+        raise ValueError(error)
+    return "".join(source), variables
+
+
+@functools.lru_cache(maxsize=MACRO_CACHE_SIZE)
+def compile_macro(
+    statements: Tuple[Tuple[Optional["MacroPrimitive"], str], ...], name=""
+):
+    """
+    Compiles macro statements once into a function of the AD parameters that
+    returns the evaluated (primitive, [modifiers]) of every primitive.
+    Statements with primitive None are variable assignments, "$4=$1/2".
+    Variables that are never given or assigned evaluate to 0.
+    Invalid statements raise a ValueError naming the macro.
+    """
+    try:
+        return _compile_macro(statements)
+    except (ValueError, SyntaxError, SyntaxWarning) as error:
+        raise ValueError(f"Invalid aperture macro {name}: {error}") from error
+
+
+def _compile_macro(statements):
+    lines, parameters, assigned, size = [], set(), set(), 1
+    primitives = []
+    for primitive, text in statements:
+        if primitive is None:
+            match = _ASSIGNMENT.match(text.strip())
+            if not match:
+                raise ValueError(f"Invalid macro variable definition: {text}")
+            target = int(match.group(1))
+            source, variables = compile_expression(match.group(2))
+            parameters.update(set(variables) - assigned)
+            assigned.add(target)
+            size = max([size, target + 1] + [v + 1 for v in variables])
+            lines.append(f"    v[{target}] = {source}")
+            continue
+        modifiers = []
+        for field in text.split(","):
+            source, variables = compile_expression(field)
+            parameters.update(set(variables) - assigned)
+            size = max([size] + [v + 1 for v in variables])
+            modifiers.append(source)
+        primitives.append(f"(P{len(primitives)}, [{', '.join(modifiers)}])")
+        lines.append(f"    shapes.append({primitives[-1]})")
+
+    source = "\n".join(
+        [
+            "def evaluate(values):",
+            "    v = [0.0, *values, *ZEROS]",
+            "    shapes = []",
+            *lines,
+            "    return shapes",
+        ]
+    )
+    primitive_types = [p for p, _ in statements if p is not None]
+    namespace = {f"P{i}": p for i, p in enumerate(primitive_types)}
+    namespace.update(ZEROS=(0.0,) * size, __builtins__={})
+    # compile_expression checked every expression, so this is plain arithmetic
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", SyntaxWarning)
+        exec(compile(source, "<aperture macro>", "exec"), namespace)
+    evaluate = namespace["evaluate"]
+    evaluate.parameters = max(parameters, default=0)
+    return evaluate
 
 
 class Macro(NamedTuple):
     name: str
-    statements: List[Tuple[MacroPrimitive, str]]
+    statements: List[Tuple[Optional[MacroPrimitive], str]]
+    compiled: Optional[Callable] = None  # compile_macro of the statements
+
+    @property
+    def evaluate(self):
+        """The compiled macro, see compile_macro"""
+        if self.compiled is not None:
+            return self.compiled
+        return compile_macro(tuple(self.statements), self.name)
+
+    def __reduce__(self):
+        # Compiled functions don't pickle, they are compiled again when used
+        return Macro, (self.name, self.statements)
 
     def validate_values(self, values):
-        data = [text for _, text in self.statements]
-        results = re.findall(r"\$(\d+)", " ".join(data))
-        count = len(set(results))
-        error = f"Invalid values! Got {len(values)}, expected {count}"
-        assert count == len(values), error
-
-    def _parse(self, values: List[float]):
-        parsed = []
-        for p, statement in self.statements:
-            for i, value in enumerate(values):
-                statement = statement.replace(f"${i + 1}", str(value))
-            parsed.append((p, [float(v) for v in statement.split(",")]))
-        return parsed
+        count = self.evaluate.parameters
+        if count > len(values):
+            raise ValueError(
+                f"Aperture macro {self.name} needs {count} parameters, "
+                f"got {len(values)}"
+            )
 
     def generate_aperture(self, index: int, values: List[float], comments):
         self.validate_values(values)
+        try:
+            evaluated = self.evaluate(values)
+        except (ArithmeticError, TypeError, IndexError) as error:
+            raise ValueError(
+                f"Aperture macro {self.name} can't be evaluated with {values}: {error}"
+            ) from error
         shapes = []
-        for primitive, statement in self._parse(values):
+        for primitive, statement in evaluated:
             shape = None
             exposure = True
             rotation = 0
             if primitive == MacroPrimitive.CIRCLE:
-                exposure, diameter, cx, cy, rotation = statement
+                exposure, diameter, cx, cy, rotation = (statement + [0])[:5]
                 shape = ApertureCircle(
                     diameter=diameter,
                     cx=cx,
@@ -150,11 +318,12 @@ class Macro(NamedTuple):
             else:
                 raise NotImplementedError(statement)
             shapes.append(shape)
-        return Aperture(index, exposure, shapes, rotation, 0, comments)
+        return Aperture(index, exposure, shapes, rotation, 0, comments, tuple(values))
 
     def from_aperture(self, aperture: Aperture):
+        primitives = [s for s in self.statements if s[0] is not None]
         for i, shape in enumerate(aperture.shape):
-            primitive, statement = self.statements[i]
+            primitive, statement = primitives[i]
             variables = set(re.findall(r"\$\d+", statement))
             variable_indicies = []
             for variable in sorted(variables):
@@ -194,23 +363,78 @@ class Macro(NamedTuple):
             return f"{self.name},{parsed}"
 
 
+class TemplateCache:
+    """
+    Geometry built once and reused, e.g. per aperture for every flash of it.
+    hits and misses count the lookups so the reuse can be checked on real layers.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, Any] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, build: Callable[[], Any]):
+        """Returns the template for key, calling build() on a miss"""
+        return self._lookup(key, build, None)
+
+    def get_for(self, owner, build: Callable[[], Any], *variant: Hashable):
+        """
+        Template for an unhashable object such as an Aperture, keyed by identity.
+        The object is kept alive with the entry, and an entry whose stored object
+        isn't owner, e.g. one unpickled from another process, is rebuilt.
+        """
+        return self._lookup((id(owner),) + variant, build, owner)
+
+    def _lookup(self, key, build, owner):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is owner:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = build()
+        self._entries[key] = owner, value
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
 class ApertureFactory:
     def __init__(self):
         self.macros: Dict[str, Macro] = {}
         self._macro_map: Dict[str, int] = {}
+        # Macro apertures expanded once per distinct set of parameters
+        self.templates = TemplateCache()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Templates are keyed by the ids of the pickling process's macros
+        self.templates = TemplateCache()
 
     def from_aperture_define(self, statement, comments=[]):
         def pad_optional_params(params: List[float], count: int):
             return params + [0] * (count - len(params))
 
-        pattern = re.compile(r"^D(\d+)([A-z]+),([\d.X]+)$")
-        aperture_id, shape, params = pattern.findall(statement)[0]
-        parameters = [float(p) for p in params.split("X")]
+        pattern = re.compile(r"^D(\d+)([^,]+),?(.*)$", re.DOTALL)
+        match = pattern.match(statement.strip())
+        if not match:
+            raise ValueError(f"Invalid aperture definition: {statement}")
+        aperture_id, shape, params = match.groups()
+        parameters = [float(p) for p in params.split("X") if p.strip()]
         hole = 0
         if shape in self.macros:
             macro = self.macros[shape]
             self._macro_map[int(aperture_id)] = shape
-            return macro.generate_aperture(int(aperture_id), parameters, comments)
+            aperture = self.templates.get_for(
+                macro,
+                lambda: macro.generate_aperture(0, parameters, []),
+                tuple(parameters),
+            )
+            return aperture._replace(index=int(aperture_id), comments=comments)
         elif shape == "C":
             diameter, hole = pad_optional_params(parameters, 2)
             shape = ApertureCircle(diameter=diameter)
@@ -239,6 +463,9 @@ class ApertureFactory:
             # Handling macros
             shape = self._macro_map[int(aperture.index)]
             macro = self.macros[shape]
+            if aperture.parameters:
+                params = "X".join(str(p) for p in aperture.parameters)
+                return f"ADD{aperture.index}{macro.name},{params}"
             define = macro.from_aperture(aperture)
             return f"ADD{aperture.index}{define}"
         else:
@@ -251,24 +478,33 @@ class ApertureFactory:
             return f"ADD{aperture.index}{shape},{params}"
 
     def define_macro(self, statement):
-        data = statement.split("*\n")
+        data = [row.strip() for row in statement.split("*")]
         name, rows = data[0], data[1:]
         statements = []
         for row in rows:
+            row = row.replace("\n", "").replace("\r", "")
             if not row:
                 continue
-            row = row.replace("\n", "")
-            primitive = MacroPrimitive(int(row[0]))
-            if primitive == MacroPrimitive.COMMENT:
+            if row[0] == "0":
                 logging.info(f"Macro {name} comment: {row[1:]}")
                 continue
-            assert row[1] == ",", "Malformed macro"
-            statements.append((primitive, row[2:]))
-        self.macros[name] = Macro(name, statements)
+            if row[0] == "$":  # variable definition, e.g. $4=$1/2
+                statements.append((None, row))
+                continue
+            code, _, modifiers = row.partition(",")
+            assert modifiers, "Malformed macro"
+            statements.append((MacroPrimitive(int(code)), modifiers))
+        # Compiled once here, so syntax errors surface at AM
+        compiled = compile_macro(tuple(statements), name)
+        macro = Macro(name, statements, compiled)
+        self.macros[name] = macro
 
     def macro_to_str(self, macro: Macro) -> str:
         statement = f"%AM{macro.name}*\n"
         for primitive, params in macro.statements:
-            statement += f"{primitive.value},{params}*\n"
+            if primitive is None:
+                statement += f"{params}*\n"
+            else:
+                statement += f"{primitive.value},{params}*\n"
         statement += "%"
         return statement
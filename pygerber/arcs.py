@@ -0,0 +1,244 @@
+import math
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+import pygerber.geometry as geometry_lib
+import pygerber.operation_store as store_lib
+import pygerber.standards.gerber as gf
+
+TAU = 2 * math.pi
+# Sweep slack when matching single quadrant centers, in radians
+QUADRANT_SLACK = 1e-6
+
+
+class Arcs(NamedTuple):
+    """
+    Circular arcs from (x0, y0) to (x1, y1) around (cx, cy), in arrays.
+    sweep is the signed angle from the start point, positive counterclockwise;
+    start is the angle of the start point.
+    """
+
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    cx: np.ndarray
+    cy: np.ndarray
+    start: np.ndarray
+    sweep: np.ndarray
+
+    @property
+    def radius(self) -> np.ndarray:
+        return np.hypot(self.x0 - self.cx, self.y0 - self.cy)
+
+    @property
+    def end_radius(self) -> np.ndarray:
+        return np.hypot(self.x1 - self.cx, self.y1 - self.cy)
+
+    def take(self, rows) -> "Arcs":
+        return Arcs(*(column[rows] for column in self))
+
+
+class Polylines(NamedTuple):
+    """Polyline k has the vertices vertices[offsets[k]:offsets[k + 1]]"""
+
+    vertices: np.ndarray  # (V, 2)
+    offsets: np.ndarray  # (n + 1,)
+
+    def segments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(x0, y0, x1, y1) of every segment, over all polylines"""
+        starts = np.ones(len(self.vertices), dtype=bool)
+        starts[self.offsets[1:] - 1] = False
+        x, y = self.vertices[:, 0], self.vertices[:, 1]
+        first = np.nonzero(starts)[0]
+        return x[first], y[first], x[first + 1], y[first + 1]
+
+    def owners(self) -> np.ndarray:
+        """Polyline of every segment returned by segments()"""
+        return np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets) - 1)
+
+
+def _sweeps(x0, y0, x1, y1, cx, cy, clockwise, full):
+    start = np.arctan2(y0 - cy, x0 - cx)
+    end = np.arctan2(y1 - cy, x1 - cx)
+    ccw = np.mod(end - start, TAU)
+    cw = np.mod(start - end, TAU)
+    ccw, cw = np.where(full, TAU, ccw), np.where(full, TAU, cw)
+    return start, np.where(clockwise, -cw, ccw)
+
+
+def resolve(x0, y0, x1, y1, i, j, clockwise, single=False) -> Arcs:
+    """
+    Arcs of Gerber circular interpolations from (x0, y0) to (x1, y1).
+    In multi quadrant mode (G75) the center is the start point plus (i, j), and
+    an arc ending where it starts is a full circle. In single quadrant mode
+    (G74) the offsets are unsigned and the center is the one of the four
+    candidates giving an arc of at most 90 degrees that best fits both ends.
+    """
+    x0, y0, x1, y1, i, j = (np.asarray(v, np.float64) for v in (x0, y0, x1, y1, i, j))
+    clockwise = np.broadcast_to(np.asarray(clockwise, dtype=bool), x0.shape)
+    single = np.broadcast_to(np.asarray(single, dtype=bool), x0.shape)
+    cx, cy = x0 + i, y0 + j
+
+    if single.any():
+        signs = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]], dtype=np.float64)
+        sx0, sy0 = x0[single, None], y0[single, None]
+        sx1, sy1 = x1[single, None], y1[single, None]
+        ccx = sx0 + np.abs(i[single, None]) * signs[:, 0]
+        ccy = sy0 + np.abs(j[single, None]) * signs[:, 1]
+        _, sweep = _sweeps(sx0, sy0, sx1, sy1, ccx, ccy, clockwise[single, None], False)
+        misfit = np.abs(np.hypot(sx0 - ccx, sy0 - ccy) - np.hypot(sx1 - ccx, sy1 - ccy))
+        misfit += np.where(np.abs(sweep) <= math.pi / 2 + QUADRANT_SLACK, 0, np.inf)
+        best = np.argmin(np.nan_to_num(misfit, nan=np.inf), axis=1)
+        rows = np.arange(len(best))
+        cx[single], cy[single] = ccx[rows, best], ccy[rows, best]
+
+    full = ~single & (x0 == x1) & (y0 == y1)
+    start, sweep = _sweeps(x0, y0, x1, y1, cx, cy, clockwise, full)
+    return Arcs(x0, y0, x1, y1, cx, cy, start, sweep)
+
+
+def from_radius(x0, y0, x1, y1, radius, clockwise) -> Arcs:
+    """
+    Arcs of a given radius, as in Excellon G02/G03 routs with an A word: the
+    shorter arc between the points, or the longer one for a negative radius
+    """
+    x0, y0, x1, y1, radius = (
+        np.asarray(v, np.float64) for v in (x0, y0, x1, y1, radius)
+    )
+    clockwise = np.broadcast_to(np.asarray(clockwise, dtype=bool), x0.shape)
+    dx, dy = x1 - x0, y1 - y0
+    chord = np.hypot(dx, dy)
+    r = np.maximum(np.abs(radius), chord / 2)
+    # Distance of the center from the middle of the chord, on its left for a
+    # short counterclockwise arc
+    height = np.sqrt(r**2 - (chord / 2) ** 2) / np.where(chord > 0, chord, 1)
+    side = np.where(clockwise == (radius < 0), 1.0, -1.0) * height
+    cx = (x0 + x1) / 2 - side * dy
+    cy = (y0 + y1) / 2 + side * dx
+    start, sweep = _sweeps(x0, y0, x1, y1, cx, cy, clockwise, chord == 0)
+    return Arcs(x0, y0, x1, y1, cx, cy, start, sweep)
+
+
+def store_arcs(store: store_lib.OperationStore) -> Tuple[np.ndarray, Arcs]:
+    """Indices of the circular draws in an OperationStore and their arcs"""
+    codes = store_lib.INTERPOLATION_CODES
+    draw = store.op == store_lib.OPERATION_CODES.index(gf.GerberFormat.OPERATION_INTERP)
+    interpolation = store.interpolation
+    indices = np.nonzero(
+        draw
+        & (interpolation >= codes.index(gf.GerberFormat.INTERP_MODE_CW))
+        & ~np.isnan(store.i)
+        & ~np.isnan(store.prev_x)
+    )[0]
+    single = np.zeros(len(store), dtype=bool)
+    for start, stop, mode in store.quadrant_mode.runs(len(store)):
+        single[start:stop] = mode == gf.GerberFormat.QUADMODE_SINGLE
+    clockwise = interpolation == codes.index(gf.GerberFormat.INTERP_MODE_CW)
+    arcs = resolve(
+        store.prev_x[indices],
+        store.prev_y[indices],
+        store.x[indices],
+        store.y[indices],
+        store.i[indices],
+        store.j[indices],
+        clockwise[indices],
+        single[indices],
+    )
+    return indices, arcs
+
+
+def from_state(state) -> Arcs:
+    """The arc of a single circular OperationState"""
+    (x1, y1), (i, j) = state.point
+    x0, y0 = state.previous_point[:2]
+    clockwise = state.interpolation == gf.GerberFormat.INTERP_MODE_CW
+    single = state.quadrant_mode == gf.GerberFormat.QUADMODE_SINGLE
+    return resolve([x0], [y0], [x1], [y1], [i], [j], clockwise, single)
+
+
+def is_arc(state) -> bool:
+    return state.interpolation in (
+        gf.GerberFormat.INTERP_MODE_CW,
+        gf.GerberFormat.INTERP_MODE_CCW,
+    ) and isinstance(state.point[0], tuple)
+
+
+def bounds(arcs: Arcs) -> np.ndarray:
+    """Exact bounding boxes (xmin, ymin, xmax, ymax) of the arcs"""
+    xs = [arcs.x0, arcs.x1]
+    ys = [arcs.y0, arcs.y1]
+    r = np.maximum(arcs.radius, arcs.end_radius)
+    # An axis extreme is on the arc when its angle is within the sweep
+    for quarter in range(4):
+        angle = quarter * math.pi / 2
+        ahead = np.mod(angle - arcs.start, TAU)
+        behind = np.mod(arcs.start - angle, TAU)
+        inside = np.where(arcs.sweep >= 0, ahead <= arcs.sweep, behind <= -arcs.sweep)
+        x = np.where(inside, arcs.cx + r * round(math.cos(angle)), np.nan)
+        y = np.where(inside, arcs.cy + r * round(math.sin(angle)), np.nan)
+        xs.append(x)
+        ys.append(y)
+    xs, ys = np.stack(xs), np.stack(ys)
+    return np.column_stack(
+        [np.nanmin(xs, 0), np.nanmin(ys, 0), np.nanmax(xs, 0), np.nanmax(ys, 0)]
+    )
+
+
+def segment_counts(arcs: Arcs, tolerance: float) -> np.ndarray:
+    """Chords per arc so none deviates more than tolerance from it"""
+    r = np.maximum(arcs.radius, arcs.end_radius)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        step = 2 * np.arccos(np.clip(1 - tolerance / r, -1, 1))
+    step = np.where(r > tolerance, step, math.pi / 2)
+    counts = np.ceil(np.abs(arcs.sweep) / step)
+    return np.clip(counts, 1, geometry_lib.MAX_SEGMENTS).astype(np.int64)
+
+
+def flatten(arcs: Arcs, tolerance: float) -> Polylines:
+    """
+    Polylines through every arc, ends included, with chords at most tolerance
+    from the curve. The radius moves linearly from the start to the end radius
+    so both ends are kept exactly.
+    """
+    counts = segment_counts(arcs, tolerance)
+    sizes = counts + 1
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    owner = np.repeat(np.arange(len(counts)), sizes)
+    t = (np.arange(offsets[-1]) - offsets[:-1][owner]) / counts[owner]
+    r0, r1 = arcs.radius, arcs.end_radius
+    radius = r0[owner] + t * (r1 - r0)[owner]
+    angle = arcs.start[owner] + t * arcs.sweep[owner]
+    vertices = np.column_stack(
+        [
+            arcs.cx[owner] + radius * np.cos(angle),
+            arcs.cy[owner] + radius * np.sin(angle),
+        ]
+    )
+    vertices[offsets[:-1]] = np.column_stack([arcs.x0, arcs.y0])
+    vertices[offsets[1:] - 1] = np.column_stack([arcs.x1, arcs.y1])
+    return Polylines(vertices, offsets)
+
+
+def path_points(store: store_lib.OperationStore, tolerance: float) -> Polylines:
+    """
+    The points every operation of a store adds to a path: the end point, after
+    the flattened inside of the arc for circular draws
+    """
+    indices, arcs = store_arcs(store)
+    counts = np.ones(len(store), dtype=np.int64)
+    lines = flatten(arcs, tolerance)
+    counts[indices] = np.diff(lines.offsets) - 1
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    vertices = np.empty((offsets[-1], 2))
+    vertices[offsets[1:] - 1] = np.column_stack([store.x, store.y])
+    if len(indices):
+        # Arc points after the start, which is the previous operation's end
+        keep = np.ones(len(lines.vertices), dtype=bool)
+        keep[lines.offsets[:-1]] = False
+        sizes = counts[indices]
+        owner = np.repeat(np.arange(len(indices)), sizes)
+        steps = np.arange(len(owner)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        vertices[offsets[indices][owner] + steps] = lines.vertices[keep]
+    return Polylines(vertices, offsets)
@@ -0,0 +1,441 @@
+import collections
+import math
+from typing import Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+import pygerber.drill_layer as drl
+import pygerber.geometry as geometry_lib
+import pygerber.gerber_layer as gl
+import pygerber.renderers.raster as raster
+
+SNAP = 1e-9  # vertex grid step at most, relative to the extent of the shapes
+OFFSET = 64  # grid steps from an edge to the points classifying its sides
+MAX_CELLS = 4096  # bucket cells of an edge before it is tested against all edges
+PAIR_BATCH = 1 << 21  # edge pairs and point edge pairs tested at once
+
+
+class _Edges(NamedTuple):
+    """Edges from (x0, y0) to (x1, y1) of the rings of polygon owner"""
+
+    x0: np.ndarray
+    y0: np.ndarray
+    x1: np.ndarray
+    y1: np.ndarray
+    owner: np.ndarray
+
+    def take(self, rows) -> "_Edges":
+        return _Edges(*(column[rows] for column in self))
+
+
+def _edges(polygons: geometry_lib.Polygons) -> _Edges:
+    start, end = polygons.edges()
+    x, y = polygons.vertices[:, 0], polygons.vertices[:, 1]
+    owner = np.repeat(polygons.ring_polygons, polygons.ring_sizes)
+    edges = _Edges(x[start], y[start], x[end], y[end], owner)
+    return edges.take((edges.x0 != edges.x1) | (edges.y0 != edges.y1))
+
+
+def _steps(sizes) -> np.ndarray:
+    """0, 1, ... sizes[k] - 1 for every k, concatenated"""
+    return np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+
+def _batches(sizes, limit=PAIR_BATCH):
+    """Slices of consecutive items whose sizes add up to about limit"""
+    ends = np.cumsum(sizes)
+    start = 0
+    while start < len(sizes):
+        base = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, base + limit, "right"))
+        stop = max(stop, start + 1)
+        yield slice(start, stop)
+        start = stop
+
+
+def _matches(keys, queries) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs (query, position) of every position of sorted keys equal to a query"""
+    low = np.searchsorted(keys, queries, "left")
+    sizes = np.searchsorted(keys, queries, "right") - low
+    query = np.repeat(np.arange(len(queries)), sizes)
+    return query, np.repeat(low, sizes) + _steps(sizes)
+
+
+def _boxes(edges: _Edges, owners: int) -> np.ndarray:
+    """Bounding box (xmin, ymin, xmax, ymax) of the edges of every owner"""
+    boxes = np.empty((owners, 4))
+    boxes[:, :2], boxes[:, 2:] = np.inf, -np.inf
+    for column, reduce, ends in (
+        (0, np.minimum, (edges.x0, edges.x1)),
+        (1, np.minimum, (edges.y0, edges.y1)),
+        (2, np.maximum, (edges.x0, edges.x1)),
+        (3, np.maximum, (edges.y0, edges.y1)),
+    ):
+        reduce.at(boxes[:, column], edges.owner, reduce(*ends))
+    return boxes
+
+
+def _candidates(px, py, boxes, cell) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (point, owner) of the points in the box of an owner, with the boxes
+    bucketed in grid cells. Boxes over more than MAX_CELLS cells are checked
+    against every point.
+    """
+    present = np.nonzero(boxes[:, 0] <= boxes[:, 2])[0]
+    ox, oy = boxes[present, 0].min(), boxes[present, 1].min()
+    first = np.floor((boxes[present, :2] - (ox, oy)) / cell).astype(np.int64)
+    last = np.floor((boxes[present, 2:] - (ox, oy)) / cell).astype(np.int64)
+    nx, ny = (last - first + 1).T
+    big = nx * ny > MAX_CELLS
+    small = np.nonzero(~big)[0]
+    rows = int(last[:, 1].max()) + 1
+    columns = int(last[:, 0].max()) + 1
+
+    sizes = (nx * ny)[small]
+    record = np.repeat(small, sizes)
+    step = _steps(sizes)
+    cells = (first[record, 0] + step // ny[record]) * rows
+    cells += first[record, 1] + step % ny[record]
+    order = np.argsort(cells, kind="stable")
+    record, cells = present[record[order]], cells[order]
+
+    cx = np.floor((px - ox) / cell).astype(np.int64)
+    cy = np.floor((py - oy) / cell).astype(np.int64)
+    outside = (cx < 0) | (cy < 0) | (cx >= columns) | (cy >= rows)
+    point, position = _matches(cells, np.where(outside, -1, cx * rows + cy))
+    owner = record[position]
+
+    large = present[big]
+    point = np.concatenate([point, np.repeat(np.arange(len(px)), len(large))])
+    owner = np.concatenate([owner, np.tile(large, len(px))])
+    within = (boxes[owner, 0] <= px[point]) & (px[point] <= boxes[owner, 2])
+    within &= (boxes[owner, 1] <= py[point]) & (py[point] <= boxes[owner, 3])
+    return point[within], owner[within]
+
+
+def _inside(px, py, edges: _Edges, band) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (point, owner) of the points inside the rings of an owner, even-odd:
+    a scanline from the point towards +x crosses its edges an odd number of
+    times. Only owners whose box holds the point are tested, against their
+    edges in the point's horizontal band of the given height.
+    """
+    if not len(edges.x0) or not len(px):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    x0, y0, x1, y1, owner = edges
+    boxes = _boxes(edges, int(owner.max()) + 1)
+    present = boxes[boxes[:, 0] <= boxes[:, 2]]
+    sides = np.maximum(present[:, 2] - present[:, 0], present[:, 3] - present[:, 1])
+    extent = max(np.ptp(present[:, [0, 2]]), np.ptp(present[:, [1, 3]]))
+    cell = max(float(np.median(sides)), extent / 1024, 1e-12)
+    point, candidate = _candidates(px, py, boxes, cell)
+
+    ylo, yhi = np.minimum(y0, y1), np.maximum(y0, y1)
+    sloped = np.nonzero(ylo != yhi)[0]
+    origin = ylo.min()
+    first = np.floor((ylo[sloped] - origin) / band).astype(np.int64)
+    last = np.floor((yhi[sloped] - origin) / band).astype(np.int64)
+    bands = int(last.max(initial=0)) + 2
+    sizes = last - first + 1
+    edge = np.repeat(sloped, sizes)
+    keys = owner[edge] * bands + np.repeat(first, sizes) + _steps(sizes)
+    order = np.argsort(keys, kind="stable")
+    edge, keys = edge[order], keys[order]
+
+    point_band = np.floor((py[point] - origin) / band).astype(np.int64)
+    point_band = np.clip(point_band, -1, bands - 1)
+    queries = np.where(point_band < 0, -1, candidate * bands + point_band)
+    low = np.searchsorted(keys, queries, "left")
+    counts = np.searchsorted(keys, queries, "right") - low
+    crossings = np.zeros(len(point), dtype=np.int64)
+    for pairs in _batches(counts):
+        sizes = counts[pairs]
+        pair = np.repeat(np.arange(len(point))[pairs], sizes)
+        tested = edge[np.repeat(low[pairs], sizes) + _steps(sizes)]
+        ex0, ey0, ey1 = x0[tested], y0[tested], y1[tested]
+        y = py[point[pair]]
+        crossing = (ey0 > y) != (ey1 > y)
+        x = ex0 + (y - ey0) * (x1[tested] - ex0) / np.where(crossing, ey1 - ey0, 1)
+        crossing &= x > px[point[pair]]
+        crossings += np.bincount(pair[crossing], minlength=len(point))
+    odd = crossings % 2 == 1
+    return point[odd], candidate[odd]
+
+
+def _filled(px, py, edges: _Edges, rank, dark, band) -> np.ndarray:
+    """
+    Whether every point ends up dark: the last batch drawing a polygon over
+    it, by rank, is dark
+    """
+    point, owner = _inside(px, py, edges, band)
+    best = np.full(len(px), -1, dtype=np.int64)
+    np.maximum.at(best, point, rank[owner])
+    return (best >= 0) & dark[np.maximum(best, 0)]
+
+
+def _candidate_pairs(edges: _Edges, cell: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs (i, j), i < j, of edges whose boxes share a grid cell. Edges covering
+    more than MAX_CELLS cells are paired with every edge instead.
+    """
+    x0, y0, x1, y1, _ = edges
+    count = len(x0)
+    xlo, xhi = np.minimum(x0, x1), np.maximum(x0, x1)
+    ylo, yhi = np.minimum(y0, y1), np.maximum(y0, y1)
+    ox, oy = xlo.min(), ylo.min()
+    cx0 = np.floor((xlo - ox) / cell).astype(np.int64)
+    cy0 = np.floor((ylo - oy) / cell).astype(np.int64)
+    nx = np.floor((xhi - ox) / cell).astype(np.int64) - cx0 + 1
+    ny = np.floor((yhi - oy) / cell).astype(np.int64) - cy0 + 1
+    big = nx * ny > MAX_CELLS
+    small = np.nonzero(~big)[0]
+
+    sizes = (nx * ny)[small]
+    edge = np.repeat(small, sizes)
+    step = _steps(sizes)
+    rows = int((cy0 + ny).max()) + 1
+    cells = (cx0[edge] + step // ny[edge]) * rows + cy0[edge] + step % ny[edge]
+    order = np.argsort(cells, kind="stable")
+    edge, cells = edge[order], cells[order]
+    # Every record is paired with the records after it in its cell
+    end = np.searchsorted(cells, cells, "right")
+    partners = end - np.arange(len(cells)) - 1
+    first = np.repeat(edge, partners)
+    second = edge[np.repeat(np.arange(len(cells)) + 1, partners) + _steps(partners)]
+
+    large = np.nonzero(big)[0]
+    first = np.concatenate([first, np.repeat(large, count)])
+    second = np.concatenate([second, np.tile(np.arange(count), len(large))])
+    i, j = np.minimum(first, second), np.maximum(first, second)
+    keys = np.unique(i[i != j] * count + j[i != j])
+    i, j = keys // count, keys % count
+    overlap = (xlo[i] <= xhi[j]) & (xlo[j] <= xhi[i])
+    overlap &= (ylo[i] <= yhi[j]) & (ylo[j] <= yhi[i])
+    return i[overlap], j[overlap]
+
+
+def _splits(edges: _Edges, cell: float, distance: float):
+    """
+    (edge, t) of the points where edges cross or touch, at p0 + t (p1 - p0) on
+    the edge. Collinear overlapping edges split each other at their ends.
+    """
+    x0, y0, x1, y1, _ = edges
+    i, j = _candidate_pairs(edges, cell)
+    found_edges, found_t = [], []
+    for rows in _batches(np.ones(len(i), dtype=np.int64)):
+        a, b = i[rows], j[rows]
+        px, py, rx, ry = x0[a], y0[a], x1[a] - x0[a], y1[a] - y0[a]
+        qx, qy, sx, sy = x0[b], y0[b], x1[b] - x0[b], y1[b] - y0[b]
+        wx, wy = qx - px, qy - py
+        r2, s2 = rx * rx + ry * ry, sx * sx + sy * sy
+        d = rx * sy - ry * sx
+        parallel = np.abs(d) <= 1e-12 * np.sqrt(r2 * s2)
+        safe = np.where(parallel, 1.0, d)
+        t = (wx * sy - wy * sx) / safe
+        u = (wx * ry - wy * rx) / safe
+        slack = 1e-9
+        crossing = ~parallel & (t >= -slack) & (t <= 1 + slack)
+        crossing &= (u >= -slack) & (u <= 1 + slack)
+        found_edges += [a[crossing], b[crossing]]
+        found_t += [t[crossing], u[crossing]]
+
+        # Collinear: the ends of each edge projected on the other
+        collinear = parallel & (np.abs(wx * ry - wy * rx) <= distance * np.sqrt(r2))
+        a, b = a[collinear], b[collinear]
+        for p, q in ((a, b), (b, a)):
+            rx, ry = x1[p] - x0[p], y1[p] - y0[p]
+            r2 = rx * rx + ry * ry
+            for ex, ey in ((x0[q], y0[q]), (x1[q], y1[q])):
+                found_edges.append(p)
+                found_t.append(((ex - x0[p]) * rx + (ey - y0[p]) * ry) / r2)
+    edge = np.concatenate(found_edges + [np.empty(0, np.int64)])
+    t = np.concatenate(found_t + [np.empty(0)])
+    inner = (t > 0) & (t < 1)
+    return edge[inner], t[inner]
+
+
+def _fragments(edges: _Edges, cell, grid, origin):
+    """
+    Edges split where they meet other edges, as pairs of vertex ids of the
+    snapped vertices, each undirected fragment once, and those vertices
+    """
+    count = len(edges.x0)
+    edge, t = _splits(edges, cell, grid)
+    edge = np.concatenate([np.arange(count), np.arange(count), edge])
+    t = np.concatenate([np.zeros(count), np.ones(count), t])
+    order = np.lexsort((t, edge))
+    edge, t = edge[order], t[order]
+    x0, y0, x1, y1, _ = edges
+    x = x0[edge] + t * (x1[edge] - x0[edge])
+    y = y0[edge] + t * (y1[edge] - y0[edge])
+    snapped = np.column_stack([x - origin[0], y - origin[1]]) / grid
+    snapped = np.round(snapped).astype(np.int64)
+    rows = int(snapped[:, 1].max()) + 1
+    keys, ids = np.unique(snapped[:, 0] * rows + snapped[:, 1], return_inverse=True)
+    vertices = np.column_stack([keys // rows, keys % rows])
+    ids = ids.reshape(-1)
+
+    same = edge[1:] == edge[:-1]
+    a, b = ids[:-1][same], ids[1:][same]
+    a, b = a[a != b], b[a != b]
+    keys = np.unique(np.minimum(a, b) * len(vertices) + np.maximum(a, b))
+    return keys // len(vertices), keys % len(vertices), vertices
+
+
+def _rings(a, b, vertices) -> List[List[int]]:
+    """
+    Directed fragments a -> b joined into closed rings of vertex ids. Where
+    several fragments leave a vertex, the one turning furthest left is taken.
+    """
+    leaving = collections.defaultdict(list)
+    for index, start in enumerate(a.tolist()):
+        leaving[start].append(index)
+    used = np.zeros(len(a), dtype=bool)
+    xs, ys = vertices[:, 0].tolist(), vertices[:, 1].tolist()
+    starts, ends = a.tolist(), b.tolist()
+
+    def turn(previous, current, candidate):
+        end = ends[candidate]
+        ux, uy = xs[current] - xs[previous], ys[current] - ys[previous]
+        vx, vy = xs[end] - xs[current], ys[end] - ys[current]
+        return math.atan2(ux * vy - uy * vx, ux * vx + uy * vy)
+
+    rings = []
+    for first in range(len(a)):
+        if used[first]:
+            continue
+        ring, fragment = [], first
+        while not used[fragment]:
+            used[fragment] = True
+            ring.append(starts[fragment])
+            current = ends[fragment]
+            options = [k for k in leaving[current] if not used[k]]
+            if not options:
+                break
+            if len(options) > 1:
+                previous = starts[fragment]
+                options.sort(key=lambda k: -turn(previous, current, k))
+            fragment = options[0]
+        if len(ring) > 2:
+            rings.append(ring)
+    return rings
+
+
+def _simplified(ring: np.ndarray) -> np.ndarray:
+    """A ring of snapped vertices without its collinear vertices"""
+    while len(ring) > 2:
+        before, after = np.roll(ring, 1, axis=0), np.roll(ring, -1, axis=0)
+        u, v = ring - before, after - ring
+        straight = u[:, 0] * v[:, 1] == u[:, 1] * v[:, 0]
+        if not straight.any():
+            break
+        # Drop every other straight vertex so neighbours stay to compare
+        drop = straight & ~np.roll(straight, 1)
+        if not drop.any():
+            drop[np.argmax(straight)] = True
+        ring = ring[~drop]
+    return ring
+
+
+def resolve(batches: Iterable[Tuple[bool, geometry_lib.Polygons]]):
+    """
+    Applies polarity batches in draw order: the polygons of a dark batch are
+    added to the result and those of a clear batch are cut out of it. Returns
+    the result as non overlapping polygons, outlines counterclockwise and holes
+    clockwise.
+
+    Edges of all batches are split where they cross, finding crossings among
+    edges bucketed in grid cells, and every split edge is kept when the points
+    just beside it end up dark on one side only. Those points are classified
+    with scanline crossing counts over edges bucketed in horizontal bands.
+    """
+    polygons, ranks, dark = [], [], []
+    for rank, (polarity, batch) in enumerate(batches):
+        polygons.append(batch)
+        ranks.append(np.full(batch.polygon_count, rank, dtype=np.int64))
+        dark.append(bool(polarity))
+    polygons = geometry_lib.concatenate(polygons)
+    edges = _edges(polygons)
+    if not len(edges.x0):
+        return geometry_lib.empty()
+    rank = np.concatenate(ranks)
+    dark = np.array(dark, dtype=bool)
+
+    xs, ys = np.concatenate([edges.x0, edges.x1]), np.concatenate([edges.y0, edges.y1])
+    extent = max(np.ptp(xs), np.ptp(ys), 1e-12)
+    # A power of two step keeps round coordinates exact
+    grid = 2.0 ** math.floor(math.log2(SNAP * extent))
+    origin = np.floor(xs.min() / grid) * grid, np.floor(ys.min() / grid) * grid
+    lengths = np.hypot(edges.x1 - edges.x0, edges.y1 - edges.y0)
+    cell = max(2 * float(np.median(lengths)), extent / 2048)
+    band = max(float(np.median(np.abs(edges.y1 - edges.y0))), extent / 4096)
+
+    a, b, vertices = _fragments(edges, cell, grid, origin)
+    points = vertices * grid + origin
+    start, end = points[a], points[b]
+    direction = end - start
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    offset = np.minimum(length / 4, OFFSET * grid)
+    normal = np.column_stack([-direction[:, 1], direction[:, 0]]) / length[:, None]
+    middle = (start + end) / 2
+    beside = np.concatenate(
+        [middle + normal * offset[:, None], middle - normal * offset[:, None]]
+    )
+    filled = _filled(beside[:, 0], beside[:, 1], edges, rank, dark, band)
+    left, right = filled[: len(a)], filled[len(a) :]
+    # Kept fragments run with the dark side on their left
+    keep = left != right
+    a, b = np.where(right, b, a)[keep], np.where(right, a, b)[keep]
+
+    rings = [_simplified(vertices[ring]) for ring in _rings(a, b, vertices)]
+    rings = [ring * grid + origin for ring in rings if len(ring) > 2]
+    if not rings:
+        return geometry_lib.empty()
+    found = geometry_lib.from_rings(rings)
+    areas = found.ring_areas()
+    outlines, holes = np.nonzero(areas > 0)[0], np.nonzero(areas < 0)[0]
+
+    # Every hole belongs to the smallest outline around a point just inside it
+    ring_edges = _edges(found)
+    first = found.ring_offsets[holes]
+    p, q = found.vertices[first], found.vertices[first + 1]
+    direction = q - p
+    length = np.hypot(direction[:, 0], direction[:, 1])[:, None]
+    normal = np.column_stack([-direction[:, 1], direction[:, 0]]) / length
+    probe = (p + q) / 2 + normal * np.minimum(length / 4, OFFSET * grid)
+    outline_edges = ring_edges.take(np.isin(ring_edges.owner, outlines))
+    point, owner = _inside(probe[:, 0], probe[:, 1], outline_edges, band)
+    parent = np.full(len(found.ring_polygons), -1, dtype=np.int64)
+    parent[outlines] = outlines
+    size = np.abs(areas)
+    smallest = np.full(len(holes), np.inf)
+    for hole, outline in zip(point.tolist(), owner.tolist()):
+        if size[outline] < smallest[hole]:
+            smallest[hole], parent[holes[hole]] = size[outline], outline
+
+    # Outlines followed by their holes
+    kept = np.nonzero(parent >= 0)[0]
+    order = kept[np.lexsort((areas[kept] < 0, parent[kept]))]
+    _, polygon = np.unique(parent[order], return_inverse=True)
+    return geometry_lib.from_rings([rings[k] for k in order], polygon.reshape(-1))
+
+
+def union(*polygons: geometry_lib.Polygons) -> geometry_lib.Polygons:
+    return resolve((True, p) for p in polygons)
+
+
+def difference(
+    polygons: geometry_lib.Polygons, cut: geometry_lib.Polygons
+) -> geometry_lib.Polygons:
+    return resolve([(True, polygons), (False, cut)])
+
+
+def layer_polygons(
+    layer: gl.GerberLayer | drl.DrillLayer, tolerance=geometry_lib.DEFAULT_TOLERANCE
+) -> geometry_lib.Polygons:
+    """
+    The area a layer leaves dark: flashes, strokes and regions, with arcs split
+    into chords at most tolerance from the curve, and LPD/LPC polarity applied
+    as union and difference in draw order
+    """
+    return resolve(raster.polarity_batches(layer, tolerance))
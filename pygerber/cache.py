@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import tempfile
+
+import pygerber
+
+CACHE_FORMAT = 7  # bump when the pickled layer layout changes
+_SUFFIX = ".layer"
+
+
+class LayerCache:
+    """
+    On-disk cache of parsed layers keyed by a hash of the file bytes, the layer
+    type and options, and the library version. Entries are pickled layers; a warm
+    load memory-maps the entry and unpickles it instead of parsing the file.
+    The least recently used entries are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, path, layer_type, **layer_kwargs) -> str:
+        digest = hashlib.blake2b(digest_size=20)
+        header = (pygerber.__version__, CACHE_FORMAT, layer_type.__qualname__)
+        digest.update(repr((header, sorted(layer_kwargs.items()))).encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def read(self, path, layer_type, **layer_kwargs):
+        """Returns the parsed layer for path, parsing and storing it on a miss"""
+        key = self.key(path, layer_type, **layer_kwargs)
+        entry = os.path.join(self.directory, key + _SUFFIX)
+        layer = self._load(entry)
+        if layer is not None:
+            self.hits += 1
+            return layer
+
+        self.misses += 1
+        layer = layer_type(**layer_kwargs)
+        layer.read(path)
+        self._store(entry, layer)
+        self.evict()
+        return layer
+
+    def evict(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(_SUFFIX):
+                stat = os.stat(os.path.join(self.directory, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logging.info(f"Evicting cached layer: {filename}")
+            os.remove(os.path.join(self.directory, filename))
+            total -= size
+
+    def clear(self):
+        for filename in os.listdir(self.directory):
+            if filename.endswith(_SUFFIX):
+                os.remove(os.path.join(self.directory, filename))
+
+    def _load(self, entry):
+        try:
+            with open(entry, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    layer = pickle.loads(data)
+        except (FileNotFoundError, ValueError):
+            return None  # ValueError: empty file can't be mapped
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            logging.warning(f"Discarding unreadable cache entry: {entry}")
+            os.remove(entry)
+            return None
+        os.utime(entry)  # mark as recently used
+        return layer
+
+    def _store(self, entry, layer):
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(layer, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,218 @@
+import concurrent.futures
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.renderers.raster as raster
+import pygerber.spatial as spatial
+
+CELL_SIZE = 16  # pixels per side of the cells changes are grouped by
+
+
+class ChangedRegion(NamedTuple):
+    """
+    Box (xmin, ymin, xmax, ymax) in millimeters around connected changed pixels.
+    added pixels are dark only in the new layer, removed ones only in the old.
+    """
+
+    xmin: float
+    ymin: float
+    xmax: float
+    ymax: float
+    added: int
+    removed: int
+    area: float  # mm² of changed pixels
+
+
+class LayerDiff(NamedTuple):
+    regions: List[ChangedRegion]  # largest first
+    added: int
+    removed: int
+    pixel_area: float  # mm² of one pixel
+    tiles: int
+    skipped_tiles: int  # tiles not rendered, their contents being the same
+
+    @property
+    def changed_area(self) -> float:
+        return (self.added + self.removed) * self.pixel_area
+
+
+class _Cells(NamedTuple):
+    """Changed cells of a tile: cell position, pixel counts and pixel extents"""
+
+    row: np.ndarray
+    col: np.ndarray
+    added: np.ndarray
+    removed: np.ndarray
+    top: np.ndarray
+    bottom: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+
+
+# Renderers of the layers compared, set in every worker process
+_renderers: Tuple[raster.RasterLayerRenderer, ...] = ()
+
+
+def _set_renderers(*renderers):
+    global _renderers
+    _renderers = renderers
+
+
+def _tile_cells(row, col, height, width) -> Optional[_Cells]:
+    """Renders a tile of both layers and groups their differences in cells"""
+    old, new = (r.render_tile(row, col, height, width) != 0 for r in _renderers)
+    added, removed = new & ~old, old & ~new
+    changed = added | removed
+    if not changed.any():
+        return None
+    # Pad to whole cells, then fold each cell into its own axes
+    rows, cols = -(-height // CELL_SIZE), -(-width // CELL_SIZE)
+    shape = rows * CELL_SIZE, cols * CELL_SIZE
+
+    def cells(mask):
+        padded = np.zeros(shape, dtype=bool)
+        padded[:height, :width] = mask
+        return padded.reshape(rows, CELL_SIZE, cols, CELL_SIZE)
+
+    changed = cells(changed)
+    counts = changed.sum(axis=(1, 3))
+    cell_row, cell_col = np.nonzero(counts)
+    # First and last changed pixel row and column inside every cell
+    in_rows = changed.any(axis=3)[cell_row, :, cell_col]
+    in_cols = changed.any(axis=1)[cell_row, cell_col]
+    top = np.argmax(in_rows, axis=1)
+    bottom = CELL_SIZE - 1 - np.argmax(in_rows[:, ::-1], axis=1)
+    left = np.argmax(in_cols, axis=1)
+    right = CELL_SIZE - 1 - np.argmax(in_cols[:, ::-1], axis=1)
+    first_row, first_col = row + cell_row * CELL_SIZE, col + cell_col * CELL_SIZE
+    return _Cells(
+        first_row // CELL_SIZE,
+        first_col // CELL_SIZE,
+        cells(added).sum(axis=(1, 3))[cell_row, cell_col],
+        cells(removed).sum(axis=(1, 3))[cell_row, cell_col],
+        first_row + top,
+        first_row + bottom,
+        first_col + left,
+        first_col + right,
+    )
+
+
+def _components(rows, cols) -> np.ndarray:
+    """
+    Label of every cell, cells touching by a side or corner sharing one. Cells
+    of tiles not aligned to CELL_SIZE may share a position; they are joined.
+    """
+    parent = list(range(len(rows)))
+    position = {}
+
+    def root(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for k, (r, c) in enumerate(zip(rows.tolist(), cols.tolist())):
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                other = position.get((r + dr, c + dc))
+                if other is not None:
+                    parent[root(other)] = root(k)
+        position.setdefault((r, c), k)
+    return np.array([root(k) for k in range(len(rows))], dtype=np.int64)
+
+
+def compare_layers(
+    old: gl.GerberLayer | drl.DrillLayer,
+    new: gl.GerberLayer | drl.DrillLayer,
+    dpi=1000,
+    tile_size=raster.TILE_SIZE,
+    parallel=None,
+    tolerance=0.25,
+) -> LayerDiff:
+    """
+    Rasterizes both layers over their common extents and XORs them tile by
+    tile. Tiles where both layers' spatial indexes hold the same primitives are
+    skipped; the others are rendered in a pool of parallel worker processes,
+    one per CPU by default. Changed pixels within a cell of each other are
+    reported together as one ChangedRegion.
+    """
+    renderers = [
+        raster.RasterLayerRenderer(dpi, tolerance=tolerance).add_layer(layer)
+        for layer in (old, new)
+    ]
+    boxes = [r.bounds for r in renderers if r.bounds is not None]
+    bounds = spatial.total_bounds(boxes) if boxes else None
+    for renderer in renderers:
+        renderer.bounds = bounds
+    scale = renderers[0].pixels_per_mm
+    height, width = renderers[0].shape
+
+    tiles, skipped = [], 0
+    for row in range(0, height, tile_size):
+        for col in range(0, width, tile_size):
+            tile = row, col, min(tile_size, height - row), min(tile_size, width - col)
+            old_contents, new_contents = (r.tile_contents(*tile) for r in renderers)
+            if (
+                old_contents is not None
+                and new_contents is not None
+                and len(old_contents) == len(new_contents)
+                and all(
+                    np.array_equal(a, b, equal_nan=True)
+                    for a, b in zip(old_contents, new_contents)
+                )
+            ):
+                skipped += 1
+            else:
+                tiles.append(tile)
+
+    parallel = os.cpu_count() if parallel is None else parallel
+    if parallel <= 1 or len(tiles) <= 1:
+        _set_renderers(*renderers)
+        results = [_tile_cells(*tile) for tile in tiles]
+        _set_renderers()
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(parallel, len(tiles)),
+            initializer=_set_renderers,
+            initargs=tuple(renderers),
+        ) as pool:
+            results = list(pool.map(_tile_cells, *zip(*tiles)))
+
+    found = [cells for cells in results if cells is not None]
+    if found:
+        cells = _Cells(*(np.concatenate(column) for column in zip(*found)))
+    else:
+        cells = _Cells(*(np.zeros(0, dtype=np.int64) for _ in _Cells._fields))
+    labels = _components(cells.row, cells.col)
+
+    regions = []
+    xmin, _, _, ymax = bounds or (0.0, 0.0, 0.0, 0.0)
+    pixel_area = 1 / scale**2
+    for label in np.unique(labels):
+        member = labels == label
+        added = int(cells.added[member].sum())
+        removed = int(cells.removed[member].sum())
+        regions.append(
+            ChangedRegion(
+                float(xmin + cells.left[member].min() / scale),
+                float(ymax - (cells.bottom[member].max() + 1) / scale),
+                float(xmin + (cells.right[member].max() + 1) / scale),
+                float(ymax - cells.top[member].min() / scale),
+                added,
+                removed,
+                (added + removed) * pixel_area,
+            )
+        )
+    regions.sort(key=lambda region: -region.area)
+    return LayerDiff(
+        regions,
+        int(cells.added.sum()),
+        int(cells.removed.sum()),
+        pixel_area,
+        len(tiles) + skipped,
+        skipped,
+    )
@@ -1,8 +1,18 @@
+import contextlib
 import dataclasses
 import logging
+import os
 import re
-from typing import List, Tuple
+from collections.abc import Sequence
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
+import numpy as np
+
+import pygerber.arcs as arcs_lib
+import pygerber.spatial as spatial
+import pygerber.tokenizer as tokenizer
+import pygerber.toolpath as toolpath_lib
+import pygerber.trace as trace_lib
 from pygerber.standards.nc_drill import NCDrillFormat
 
 
@@ -40,6 +50,10 @@ class RoutOperation:
     tool: int
     type: NCDrillFormat
     point: DrillHit
+    radius: Optional[float] = None  # A word of circular routs
+
+    def arc(self) -> bool:
+        return bool(self.radius) and self.type in CIRCULAR_ROUTS
 
 
 @dataclasses.dataclass(frozen=True)
@@ -48,68 +62,483 @@ class ToolOperation:
 
 
 OPERATION_TYPES = [DrillOperation, RoutOperation, ToolOperation]
+CIRCULAR_ROUTS = [
+    NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT,
+    NCDrillFormat.CIRCULAR_COUNTERCLOCKWISE_ROUT,
+]
 
 
-class DrillLayer:
+WRITE_BATCH = 1 << 16  # operations formatted at a time
+
+# Operation codes of a DrillStore: hits, tool up and down, then rout types
+HIT_CODE, TOOL_UP_CODE, TOOL_DOWN_CODE = 0, 1, 2
+ROUT_TYPES = list(NCDrillFormat)
+ROUT_CODE = 3  # code of ROUT_TYPES[0]
+NO_TOOL = -1
+
+
+class DrillStore(Sequence):
+    """
+    Compact columnar storage for drill operations: an int8 code per operation
+    (hit, tool up or down, or the rout type), the tool number and x/y
+    coordinates in arrays, and the radii of the few circular routs in a dict.
+    Indexing and iterating build the operation dataclasses on the fly so the
+    store can stand in for the list in DrillLayer.operations; comparing two
+    stores is array-wise.
+    """
+
+    _DTYPES = {"code": np.int8, "tool": np.int16, "x": np.float64, "y": np.float64}
+
     def __init__(self):
+        self._size = 0
+        self._columns = {n: np.empty(0, dtype) for n, dtype in self._DTYPES.items()}
+        self.radius: Dict[int, float] = {}
+
+    def __len__(self):
+        return self._size
+
+    def __getattr__(self, name):
+        # Column views, e.g. store.x or store.code
+        columns = self.__dict__.get("_columns", {})
+        if name in columns:
+            return columns[name][: self._size]
+        raise AttributeError(name)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Operation index out of range")
+        columns = self._columns
+        return self._build(
+            index,
+            int(columns["code"][index]),
+            int(columns["tool"][index]),
+            float(columns["x"][index]),
+            float(columns["y"][index]),
+        )
+
+    def __iter__(self):
+        rows = zip(
+            range(self._size),
+            self.code.tolist(),
+            self.tool.tolist(),
+            self.x.tolist(),
+            self.y.tolist(),
+        )
+        for row in rows:
+            yield self._build(*row)
+
+    def __eq__(self, other):
+        if isinstance(other, DrillStore):
+            return len(self) == len(other) and not len(self.diff(other))
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_columns"] = {
+            n: c[: self._size].copy() for n, c in self._columns.items()
+        }
+        return state
+
+    def diff(self, other: "DrillStore") -> np.ndarray:
+        """Indices of the operations that differ, including those only one has"""
+        size = min(len(self), len(other))
+        differ = np.zeros(size, dtype=bool)
+        for name in self._columns:
+            mine, theirs = getattr(self, name)[:size], getattr(other, name)[:size]
+            differ |= ~((mine == theirs) | ((mine != mine) & (theirs != theirs)))
+        for row in set(self.radius) | set(other.radius):
+            if row < size and self.radius.get(row) != other.radius.get(row):
+                differ[row] = True
+        extra = np.arange(size, max(len(self), len(other)))
+        return np.concatenate([np.nonzero(differ)[0], extra])
+
+    def append(self, op: "OPERATION_TYPES"):
+        if isinstance(op, DrillOperation):
+            self.append_hit(op.tool, op.point.x, op.point.y)
+        elif isinstance(op, RoutOperation):
+            code = ROUT_CODE + ROUT_TYPES.index(op.type)
+            self._append(code, op.tool, op.point.x, op.point.y)
+            if op.radius is not None:
+                self.radius[self._size - 1] = op.radius
+        elif isinstance(op, ToolOperation):
+            code = TOOL_DOWN_CODE if op.down else TOOL_UP_CODE
+            self._append(code, None, np.nan, np.nan)
+        else:
+            raise ValueError(f"Invalid operation: {op}")
+
+    def append_hit(self, tool: Optional[int], x: float, y: float):
+        self._append(HIT_CODE, tool, x, y)
+
+    def extend_hits(self, tool: Optional[int], x: np.ndarray, y: np.ndarray):
+        """Appends hits of one tool at the points (x[k], y[k])"""
+        start, count = self._size, len(x)
+        self._reserve(start + count)
+        rows = slice(start, start + count)
+        columns = self._columns
+        columns["code"][rows] = HIT_CODE
+        columns["tool"][rows] = NO_TOOL if tool is None else tool
+        columns["x"][rows], columns["y"][rows] = x, y
+        self._size += count
+
+    def extend(self, operations):
+        """Appends many operations, filling the columns in bulk"""
+        codes, tools, xs, ys = [], [], [], []
+        nan = float("nan")
+        for op in operations:
+            if isinstance(op, DrillOperation):
+                codes.append(HIT_CODE)
+            elif isinstance(op, RoutOperation):
+                codes.append(ROUT_CODE + ROUT_TYPES.index(op.type))
+                if op.radius is not None:
+                    self.radius[self._size + len(codes) - 1] = op.radius
+            elif isinstance(op, ToolOperation):
+                codes.append(TOOL_DOWN_CODE if op.down else TOOL_UP_CODE)
+                tools.append(NO_TOOL)
+                xs.append(nan)
+                ys.append(nan)
+                continue
+            else:
+                raise ValueError(f"Invalid operation: {op}")
+            tools.append(NO_TOOL if op.tool is None else op.tool)
+            xs.append(op.point.x)
+            ys.append(op.point.y)
+        start, count = self._size, len(codes)
+        self._reserve(start + count)
+        rows = slice(start, start + count)
+        columns = self._columns
+        columns["code"][rows], columns["tool"][rows] = codes, tools
+        columns["x"][rows], columns["y"][rows] = xs, ys
+        self._size += count
+
+    def take(self, rows) -> "DrillStore":
+        """A store of the operations at rows, in that order"""
+        rows = np.asarray(rows, dtype=np.int64)
+        store = DrillStore()
+        store._size = len(rows)
+        store._columns = {n: getattr(self, n)[rows] for n in self._columns}
+        if self.radius:
+            moved = {row: new for new, row in enumerate(rows.tolist())}
+            store.radius = {
+                moved[row]: r for row, r in self.radius.items() if row in moved
+            }
+        return store
+
+    def nbytes(self) -> int:
+        """Bytes used by the columns"""
+        return sum(column[: self._size].nbytes for column in self._columns.values())
+
+    def _reserve(self, size):
+        if size > len(self._columns["x"]):
+            capacity = max(16, 2 * self._size, size)
+            for name, column in self._columns.items():
+                grown = np.empty(capacity, column.dtype)
+                grown[: self._size] = column[: self._size]
+                self._columns[name] = grown
+
+    def _append(self, code, tool, x, y):
+        self._reserve(self._size + 1)
+        index = self._size
+        columns = self._columns
+        columns["code"][index] = code
+        columns["tool"][index] = NO_TOOL if tool is None else tool
+        columns["x"][index], columns["y"][index] = x, y
+        self._size += 1
+
+    def _build(self, index, code, tool, x, y):
+        tool = None if tool == NO_TOOL else tool
+        if code == HIT_CODE:
+            return DrillOperation(tool, DrillHit(x, y))
+        if code >= ROUT_CODE:
+            return RoutOperation(
+                tool=tool,
+                type=ROUT_TYPES[code - ROUT_CODE],
+                point=DrillHit(x, y),
+                radius=self.radius.get(index),
+            )
+        return ToolOperation(code == TOOL_DOWN_CODE)
+
+
+def _encode(values: np.ndarray) -> List[str]:
+    """DrillHit.encode of each coordinate, whole numbers without decimals"""
+    text = list(map(str, values.tolist()))
+    whole = np.nonzero(values == np.trunc(values))[0]
+    for k, value in zip(whole.tolist(), values[whole].astype(np.int64).tolist()):
+        text[k] = str(value)
+    # Most coordinates already have at most 6 decimals
+    longer = np.nonzero(np.round(values, 6) != values)[0]
+    for k in longer.tolist():
+        text[k] = str(round(float(values[k]), 6))
+    return [t.zfill(6) for t in text]
+
+
+def _format_lines(store: DrillStore) -> Iterator[str]:
+    """
+    Drill file lines of the operations, WRITE_BATCH operations at a time. A
+    tool is selected before a hit or rout using another tool than the previous
+    one, and G05 goes back to drill mode before the first hit and hits after
+    routs.
+    """
+    code, tool = store.code, store.tool
+    # Hits and routs, each with the one before it or -1
+    moves = np.nonzero((code != TOOL_UP_CODE) & (code != TOOL_DOWN_CODE))[0]
+    before = np.concatenate([[-1], moves[:-1]])
+    for start in range(0, len(store), WRITE_BATCH):
+        stop = min(start + WRITE_BATCH, len(store))
+        batch = slice(np.searchsorted(moves, start), np.searchsorted(moves, stop))
+        yield _format_batch(store, start, stop, moves[batch], before[batch])
+
+
+def _format_batch(store: DrillStore, start, stop, rows, previous) -> str:
+    code, tool = store.code, store.tool
+    new_tool = np.ones(len(rows), dtype=bool)
+    after_rout = np.ones(len(rows), dtype=bool)
+    known = previous >= 0
+    new_tool[known] = tool[rows[known]] != tool[previous[known]]
+    after_rout[known] = code[previous[known]] >= ROUT_CODE
+    drill_mode = after_rout & (code[rows] == HIT_CODE)
+
+    lines = np.full(stop - start, f"{NCDrillFormat.TOOL_UP.value}\n", dtype=object)
+    lines[code[start:stop] == TOOL_DOWN_CODE] = f"{NCDrillFormat.TOOL_DOWN.value}\n"
+    points = list(
+        map("X{}Y{}\n".format, _encode(store.x[rows]), _encode(store.y[rows]))
+    )
+    lines[rows - start] = points
+    # Routs, tool selections and drill mode only on the rows that need them
+    special = (code[rows] >= ROUT_CODE) | new_tool | drill_mode
+    names = [t.value for t in ROUT_TYPES]
+    for k in np.nonzero(special)[0].tolist():
+        row, text = int(rows[k]), points[k]
+        row_code = int(code[row])
+        if row_code >= ROUT_CODE:
+            radius = store.radius.get(row)
+            radius = f"A{radius}" if radius is not None else ""
+            text = f"{names[row_code - ROUT_CODE]}{text[:-1]}{radius}\n"
+        elif drill_mode[k]:
+            text = f"{NCDrillFormat.DRILL_MODE.value}\n{text}"
+        if new_tool[k]:
+            number = int(tool[row])
+            number = None if number == NO_TOOL else number
+            text = f"T{str(number).zfill(2)}\n{text}"
+        lines[row - start] = text
+    return "".join(lines)
+
+
+def as_drill_store(operations) -> DrillStore:
+    """Returns drill operations as a DrillStore, converting a list if needed"""
+    if isinstance(operations, DrillStore):
+        return operations
+    store = DrillStore()
+    store.extend(operations)
+    return store
+
+
+class DrillArrays(NamedTuple):
+    """
+    Per operation arrays of a drill program: positions, tool radius, and the
+    start of rout segments, which is the previous rout point. Circular routs
+    with an A word radius have it in radius, 0 elsewhere.
+    """
+
+    x: np.ndarray
+    y: np.ndarray
+    px: np.ndarray
+    py: np.ndarray
+    r: np.ndarray
+    hit: np.ndarray
+    rout: np.ndarray
+    segment: np.ndarray
+    radius: np.ndarray
+    clockwise: np.ndarray
+
+
+# Lines of a mapped file, and runs of consecutive lines of plain X/Y hits which
+# are decoded together
+_LINE = re.compile(rb"[^\r\n]+")
+_LINE_END = re.compile(rb"\r\n?|\n")
+_HIT_RUN = re.compile(rb"(?:[ \t]*X[+-]?[\d.]+Y[+-]?[\d.]+[ \t]*(?:\r\n?|\n|\Z))+")
+_HIT_SEPARATORS = bytes.maketrans(b"XY\r\n\t", b"     ")
+
+
+def _radius(text) -> Optional[float]:
+    match = re.search(r"A([\+\-\d.]+)", text)
+    return float(match.group(1)) if match else None
+
+
+class TravelReport(NamedTuple):
+    """Spindle travel and tool selections of a program, before and after optimize()"""
+
+    travel_before: float
+    travel_after: float
+    tool_changes_before: int
+    tool_changes_after: int
+
+
+def _program_cost(store: DrillStore, start) -> Tuple[float, int]:
+    """Travel through every hit and rout point from start, and tool selections"""
+    positioned = (store.code != TOOL_UP_CODE) & (store.code != TOOL_DOWN_CODE)
+    points = np.column_stack([store.x[positioned], store.y[positioned]])
+    tools = store.tool[positioned]
+    changes = int(len(tools) > 0) + int(np.count_nonzero(tools[1:] != tools[:-1]))
+    return toolpath_lib.travel(points, start), changes
+
+
+def _hit_coordinates(run: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """x and y of every hit in a run matched by _HIT_RUN, in one pass"""
+    fields = run.translate(_HIT_SEPARATORS).split()
+    try:
+        values = np.array(fields, dtype=np.float64)
+    except ValueError:
+        values = None  # e.g. 1.2.3, which _HIT_RUN lets through
+    if values is None or len(values) != 2 * run.count(b"X"):
+        raise ValueError(f"Invalid XY format: {run[:80].decode()}")
+    return values[0::2], values[1::2]
+
+
+def _text(line) -> str:
+    return line.decode() if type(line) is bytes else line
+
+
+class DrillLayer:
+    """
+    Represents an Excellon drill file.
+    With compact=True operations are kept in a columnar DrillStore instead of a
+    list of operation dataclasses.
+    """
+
+    def __init__(
+        self,
+        compact=False,
+        trace=False,
+        trace_hook: Optional[trace_lib.TraceHook] = None,
+    ):
+        self.trace = trace
+        self.trace_hook = trace_hook
         self.tools = {}
         self.mode = NCDrillFormat.DRILL_MODE
-        self.operations = []
+        self.operations = DrillStore() if compact else []
+        self._compact = compact
+        self._in_header = True
         self.comments = ""
         self.units = None
         self._tool_index = None
         self._tool_to_index = {}
         self._index = 0
+        self._bounds = None
 
-    def add_hole(self, x: float, y: float, diameter: float):
+    def __getstate__(self):
+        # Hooks are often lambdas or bound methods that can't be pickled
+        state = self.__dict__.copy()
+        state["trace_hook"] = None
+        return state
+
+    def _tool_for(self, diameter: float) -> int:
         if diameter not in self._tool_to_index:
+            self._index = max(self.tools, default=0) + 1
             self._tool_to_index[diameter] = self._index
-            self._index += 1
             self.tools[self._index] = diameter
-        operation = DrillOperation(self._tool_to_index[diameter], DrillHit(x, y))
+        return self._tool_to_index[diameter]
+
+    def add_hole(self, x: float, y: float, diameter: float):
+        operation = DrillOperation(self._tool_for(diameter), DrillHit(x, y))
         self.operations.append(operation)
+        self._bounds = None
 
     def add_rout(
         self,
         points: List[Tuple[float, float]],
         diameter: float,
         interpolation=NCDrillFormat.LINEAR_ROUT,
+        radius: Optional[float] = None,
     ):
-        if diameter not in self._tool_to_index:
-            self._tool_to_index[diameter] = self._index
-            self._index += 1
-            self.tools[self._index] = diameter
+        tool = self._tool_for(diameter)
         for point in points:
             operation = RoutOperation(
-                tool=self._tool_to_index[diameter],
+                tool=tool,
                 type=interpolation,
                 point=DrillHit(*point),
+                radius=radius,
             )
             self.operations.append(operation)
+        self._bounds = None
 
     def read(self, path) -> List[OPERATION_TYPES]:
+        """
+        Reads a drill file from a path, which is memory-mapped, or from an open
+        text stream. Traced reads go line by line so every statement gets its
+        event.
+        """
+        is_path = isinstance(path, (str, os.PathLike))
+        name = os.fspath(path) if is_path else getattr(path, "name", "")
         logging.info(f"Starting drill layer importer:")
-        logging.info(f"\tFile: {path}")
+        logging.info(f"\tFile: {name}")
 
-        in_header = True
-        with open(path, "r") as f:
-            for index, line in enumerate(f.readlines()):
-                line = line.strip()
-                if not line:
-                    continue
-                logging.debug(f"Line: {index}, Processing: {line}")
-                if line == NCDrillFormat.START_OF_HEADER.value:
-                    in_header = True
-                    continue
-                if line == NCDrillFormat.END_OF_HEADER.value:
-                    in_header = False
-                    continue
-                if in_header:
-                    self._process_header(line)
-                else:
-                    self._process_content(line)
+        traced = self.trace or self.trace_hook
+        self._in_header = True
+        with (
+            tokenizer.mapped(path) if is_path else contextlib.nullcontext(path)
+        ) as source:
+            if is_path and not traced:
+                self._read_mapped(source)
+                return self.operations
+            if is_path:
+                lines = (m.group() for m in _LINE.finditer(source))
+            else:
+                lines = iter(source)
+            lines = (line.strip() for line in lines)
+            lines = (_text(line) for line in lines if line)
+            if traced:
+                lines = trace_lib.traced(name, lines, self.trace, self.trace_hook)
+            for line in lines:
+                self._read_line(line)
         return self.operations
 
+    def _read_mapped(self, data):
+        """
+        Reads a mapped file. In drill mode, runs of plain hit lines are decoded
+        together and only the other lines go through _read_line.
+        """
+        pos, size = 0, len(data)
+        while pos < size:
+            if not self._in_header and self.mode == NCDrillFormat.DRILL_MODE:
+                run = _HIT_RUN.match(data, pos)
+                if run is not None:
+                    self._add_hits(*_hit_coordinates(run.group()))
+                    pos = run.end()
+                    continue
+            end = _LINE_END.search(data, pos)
+            stop, next_line = (end.start(), end.end()) if end else (size, size)
+            self._read_line(data[pos:stop].decode())
+            pos = next_line
+
+    def _add_hits(self, x: np.ndarray, y: np.ndarray):
+        if self._compact:
+            self.operations.extend_hits(self._tool_index, x, y)
+            return
+        tool = self._tool_index
+        self.operations.extend(
+            DrillOperation(tool, DrillHit(*point))
+            for point in zip(x.tolist(), y.tolist())
+        )
+
+    def _read_line(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        if line == NCDrillFormat.START_OF_HEADER.value:
+            self._in_header = True
+        elif line == NCDrillFormat.END_OF_HEADER.value:
+            self._in_header = False
+        elif self._in_header:
+            self._process_header(line)
+        else:
+            self._process_content(line)
+
     def _process_header(self, data):
         op_type, content = NCDrillFormat.lookup(data)
 
@@ -167,6 +596,7 @@ class DrillLayer:
                 tool=self._tool_index,
                 type=op_type,
                 point=DrillHit.decode(content),
+                radius=_radius(content) if op_type in CIRCULAR_ROUTS else None,
             )
             self.operations.append(operation)
         elif op_type in [NCDrillFormat.ABSOLUTE_UNITS, NCDrillFormat.END_OF_FILE]:
@@ -175,30 +605,133 @@ class DrillLayer:
             raise ValueError(f"Unknown command: {op_type}")
 
     def write(self, output_file):
+        """
+        Writes the layer as a drill file. Lines are formatted in bulk from the
+        columns of a DrillStore, WRITE_BATCH operations at a time.
+        """
+        store = as_drill_store(self.operations)
         with open(output_file, "w") as f:
             # Write header
             f.write(f"{NCDrillFormat.START_OF_HEADER.value}\n")
             f.write(f"{self.units}\n")
             f.writelines([f"T{str(i).zfill(2)}C{d}\n" for i, d in self.tools.items()])
             f.write(f"{NCDrillFormat.END_OF_HEADER.value}\n")
-
-            previous_op = None
-            for index, op in enumerate(self.operations):
-                if not isinstance(op, ToolOperation):
-                    tool = f"T{str(op.tool).zfill(2)}\n"
-                    if not previous_op or op.tool != previous_op.tool:
-                        f.write(tool)
-                if isinstance(op, RoutOperation):
-                    f.write(f"{op.type.value}{op.point.encode()}\n")
-                    previous_op = op
-                elif isinstance(op, DrillOperation):
-                    if not index or (self.operations[index - 1]) == RoutOperation:
-                        f.write(f"{NCDrillFormat.DRILL_MODE.value}\n")
-                    f.write(f"{op.point.encode()}\n")
-                    previous_op = op
-                elif isinstance(op, ToolOperation):
-                    cmd = NCDrillFormat.TOOL_DOWN if op.down else NCDrillFormat.TOOL_UP
-                    f.write(f"{cmd.value}\n")
-                else:
-                    raise ValueError(f"Invalid operation: {op}")
+            for text in _format_lines(store):
+                f.write(text)
             f.write(f"{NCDrillFormat.END_OF_FILE.value}\n")
+
+    def optimize(self, start=(0.0, 0.0)) -> TravelReport:
+        """
+        Reorders the drill hits to cut spindle travel and tool changes. Hits are
+        grouped per tool, tools go by increasing diameter and each tool's hits
+        follow a nearest neighbour path improved by 2-opt, starting where the
+        previous tool ended. Routs keep their order and come after the hits.
+        """
+        store = as_drill_store(self.operations)
+        travel_before, changes_before = _program_cost(store, start)
+        hits = store.code == HIT_CODE
+        tools = store.tool[hits]
+
+        def tool_order(tool):
+            tool = None if tool == NO_TOOL else tool
+            return self.tools.get(tool, 0.0), tool or 0
+
+        rows = []
+        position = start
+        for tool in sorted(np.unique(tools).tolist(), key=tool_order):
+            group = np.nonzero(hits & (store.tool == tool))[0]
+            points = np.column_stack([store.x[group], store.y[group]])
+            order = toolpath_lib.optimize(points, position)
+            rows.append(group[order])
+            position = tuple(points[order[-1]])
+        rows.append(np.nonzero(~hits)[0])
+        rows = np.concatenate(rows)
+        store = store.take(rows)
+        if self._compact:
+            self.operations = store
+        else:
+            self.operations = [self.operations[k] for k in rows.tolist()]
+
+        travel_after, changes_after = _program_cost(store, start)
+        logging.info(
+            f"Drill travel {travel_before:.1f} -> {travel_after:.1f}, "
+            f"tool changes {changes_before} -> {changes_after}"
+        )
+        return TravelReport(travel_before, travel_after, changes_before, changes_after)
+
+    def arrays(self) -> DrillArrays:
+        """
+        Positions, tool radii and rout segments of every operation. Rout segments
+        start at the previous rout point; the first rout and rout mode moves
+        start none.
+        """
+        store = as_drill_store(self.operations)
+        code, x, y = store.code, store.x, store.y
+        tools, inverse = np.unique(store.tool, return_inverse=True)
+        diameters = [self.tools.get(None if t == NO_TOOL else t, 0) for t in tools]
+        r = np.asarray(diameters, dtype=np.float64).reshape(-1)[inverse] / 2
+        positioned = (code != TOOL_UP_CODE) & (code != TOOL_DOWN_CODE)
+        r[~positioned] = 0
+        hit = code == HIT_CODE
+        rout = code >= ROUT_CODE
+        routs = np.nonzero(rout)[0]
+        rout_mode = ROUT_CODE + ROUT_TYPES.index(NCDrillFormat.ROUT_MODE)
+        segment = rout & (code != rout_mode)
+        if len(routs):
+            segment[routs[0]] = False
+        px, py = x.copy(), y.copy()
+        px[routs[1:]], py[routs[1:]] = x[routs[:-1]], y[routs[:-1]]
+        px[~segment], py[~segment] = x[~segment], y[~segment]
+
+        radius = np.zeros(len(store))
+        if store.radius:
+            rows = np.fromiter(store.radius, dtype=np.int64, count=len(store.radius))
+            values = [store.radius[row] or 0.0 for row in rows.tolist()]
+            radius[rows] = values
+        circular = [ROUT_CODE + ROUT_TYPES.index(t) for t in CIRCULAR_ROUTS]
+        radius[~(segment & np.isin(code, circular))] = 0
+        clockwise_code = ROUT_CODE + ROUT_TYPES.index(
+            NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT
+        )
+        clockwise = code == clockwise_code
+        return DrillArrays(x, y, px, py, r, hit, rout, segment, radius, clockwise)
+
+    def primitive_bounds(self) -> np.ndarray:
+        """
+        Bounding boxes (xmin, ymin, xmax, ymax) of every operation, padded by the
+        tool radius. Rout segments span from the previous rout point, circular
+        ones around their arc; tool up/down and rout mode moves have NaN rows.
+        """
+        a = self.arrays()
+        x, y, px, py, r = a.x, a.y, a.px, a.py, a.r
+        boxes = np.column_stack(
+            [
+                np.minimum(x, px) - r,
+                np.minimum(y, py) - r,
+                np.maximum(x, px) + r,
+                np.maximum(y, py) + r,
+            ]
+        )
+        arc = a.radius != 0
+        if arc.any():
+            arcs = arcs_lib.from_radius(
+                px[arc], py[arc], x[arc], y[arc], a.radius[arc], a.clockwise[arc]
+            )
+            pad = r[arc, None] * np.array([-1, -1, 1, 1])
+            boxes[arc] = arcs_lib.bounds(arcs) + pad
+        boxes[a.rout & ~a.segment] = np.nan
+        return boxes
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Extents (xmin, ymin, xmax, ymax) of every hit and rout, or None for an
+        empty layer. Cached until operations are added.
+        """
+        if self._bounds is None or self._bounds[0] != len(self.operations):
+            bounds = spatial.total_bounds(self.primitive_bounds())
+            self._bounds = len(self.operations), bounds
+        return self._bounds[1]
+
+    def build_index(self) -> spatial.SpatialIndex:
+        """Spatial index over the drill hits and rout segments by operation index"""
+        return spatial.SpatialIndex(self.primitive_bounds())
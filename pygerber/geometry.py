@@ -0,0 +1,316 @@
+import math
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+import pygerber.aperture as aperture_lib
+import pygerber.operation_store as store_lib
+import pygerber.standards.gerber as gf
+
+DEFAULT_TOLERANCE = 0.001  # in layer units, 1 um for millimeter layers
+MAX_SEGMENTS = 1024
+
+
+class Polygons(NamedTuple):
+    """
+    A set of polygons in flat arrays. Ring k has the vertices
+    vertices[ring_offsets[k]:ring_offsets[k + 1]] and belongs to polygon
+    ring_polygons[k]. The rings of a polygon are filled with the even-odd rule;
+    the first one is its outline and the others are holes.
+    """
+
+    vertices: np.ndarray  # (V, 2) float64
+    ring_offsets: np.ndarray  # (R + 1,) int64
+    ring_polygons: np.ndarray  # (R,) int64
+
+    @property
+    def polygon_count(self) -> int:
+        return int(self.ring_polygons[-1]) + 1 if len(self.ring_polygons) else 0
+
+    @property
+    def ring_sizes(self) -> np.ndarray:
+        return np.diff(self.ring_offsets)
+
+    def rings(self) -> List[np.ndarray]:
+        offsets = self.ring_offsets.tolist()
+        return [self.vertices[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def edges(self):
+        """Index of the start and end vertex of every edge, rings are closed"""
+        start = np.arange(len(self.vertices))
+        end = start + 1
+        stops = self.ring_offsets[1:][self.ring_sizes > 0]
+        end[stops - 1] = self.ring_offsets[:-1][self.ring_sizes > 0]
+        return start, end
+
+    def ring_areas(self) -> np.ndarray:
+        """Signed area of every ring, positive when counterclockwise"""
+        start, end = self.edges()
+        x, y = self.vertices[:, 0], self.vertices[:, 1]
+        cross = x[start] * y[end] - x[end] * y[start]
+        areas = np.zeros(len(self.ring_polygons))
+        sizes = self.ring_sizes
+        filled = sizes > 0
+        areas[filled] = np.add.reduceat(cross, self.ring_offsets[:-1][filled]) / 2
+        return areas
+
+    def areas(self) -> np.ndarray:
+        """Area of every polygon: its outline less its holes"""
+        magnitude = np.abs(self.ring_areas())
+        first = np.ones(len(self.ring_polygons), dtype=bool)
+        first[1:] = self.ring_polygons[1:] != self.ring_polygons[:-1]
+        signed = np.where(first, magnitude, -magnitude)
+        return np.bincount(self.ring_polygons, signed, self.polygon_count)
+
+    def bounds(self) -> np.ndarray:
+        """Bounding box (xmin, ymin, xmax, ymax) of every polygon"""
+        owner = np.repeat(self.ring_polygons, self.ring_sizes)
+        boxes = np.full((self.polygon_count, 4), np.nan)
+        for column, reduce, axis in ((0, np.fmin, 0), (1, np.fmin, 1)):
+            boxes[:, column] = np.inf
+            reduce.at(boxes[:, column], owner, self.vertices[:, axis])
+        for column, reduce, axis in ((2, np.fmax, 0), (3, np.fmax, 1)):
+            boxes[:, column] = -np.inf
+            reduce.at(boxes[:, column], owner, self.vertices[:, axis])
+        return boxes
+
+    def transform(self, scale=1.0, dx=0.0, dy=0.0, flip=False) -> "Polygons":
+        """Scaled and translated copy, mirrored about the x axis if flip"""
+        vertices = self.vertices * (scale, -scale if flip else scale) + (dx, dy)
+        return self._replace(vertices=vertices)
+
+
+def empty() -> Polygons:
+    return Polygons(
+        np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+    )
+
+
+def from_rings(rings: Sequence[np.ndarray], polygons=None) -> Polygons:
+    """Polygons from a list of (k, 2) rings, one polygon per ring by default"""
+    if not len(rings):
+        return empty()
+    sizes = [len(ring) for ring in rings]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    if polygons is None:
+        polygons = np.arange(len(rings))
+    vertices = np.concatenate([np.asarray(r, np.float64) for r in rings]).reshape(-1, 2)
+    return Polygons(vertices, offsets, np.asarray(polygons, dtype=np.int64))
+
+
+def from_uniform(vertices: np.ndarray) -> Polygons:
+    """One single ring polygon per row of vertices (n, k, 2)"""
+    count, size = vertices.shape[:2]
+    return Polygons(
+        vertices.reshape(-1, 2),
+        np.arange(count + 1, dtype=np.int64) * size,
+        np.arange(count, dtype=np.int64),
+    )
+
+
+def concatenate(polygons: Sequence[Polygons]) -> Polygons:
+    """Joins polygon sets, renumbering polygons and rings"""
+    polygons = [p for p in polygons if len(p.ring_polygons)]
+    if not polygons:
+        return empty()
+    vertex_base = np.cumsum([0] + [len(p.vertices) for p in polygons])
+    polygon_base = np.cumsum([0] + [p.polygon_count for p in polygons])
+    offsets = [p.ring_offsets[:-1] + base for p, base in zip(polygons, vertex_base)]
+    return Polygons(
+        np.concatenate([p.vertices for p in polygons]),
+        np.concatenate(offsets + [[vertex_base[-1]]]).astype(np.int64),
+        np.concatenate(
+            [p.ring_polygons + base for p, base in zip(polygons, polygon_base)]
+        ),
+    )
+
+
+def instances(template: Polygons, x, y) -> Polygons:
+    """Copies of a template translated to every (x, y), in a single broadcast"""
+    offsets = np.column_stack([x, y]).astype(np.float64)
+    count, size = len(offsets), len(template.vertices)
+    vertices = template.vertices[None, :, :] + offsets[:, None, :]
+    steps = np.arange(count, dtype=np.int64)[:, None]
+    ring_offsets = template.ring_offsets[None, :-1] + steps * size
+    ring_polygons = template.ring_polygons[None, :] + steps * template.polygon_count
+    return Polygons(
+        vertices.reshape(-1, 2),
+        np.append(ring_offsets.ravel(), count * size),
+        ring_polygons.ravel(),
+    )
+
+
+def segments(r: float, tolerance: float, sweep=2 * math.pi) -> int:
+    """Chords needed so an arc of radius r deviates at most tolerance"""
+    if r <= tolerance:
+        return max(2, math.ceil(4 * sweep / (2 * math.pi)))
+    step = 2 * math.acos(1 - tolerance / r)
+    return min(MAX_SEGMENTS, max(2, math.ceil(sweep / step)))
+
+
+def circle(cx, cy, r, tolerance) -> np.ndarray:
+    n = max(8, segments(r, tolerance))
+    angles = np.linspace(0, 2 * math.pi, n, endpoint=False)
+    return np.column_stack([cx + r * np.cos(angles), cy + r * np.sin(angles)])
+
+
+def rotate(points: np.ndarray, angle: float) -> np.ndarray:
+    """Points rotated counterclockwise about the origin, angle in radians"""
+    if not angle:
+        return points
+    c, s = math.cos(angle), math.sin(angle)
+    return points @ np.array([[c, s], [-s, c]])
+
+
+def _rectangle(shape: aperture_lib.ApertureRectangle, tolerance) -> np.ndarray:
+    w, h = shape.width / 2, shape.height / 2
+    r = min(shape.radius, w, h)
+    if r > 0:
+        # Quarter circle at each corner, counterclockwise from the top right
+        n = segments(r, tolerance, math.pi / 2)
+        quarter = np.linspace(0, math.pi / 2, n + 1)
+        corners = [(w - r, h - r), (r - w, h - r), (r - w, r - h), (w - r, r - h)]
+        points = np.vstack(
+            [
+                np.column_stack(
+                    [
+                        x + r * np.cos(quarter + k * math.pi / 2),
+                        y + r * np.sin(quarter + k * math.pi / 2),
+                    ]
+                )
+                for k, (x, y) in enumerate(corners)
+            ]
+        )
+    else:
+        points = np.array([(w, h), (-w, h), (-w, -h), (w, -h)], dtype=np.float64)
+    return rotate(points, shape.rotation) + (shape.cx, shape.cy)
+
+
+def _shape_rings(shape, tolerance) -> List[List[np.ndarray]]:
+    if isinstance(shape, list):
+        return [rings for s in shape for rings in _shape_rings(s, tolerance)]
+    if isinstance(shape, aperture_lib.ApertureCircle):
+        rings = [circle(shape.cx, shape.cy, shape.r, tolerance)]
+        if shape.hole:
+            rings.append(circle(shape.cx, shape.cy, shape.hole / 2, tolerance))
+        return [rings]
+    if isinstance(shape, aperture_lib.ApertureRectangle):
+        return [[_rectangle(shape, tolerance)]]
+    if isinstance(shape, aperture_lib.AperturePolygon):
+        vertices = int(shape.vertices)
+        angles = np.arange(vertices) * 2 * math.pi / vertices
+        angles += math.radians(shape.rotation)
+        r = shape.diameter / 2
+        ring = np.column_stack(
+            [shape.cx + r * np.cos(angles), shape.cy + r * np.sin(angles)]
+        )
+        return [[ring]]
+    if isinstance(shape, aperture_lib.ApertureOutline):
+        return [[np.array(shape.points, dtype=np.float64).reshape(-1, 2)]]
+    raise NotImplementedError(shape)
+
+
+def _from_nested(nested: List[List[np.ndarray]]) -> Polygons:
+    rings = [ring for polygon in nested for ring in polygon]
+    owners = [index for index, polygon in enumerate(nested) for _ in polygon]
+    return from_rings(rings, owners)
+
+
+def shape_polygons(shape, tolerance=DEFAULT_TOLERANCE) -> Polygons:
+    """
+    Polygons of an aperture shape (or list of macro shapes) around the flash
+    point, with arcs split into chords at most tolerance from the true curve
+    """
+    return _from_nested(_shape_rings(shape, tolerance))
+
+
+def aperture_polygons(
+    aperture: aperture_lib.Aperture, tolerance=DEFAULT_TOLERANCE
+) -> Polygons:
+    """Polygons of an aperture, including its rotation and hole"""
+    nested = _shape_rings(aperture.shape, tolerance)
+    if aperture.rotation:  # macro rotation is about the origin, in degrees
+        angle = math.radians(aperture.rotation)
+        nested = [[rotate(ring, angle) for ring in rings] for rings in nested]
+    if aperture.hole and len(nested) == 1:
+        nested[0].append(circle(0, 0, aperture.hole / 2, tolerance))
+    return _from_nested(nested)
+
+
+def capsules(x0, y0, x1, y1, r, tolerance=DEFAULT_TOLERANCE) -> Polygons:
+    """Outlines of round capped strokes of radius r from (x0, y0) to (x1, y1)"""
+    x0, y0, x1, y1 = (np.asarray(v, np.float64) for v in (x0, y0, x1, y1))
+    k = segments(r, tolerance, math.pi) + 1
+    theta = np.arctan2(y1 - y0, x1 - x0)[:, None]
+    half = np.linspace(-math.pi / 2, math.pi / 2, k)
+    ahead, behind = theta + half, theta + half + math.pi
+    outline = np.concatenate(
+        [
+            np.stack(
+                [x1[:, None] + r * np.cos(ahead), y1[:, None] + r * np.sin(ahead)], -1
+            ),
+            np.stack(
+                [x0[:, None] + r * np.cos(behind), y0[:, None] + r * np.sin(behind)],
+                -1,
+            ),
+        ],
+        axis=1,
+    )
+    return from_uniform(outline)
+
+
+def sweeps(ring: np.ndarray, x0, y0, x1, y1) -> Polygons:
+    """
+    Area covered by a convex ring moved from (x0, y0) to (x1, y1): the ring at
+    both ends plus the parallelogram swept by each of its edges
+    """
+    start = ring[None, :, :] + np.column_stack([x0, y0])[:, None, :]
+    end = ring[None, :, :] + np.column_stack([x1, y1])[:, None, :]
+    start_next, end_next = np.roll(start, -1, axis=1), np.roll(end, -1, axis=1)
+    edges = np.stack([start, start_next, end_next, end], axis=2)
+    return concatenate(
+        [from_uniform(start), from_uniform(end), from_uniform(edges.reshape(-1, 4, 2))]
+    )
+
+
+class ApertureGeometry:
+    """
+    Aperture polygons built once per aperture and tolerance, and placed at every
+    flash with one broadcast per aperture
+    """
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE):
+        self.tolerance = tolerance
+        self.templates = aperture_lib.TemplateCache()
+
+    def polygons(
+        self, aperture: aperture_lib.Aperture, tolerance: Optional[float] = None
+    ) -> Polygons:
+        tolerance = self.tolerance if tolerance is None else tolerance
+        return self.templates.get_for(
+            aperture, lambda: aperture_polygons(aperture, tolerance), tolerance
+        )
+
+    def flashes(
+        self, aperture: aperture_lib.Aperture, x, y, tolerance=None
+    ) -> Polygons:
+        return instances(self.polygons(aperture, tolerance), x, y)
+
+    def store_flashes(
+        self, store: store_lib.OperationStore, tolerance=None
+    ) -> Polygons:
+        """
+        Polygons of every flash in an OperationStore, grouped by aperture.
+        Polygon ids follow the order of the groups, not of the flashes.
+        """
+        flash = store_lib.OPERATION_CODES.index(gf.GerberFormat.OPERATION_FLASH)
+        flashes = np.nonzero(store.op == flash)[0]
+        codes = store.aperture[flashes]
+        groups = []
+        for code in np.unique(codes):
+            selected = flashes[codes == code]
+            aperture = store.apertures[code]
+            groups.append(
+                self.flashes(aperture, store.x[selected], store.y[selected], tolerance)
+            )
+        return concatenate(groups)
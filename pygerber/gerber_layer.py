@@ -1,12 +1,25 @@
-import copy
+import collections
+import contextlib
 import enum
+import hashlib
 import logging
 import os
 import re
-from typing import List, NamedTuple, Tuple
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
 
 import pygerber.aperture as aperture_lib
+import pygerber.arcs as arcs_lib
+import pygerber.geometry as geometry_lib
+import pygerber.operation_store as store_lib
+import pygerber.spatial as spatial
 import pygerber.standards.gerber as gf
+import pygerber.tokenizer as tokenizer
+import pygerber.trace as trace_lib
+
+WRITE_BUFFER = 1 << 20  # bytes buffered when writing to a path
+WRITE_BATCH = 1 << 16  # operations formatted at a time
 
 
 class Units(enum.Enum):
@@ -33,6 +46,368 @@ class OperationState(NamedTuple):
     units: Units
 
 
+class Checkpoint(NamedTuple):
+    """
+    Parser state after the first `offset` bytes of a file, see
+    GerberLayer.reread. digest is a hash of the bytes since the previous
+    checkpoint; sizes are the numbers of stored operations, regions and step and
+    repeats.
+    """
+
+    offset: int
+    statements: int
+    digest: bytes
+    sizes: Tuple[int, int, int]
+    state: dict
+
+
+def _digest(data, start=0, end=None) -> bytes:
+    return hashlib.blake2b(memoryview(data)[start:end], digest_size=16).digest()
+
+
+def operation_bounds(store: store_lib.OperationStore, pad=True) -> np.ndarray:
+    """
+    Bounding boxes (xmin, ymin, xmax, ymax) of the operations in a store, padded
+    by the extent of their aperture. Moves have NaN rows unless pad is False,
+    which is how region contours are measured.
+    """
+    codes = store_lib.OPERATION_CODES
+    x, y, px, py, i, j = store.x, store.y, store.prev_x, store.prev_y, store.i, store.j
+    draw = store.op == codes.index(gf.GerberFormat.OPERATION_INTERP)
+    sx, sy = np.where(draw, px, x), np.where(draw, py, y)
+    boxes = np.column_stack(
+        [np.fmin(x, sx), np.fmin(y, sy), np.fmax(x, sx), np.fmax(y, sy)]
+    )
+
+    # Arcs reach out to the axis extremes within their sweep
+    indices, arcs = arcs_lib.store_arcs(store)
+    if len(indices):
+        extremes = arcs_lib.bounds(arcs)
+        boxes[indices, :2] = np.fmin(boxes[indices, :2], extremes[:, :2])
+        boxes[indices, 2:] = np.fmax(boxes[indices, 2:], extremes[:, 2:])
+
+    if pad:
+        extents = [a.extent() for a in store.apertures] + [(0.0, 0.0)]
+        # NO_APERTURE (-1) picks the trailing zero extent
+        hx, hy = np.array(extents, dtype=np.float64)[store.aperture].T
+        boxes += np.column_stack([-hx, -hy, hx, hy])
+        boxes[store.op == codes.index(gf.GerberFormat.OPERATION_MOVE)] = np.nan
+    return boxes
+
+
+def _changes(values: np.ndarray, initial=None) -> np.ndarray:
+    """Mask of the values that differ from the one before, the first from initial"""
+    changed = np.empty(len(values), dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    if len(values):
+        changed[0] = initial is None or values[0] != initial
+    return changed
+
+
+def _format_operations(
+    store: store_lib.OperationStore, integer_digits, decimal_digits, quadrant_mode
+) -> Iterator[str]:
+    """
+    Gerber text of the operations in a store, WRITE_BATCH operations at a time.
+    Coordinates are scaled and truncated in bulk; aperture selections, quadrant
+    modes and interpolations are written where they change, the interpolation
+    only from the first arc on so files without arcs keep the implicit G01.
+    """
+    count = len(store)
+    assert np.all(store.x < 10**integer_digits.x), "Overflow x value"
+    assert np.all(store.y < 10**integer_digits.y), "Overflow y value"
+    scale_x, scale_y = 10**decimal_digits.x, 10**decimal_digits.y
+    # astype truncates toward zero, like int()
+    x = (store.x * scale_x).astype(np.int64)
+    y = (store.y * scale_y).astype(np.int64)
+    arc = ~np.isnan(store.i)
+    i = (np.where(arc, store.i, 0) * scale_x).astype(np.int64)
+    j = (np.where(arc, store.j, 0) * scale_y).astype(np.int64)
+    codes = store_lib.OPERATION_CODES
+    endings = np.array([f"{code.value}*\n" for code in codes], dtype=object)
+    endings = endings[store.op]
+
+    # Statements written ahead of operations, in order: aperture, quadrant
+    # mode, interpolation
+    prefixes = collections.defaultdict(str)
+    apertures = store.apertures
+    # Equal apertures are the same selection, whichever object they are
+    same = [next(k for k, b in enumerate(apertures) if b == a) for a in apertures]
+    no_aperture = store_lib.NO_APERTURE
+    aperture = np.array(same + [no_aperture], dtype=np.int64)[store.aperture]
+    selected = np.nonzero(aperture != no_aperture)[0]
+    for row in selected[_changes(aperture[selected])].tolist():
+        prefixes[row] += f"D{apertures[aperture[row]].index}*\n"
+
+    draws = np.nonzero(store.op == codes.index(gf.GerberFormat.OPERATION_INTERP))[0]
+    modes = np.empty(count, dtype=object)
+    for start, stop, mode in store.quadrant_mode.runs(count):
+        modes[start:stop] = mode
+    moded = draws[modes[draws].astype(bool)]  # draws with a quadrant mode
+    for row in moded[_changes(modes[moded], quadrant_mode)].tolist():
+        prefixes[row] += f"{modes[row].value}*\n"
+
+    interpolation = store.interpolation
+    circular = interpolation[draws] >= store_lib.INTERPOLATION_CODES.index(
+        gf.GerberFormat.INTERP_MODE_CW
+    )
+    drawn_arcs = np.nonzero(circular & arc[draws])[0]
+    if len(drawn_arcs):
+        interpolated = draws[drawn_arcs[0] :]
+        changed = _changes(interpolation[interpolated])
+        for row in interpolated[changed].tolist():
+            mode = store_lib.INTERPOLATION_CODES[interpolation[row]]
+            prefixes[row] += f"{mode.value}*\n"
+
+    rows = np.array(sorted(prefixes), dtype=np.int64)
+    arcs = np.nonzero(arc)[0]
+    for start in range(0, count, WRITE_BATCH):
+        stop = min(start + WRITE_BATCH, count)
+        lines = list(
+            map(
+                "X{}Y{}{}".format,
+                x[start:stop].tolist(),
+                y[start:stop].tolist(),
+                endings[start:stop].tolist(),
+            )
+        )
+        batch = arcs[np.searchsorted(arcs, start) : np.searchsorted(arcs, stop)]
+        for row in batch.tolist():
+            lines[row - start] = f"X{x[row]}Y{y[row]}I{i[row]}J{j[row]}{endings[row]}"
+        batch = rows[np.searchsorted(rows, start) : np.searchsorted(rows, stop)]
+        for row in batch.tolist():
+            lines[row - start] = prefixes[row] + lines[row - start]
+        yield "".join(lines)
+
+
+class Placement(NamedTuple):
+    """A block drawn with its origin at (x, y), with inverted polarity if clear"""
+
+    block: "Block"
+    x: float
+    y: float
+    clear: bool = False
+
+
+class StepRepeat(NamedTuple):
+    """A block repeated at every (x, y) offset of a step and repeat statement"""
+
+    block: "Block"
+    offsets: Tuple[Tuple[float, float], ...]
+
+    def placements(self) -> Iterator[Placement]:
+        for x, y in self.offsets:
+            yield Placement(self.block, x, y)
+
+
+def _moved(state: OperationState, dx, dy, clear) -> OperationState:
+    point, previous = state.point, state.previous_point
+    if isinstance(point[0], tuple):  # arc end point and center offset
+        point = (point[0][0] + dx, point[0][1] + dy), point[1]
+    else:
+        point = point[0] + dx, point[1] + dy
+    if previous is not None:
+        previous = previous[0] + dx, previous[1] + dy
+    polarity = (state.polarity is False) if clear else state.polarity
+    return state._replace(point=point, previous_point=previous, polarity=polarity)
+
+
+def is_block_flash(op_type, state) -> bool:
+    return op_type == gf.GerberFormat.OPERATION_FLASH and isinstance(
+        getattr(state.aperture, "shape", None), Block
+    )
+
+
+class Primitives:
+    """
+    Operations, regions and step and repeat blocks in the order they were read,
+    with their bounds and spatial index. Blocks are stored once with the offsets
+    they are placed at and are only expanded by expand().
+    """
+
+    def __init__(self, compact=False):
+        self.operations: List[Tuple[gf.GerberFormat, OperationState]] = (
+            store_lib.OperationStore(OperationState) if compact else []
+        )
+        self.collection_of_region = (
+            store_lib.RegionStore(OperationState) if compact else []
+        )
+        # Number of operations read before each region, to keep the draw order
+        self.region_positions = []
+        self.step_repeats: List[StepRepeat] = []
+        # Number of operations and regions read before each step and repeat
+        self.step_repeat_positions: List[Tuple[int, int]] = []
+        self._bounds = None
+
+    def add(self, item: Tuple[gf.GerberFormat, Any]):
+        """Stores an item as yielded by GerberLayer.iter_operations"""
+        op_type, value = item
+        if op_type == gf.GerberFormat.REGION_END:
+            self.collection_of_region.append(value)
+            self.region_positions.append(len(self.operations))
+        elif op_type == gf.GerberFormat.STEP_AND_REPEAT:
+            self.step_repeats.append(value)
+            position = len(self.operations), len(self.collection_of_region)
+            self.step_repeat_positions.append(position)
+        else:
+            self.operations.append(item)
+
+    def draw_order(self) -> Iterator[Tuple[gf.GerberFormat, Any]]:
+        """
+        Stored operations, regions and step and repeats in the order they were
+        read, as yielded by iter_operations. Regions without a recorded position
+        come first.
+        """
+        positions = self.region_positions
+        if len(positions) != len(self.collection_of_region):
+            positions = [0] * len(self.collection_of_region)
+        extras = [
+            ((position, index, 1), gf.GerberFormat.REGION_END, region)
+            for index, (position, region) in enumerate(
+                zip(positions, self.collection_of_region)
+            )
+        ]
+        extras += [
+            ((position, regions, 0), gf.GerberFormat.STEP_AND_REPEAT, step_repeat)
+            for (position, regions), step_repeat in zip(
+                self.step_repeat_positions, self.step_repeats
+            )
+        ]
+        extras.sort(key=lambda extra: extra[0])
+        extras = iter(extras)
+        extra = next(extras, None)
+        for index, operation in enumerate(self.operations):
+            while extra is not None and extra[0][0] <= index:
+                yield extra[1:]
+                extra = next(extras, None)
+            yield operation
+        while extra is not None:
+            yield extra[1:]
+            extra = next(extras, None)
+
+    def expand(self, dx=0.0, dy=0.0, clear=False):
+        """
+        Lazily yields the draw order with every step and repeat copy and block
+        aperture flash replaced by the block's operations and regions, moved by
+        (dx, dy) and with inverted polarity if clear
+        """
+        moved = dx or dy or clear
+        for op_type, item in self.draw_order():
+            if op_type == gf.GerberFormat.STEP_AND_REPEAT:
+                for x, y in item.offsets:
+                    yield from item.block.expand(dx + x, dy + y, clear)
+            elif op_type == gf.GerberFormat.REGION_END:
+                if moved:
+                    item = [(t, _moved(s, dx, dy, clear)) for t, s in item]
+                yield op_type, item
+            elif is_block_flash(op_type, item):
+                x, y = item.point
+                inverted = clear != (item.polarity is False)
+                yield from item.aperture.shape.expand(dx + x, dy + y, inverted)
+            else:
+                yield op_type, _moved(item, dx, dy, clear) if moved else item
+
+    def placements(self) -> List[Placement]:
+        """Every step and repeat copy, in the order of their primitive ids"""
+        return [
+            p for step_repeat in self.step_repeats for p in step_repeat.placements()
+        ]
+
+    def primitive_bounds(self) -> np.ndarray:
+        """
+        Bounding boxes of every operation, then one row per region and one per
+        step and repeat copy, see operation_bounds
+        """
+        store = store_lib.as_store(self.operations, OperationState)
+        boxes = [operation_bounds(store)]
+        if self.collection_of_region:
+            regions = store_lib.as_region_store(
+                self.collection_of_region, OperationState
+            )
+            vertices = operation_bounds(regions.contours, pad=False)
+            starts = regions.offsets[:-1]
+            boxes.append(
+                np.column_stack(
+                    [
+                        np.fmin.reduceat(vertices[:, 0], starts),
+                        np.fmin.reduceat(vertices[:, 1], starts),
+                        np.fmax.reduceat(vertices[:, 2], starts),
+                        np.fmax.reduceat(vertices[:, 3], starts),
+                    ]
+                )
+            )
+        for step_repeat in self.step_repeats:
+            bounds = step_repeat.block.bounds()
+            box = np.full(4, np.nan) if bounds is None else np.array(bounds)
+            boxes.append(box + np.tile(np.array(step_repeat.offsets), 2))
+        return np.vstack(boxes)
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Extents (xmin, ymin, xmax, ymax) of everything drawn, or None when empty.
+        Cached until operations, regions or step and repeats are added.
+        """
+        key = (
+            len(self.operations),
+            len(self.collection_of_region),
+            len(self.step_repeats),
+        )
+        if self._bounds is None or self._bounds[0] != key:
+            self._bounds = key, spatial.total_bounds(self.primitive_bounds())
+        return self._bounds[1]
+
+    def build_index(self) -> spatial.SpatialIndex:
+        """
+        Spatial index over the flashes, draws, regions and step and repeat
+        copies. Ids below len(operations) are operation indices, then come the
+        regions and the copies; look them up with primitive().
+        """
+        return spatial.SpatialIndex(self.primitive_bounds())
+
+    def flash_polygons(self, geometry=None) -> geometry_lib.Polygons:
+        """
+        Polygons of every flash, grouped by aperture. geometry is an
+        ApertureGeometry, reuse one to keep its aperture polygons across calls.
+        """
+        geometry = geometry or geometry_lib.ApertureGeometry()
+        return geometry.store_flashes(
+            store_lib.as_store(self.operations, OperationState)
+        )
+
+    def primitive(self, index: int) -> Tuple[gf.GerberFormat, Any]:
+        if index < len(self.operations):
+            return self.operations[index]
+        index -= len(self.operations)
+        if index < len(self.collection_of_region):
+            return gf.GerberFormat.REGION_END, self.collection_of_region[index]
+        index -= len(self.collection_of_region)
+        return gf.GerberFormat.STEP_AND_REPEAT, self.placements()[index]
+
+
+class Block(Primitives):
+    """
+    The contents of an SR or AB statement, kept once in block coordinates
+    however many times the block is placed
+    """
+
+    def __eq__(self, other):
+        if not isinstance(other, Block):
+            return NotImplemented
+        return (
+            list(self.operations) == list(other.operations)
+            and self.collection_of_region == other.collection_of_region
+            and self.step_repeats == other.step_repeats
+        )
+
+    def extent(self) -> Tuple[float, float]:
+        """Half width and half height around the origin, as Aperture.extent"""
+        bounds = self.bounds()
+        if bounds is None:
+            return 0.0, 0.0
+        xmin, ymin, xmax, ymax = bounds
+        return max(abs(xmin), abs(xmax)), max(abs(ymin), abs(ymax))
+
+
 class GerberLayerBaseException(Exception):
     pass
 
@@ -41,12 +416,39 @@ class UnknownApertureError(GerberLayerBaseException):
     pass
 
 
-class GerberLayer:
+class GerberLayer(Primitives):
     """
-    Represents a Gerber layer or one file in the Gerber format
+    Represents a Gerber layer or one file in the Gerber format.
+    With compact=True operations are kept in a columnar OperationStore instead of
+    a list of OperationState tuples.
+    Per statement logging is off unless trace=True; trace_hook receives a
+    TraceEvent for every statement parsed.
     """
 
-    def __init__(self):
+    CHECKPOINT_INTERVAL = 4096  # statements between checkpoints
+    # Graphics state saved in checkpoints, besides apertures, macros, attributes
+    # and comments
+    _CHECKPOINT_STATE = (
+        "current_aperture",
+        "interpolation",
+        "polarity",
+        "current_point",
+        "units",
+        "quadrant_mode",
+        "scalars",
+        "decimal_digits",
+        "integer_digits",
+        "_in_header",
+    )
+
+    def __init__(
+        self,
+        compact=False,
+        trace=False,
+        trace_hook: Optional[trace_lib.TraceHook] = None,
+    ):
+        self.trace = trace
+        self.trace_hook = trace_hook
         self._in_header = True
         self.header = []
         self.current_aperture = None
@@ -62,194 +464,454 @@ class GerberLayer:
         self.scalars = ()
         self.decimal_digits = (0, 0)
         self.integer_digits = (0, 0)
-        self.operations: List[Tuple[gf.GerberFormat, OperationState]] = []
+        super().__init__(compact)
+        self._compact = compact
         self._regions = []
+        # Open SR and AB statements: (command, Block or None, aperture index)
+        self._blocks = []
         self.aperture_factory = aperture_lib.ApertureFactory()
-        self.collection_of_region = []
         self._set_standard_layer()
+        # Parser state every CHECKPOINT_INTERVAL statements of the file read, and
+        # the length and digest of the text after the last one
+        self._checkpoints: List[Checkpoint] = []
+        self._tail = None
+
+    def __getstate__(self):
+        # Hooks are often lambdas or bound methods that can't be pickled
+        state = self.__dict__.copy()
+        state["trace_hook"] = None
+        return state
 
     def read(self, path, raise_on_unknown_command=False):
-        _, extension = os.path.splitext(path.lower())
+        """
+        Parses a Gerber file into the layer. Files are memory-mapped and
+        tokenized as bytes, recording a checkpoint every CHECKPOINT_INTERVAL
+        statements so reread() can resume after an edit. path can also be an
+        open text stream, which is read without checkpoints.
+        """
+        if not isinstance(path, (str, os.PathLike)):
+            self._checkpoints = []
+            for item in self.iter_operations(path, raise_on_unknown_command):
+                self.add(item)
+            return self.operations, self.collection_of_region
+
+        name = self._file_name(path)
+        self._raise_on_unknown_command = raise_on_unknown_command
+        self._checkpoints = [self._checkpoint(0, 0, _digest(b""))]
+        with tokenizer.mapped(path) as data:
+            self._read_checkpointed(data, name)
+        return self.operations, self.collection_of_region
+
+    def reread(self, path, raise_on_unknown_command=False):
+        """
+        Re-reads the file last read, after an edit. Everything parsed before the
+        last checkpoint ahead of the first changed byte is kept and parsing
+        resumes from there; an unchanged file isn't parsed at all.
+        """
+        if not self._checkpoints:
+            return self.read(path, raise_on_unknown_command)
+        name = self._file_name(path)
+        self._raise_on_unknown_command = raise_on_unknown_command
+        with tokenizer.mapped(path) as data:
+            checkpoints = self._checkpoints
+            resume = 0
+            for index in range(1, len(checkpoints)):
+                start, end = checkpoints[index - 1].offset, checkpoints[index].offset
+                if _digest(data, start, end) != checkpoints[index].digest:
+                    break
+                resume = index
+            else:
+                tail = len(data), _digest(data, checkpoints[-1].offset)
+                if tail == self._tail:
+                    logging.info(f"Unchanged file: {name}")
+                    return self.operations, self.collection_of_region
+
+            checkpoint = checkpoints[resume]
+            del checkpoints[resume + 1 :]
+            self._restore(checkpoint)
+            logging.info(f"Resuming {name} at offset {checkpoint.offset}")
+            self._read_checkpointed(data, name)
+        return self.operations, self.collection_of_region
+
+    def iter_operations(
+        self, path, raise_on_unknown_command=False, chunk_size=tokenizer.CHUNK_SIZE
+    ) -> Iterator[Tuple[gf.GerberFormat, Any]]:
+        """
+        Lazily parses a Gerber file, yielding each operation as it is read.
+        Operations are yielded as (op_type, OperationState), completed regions
+        as (GerberFormat.REGION_END, region) and step and repeat statements as
+        (GerberFormat.STEP_AND_REPEAT, StepRepeat). Block apertures (AB) are added
+        to the layer's apertures; nothing else is stored on the layer.
+        path can also be an open text stream, e.g. a member of a zip file, which
+        is read chunk_size characters at a time.
+        """
+        name = self._file_name(path)
+        self._raise_on_unknown_command = raise_on_unknown_command
+        is_path = isinstance(path, (str, os.PathLike))
+        with (
+            tokenizer.mapped(path) if is_path else contextlib.nullcontext(path)
+        ) as source:
+            if is_path:
+                batches = tokenizer.tokenize_mapped(source)
+            else:
+                batches = tokenizer.tokenize_batches(source, chunk_size)
+            statements = 0
+            for tokens, _ in batches:
+                yield from self._items(name, tokens, statements)
+                statements += len(tokens)
+            item = self._close_step_and_repeat()  # files missing M02
+            if item is not None:
+                yield item
+
+    def _file_name(self, path) -> str:
+        is_path = isinstance(path, (str, os.PathLike))
+        name = os.fspath(path) if is_path else getattr(path, "name", "")
+        _, extension = os.path.splitext(name.lower())
         if extension not in gf.FILE_EXT_TO_NAME:
-            raise ValueError(f"Unknown file: {path}")
+            raise ValueError(f"Unknown file: {name}")
         file_type = gf.FILE_EXT_TO_NAME[extension]
 
         logging.info(f"Starting gerber layer importer:")
-        logging.info(f"\tFile: {path}")
+        logging.info(f"\tFile: {name}")
         logging.info(f"\tType: {file_type.upper()}")
-        multiline = False
-        with open(path, "r") as f:
-            buffer = ""
-            for index, line in enumerate(f.readlines()):
-                if not line.strip():
-                    continue
-                buffer += line
-                if line.count("%") not in [0, 2]:
-                    multiline = not multiline
-                if multiline:
-                    continue
-                buffer = buffer.strip()
-                if buffer.startswith("%") and buffer.endswith("%"):
-                    buffer = buffer[1:-1]
-                if buffer.endswith("*"):
-                    buffer = buffer[:-1]
-                logging.debug(f"Line: {index}, Processing: {buffer}")
-                self._process(buffer, raise_on_unknown_command)
-                buffer = ""
-        return self.operations, self.collection_of_region
+        return name
 
-    def _process(self, data, raise_on_unknown_command):
-        op_type, content = gf.GerberFormat.lookup(data)
-
-        if op_type in [
-            gf.GerberFormat.INTERP_MODE_LINEAR,
-            gf.GerberFormat.INTERP_MODE_CW,
-            gf.GerberFormat.INTERP_MODE_CCW,
-        ]:
-            self.interpolation = op_type
-            if content:  # this is rare and poor syntax
-                self._process(content, raise_on_unknown_command)
-        elif op_type == gf.GerberFormat.COMMENT:
-            if self._in_header:
-                self.header.append(content)
-            else:
-                self.comments.append(content)
-        elif op_type == gf.GerberFormat.UNITS:
-            self._in_header = False
-            self.units = Units(data[2:])
-            logging.info(f"Switching units to {self.units}")
-        elif op_type in [
-            gf.GerberFormat.DEPRECATED_UNITS_MM,
-            gf.GerberFormat.DEPRECATED_UNITS_INCH,
-        ]:
-            u = "MM" if op_type == gf.GerberFormat.DEPRECATED_UNITS_MM else "INCH"
-            self.units = Units(u)
-            logging.info(f"Switching units to {self.units}")
-        elif op_type in [
-            gf.GerberFormat.QUADMODE_SINGLE,
-            gf.GerberFormat.QUADMODE_MULTI,
-        ]:
-            logging.info(f"Switching quadrant mode to: {op_type}")
-            self.quadrant_mode = op_type
-        elif op_type == gf.GerberFormat.FORMAT:
-            self._set_format_spec(data)
-            logging.info(f"Got decimal places: {self.scalars}")
-        elif op_type == gf.GerberFormat.LOAD_POLARITY:
-            self.polarity = content == "D"
-            logging.info(f"Setting polarity to {self.polarity}")
-        elif op_type == gf.GerberFormat.APERTURE_DEFINE:
-            aperture = self.aperture_factory.from_aperture_define(
-                content, copy.deepcopy(self.comments)
+    def _items(self, name, tokens, statements):
+        # Items of a batch of tokens, less those stored in an open SR or AB block
+        if self.trace or self.trace_hook:
+            tokens = trace_lib.traced(
+                name, tokens, self.trace, self.trace_hook, statements
             )
-            self.apertures[aperture.index] = aperture
-            self.comments.clear()
-            logging.info(f"Add aperture: {aperture.index}")
-        elif op_type == gf.GerberFormat.APERTURE_MACRO:
-            self.aperture_factory.define_macro(content)
-            logging.info(f"Processed aperture macro: {content}")
-        elif op_type == gf.GerberFormat.SET_APERTURE:
-            self.current_aperture = int(data[1:])
-            logging.info(f"Current aperture set to: {self.current_aperture}")
-        elif op_type == gf.GerberFormat.ATTRIBUTE_FILE:
-            params = content.split(",")
-            self.attributes[params[0][1:]] = params[1:]
-        elif op_type in [
-            gf.GerberFormat.ATTRIBUTE_OBJECT,
-            gf.GerberFormat.ATTRIBUTE_DELETE,
-            gf.GerberFormat.ATTRIBUTE_APERTURE,
-        ]:
-            pass  # TODO: no-op for now - these are just comments
-        elif op_type in [
-            gf.GerberFormat.OPERATION_FLASH,
-            gf.GerberFormat.OPERATION_MOVE,
-            gf.GerberFormat.OPERATION_INTERP,
-        ]:
-            op = self._run_operation(content)
-            logging.info(f"Operation: {op_type}, point: {self.current_point}")
-            self.current_point = op.point
-            if self.region:
-                self._regions.append((op_type, op))
+        handlers = self._TOKEN_HANDLERS
+        for token in tokens:
+            item = handlers[type(token)](self, token)
+            if item is None:
+                continue
+            block = self._blocks[-1][1] if self._blocks else None
+            if block is not None:
+                block.add(item)
             else:
-                self.operations.append((op_type, op))
-        elif op_type in [gf.GerberFormat.REGION_START, gf.GerberFormat.REGION_END]:
-            self.region = op_type == gf.GerberFormat.REGION_START
-            if not self.region:
-                region = copy.deepcopy(self._regions)
-                self.collection_of_region.append(region)
-                self._regions.clear()
-            logging.info(f"{'START' if self.region else 'END'} Region")
-        elif op_type in [gf.GerberFormat.DEPRECATED_SELECT_APERTURE]:
-            self._process(content, raise_on_unknown_command)  # no-op
-        elif op_type in [
-            gf.GerberFormat.DEPRECATED_PROGRAM_STOP,
-            gf.GerberFormat.DEPRECATED_ABSOLUTE_NOTATION,
-        ]:
-            pass  # no-op
-        elif op_type == gf.GerberFormat.END_OF_FILE:
-            logging.info("End of file command.")
+                yield item
+
+    def _read_checkpointed(self, data, name):
+        # Parses mapped data from the last checkpoint on
+        checkpoint = self._checkpoints[-1]
+        start, statements = checkpoint.offset, checkpoint.statements
+        batches = tokenizer.tokenize_mapped(data, self.CHECKPOINT_INTERVAL, start)
+        for tokens, end in batches:
+            for item in self._items(name, tokens, statements):
+                self.add(item)
+            statements += len(tokens)
+            # Only checkpoint between regions and blocks, where nothing is pending
+            if not self.region and not self._blocks:
+                digest = _digest(data, start, end)
+                self._checkpoints.append(self._checkpoint(end, statements, digest))
+                start = end
+        item = self._close_step_and_repeat()  # files missing M02
+        if item is not None:
+            self.add(item)
+        self._tail = len(data), _digest(data, start)
+
+    def _checkpoint(self, offset, statements, digest) -> Checkpoint:
+        state = {name: getattr(self, name) for name in self._CHECKPOINT_STATE}
+        for name in ("apertures", "attributes", "header", "comments"):
+            state[name] = getattr(self, name).copy()
+        factory = self.aperture_factory
+        state["macros"] = factory.macros.copy(), factory._macro_map.copy()
+        sizes = (
+            len(self.operations),
+            len(self.collection_of_region),
+            len(self.step_repeats),
+        )
+        return Checkpoint(offset, statements, digest, sizes, state)
+
+    def _restore(self, checkpoint: Checkpoint):
+        operations, regions, step_repeats = checkpoint.sizes
+        if isinstance(self.operations, store_lib.OperationStore):
+            self.operations.truncate(operations)
+        else:
+            del self.operations[operations:]
+        if isinstance(self.collection_of_region, store_lib.RegionStore):
+            self.collection_of_region.truncate(regions)
         else:
-            logging.warning(f"Unknown command: {data}")
-            if raise_on_unknown_command:
-                raise ValueError(f"Unknown command: {data}")
+            del self.collection_of_region[regions:]
+        del self.region_positions[regions:]
+        del self.step_repeats[step_repeats:]
+        del self.step_repeat_positions[step_repeats:]
+        self._bounds = None
+
+        state = dict(checkpoint.state)
+        macros, macro_map = state.pop("macros")
+        self.aperture_factory.macros = macros.copy()
+        self.aperture_factory._macro_map = macro_map.copy()
+        for name, value in state.items():
+            setattr(self, name, value.copy() if hasattr(value, "copy") else value)
+        self.region = False
+        self._regions.clear()
+        self._blocks.clear()
+
+    def _command(self, command: tokenizer.Command):
+        handler = self._COMMAND_HANDLERS.get(command.op_type, GerberLayer._unknown)
+        return handler(self, command)
+
+    def _statement(self, data: str):
+        # Statements nested in another command, e.g. the content of a G01
+        item = None
+        for token in tokenizer.tokenize_buffer(data + "*")[0]:
+            item = self._TOKEN_HANDLERS[type(token)](self, token)
+        return item
+
+    def _set_interpolation(self, command: tokenizer.Command):
+        self.interpolation = command.op_type
+        if command.content:  # this is rare and poor syntax
+            return self._statement(command.content)
+
+    def _comment(self, command: tokenizer.Command):
+        if self._in_header:
+            self.header.append(command.content)
+        else:
+            self.comments.append(command.content)
+
+    def _set_units(self, command: tokenizer.Command):
+        self._in_header = False
+        self.units = Units(command.content)
+        logging.info(f"Switching units to {self.units}")
+
+    def _set_deprecated_units(self, command: tokenizer.Command):
+        mm = command.op_type == gf.GerberFormat.DEPRECATED_UNITS_MM
+        self.units = Units.MM if mm else Units.INCH
+        logging.info(f"Switching units to {self.units}")
+
+    def _set_quadrant_mode(self, command: tokenizer.Command):
+        logging.info(f"Switching quadrant mode to: {command.op_type}")
+        self.quadrant_mode = command.op_type
+
+    def _set_format(self, command: tokenizer.Command):
+        self._set_format_spec(command.data)
+        logging.info(f"Got decimal places: {self.scalars}")
+
+    def _set_polarity(self, command: tokenizer.Command):
+        self.polarity = command.content == "D"
+        logging.info(f"Setting polarity to {self.polarity}")
+
+    def _define_aperture(self, command: tokenizer.Command):
+        # The aperture takes the comments over, the next ones go to a new list
+        aperture = self.aperture_factory.from_aperture_define(
+            command.content, self.comments
+        )
+        self.apertures[aperture.index] = aperture
+        self.comments = []
+        logging.info(f"Add aperture: {aperture.index}")
+
+    def _define_macro(self, command: tokenizer.Command):
+        self.aperture_factory.define_macro(command.content)
+        logging.info(f"Processed aperture macro: {command.content}")
+
+    def _select_aperture(self, token: tokenizer.SelectAperture):
+        self.current_aperture = token.index
+
+    def _set_file_attribute(self, command: tokenizer.Command):
+        params = command.content.split(",")
+        self.attributes[params[0][1:]] = params[1:]
+
+    def _operation(self, token: tokenizer.Operation):
+        if token.interpolation:
+            self.interpolation = token.interpolation
+        op = self._run_operation(token)
+        self.current_point = op.point
+        if isinstance(op.point[0], tuple):  # arcs carry their center offset
+            self.current_point = op.point[0]
+        if self.region:
+            self._regions.append((token.op_type, op))
+        else:
+            return token.op_type, op
+
+    def _set_region(self, command: tokenizer.Command):
+        self.region = command.op_type == gf.GerberFormat.REGION_START
+        if not self.region:
+            # Handed over as is: the operation states are never modified
+            region, self._regions = self._regions, []
+            return command.op_type, region
+
+    def _close_step_and_repeat(self):
+        # The item of the open SR block, if it is the innermost open block
+        if self._blocks and self._blocks[-1][0] == gf.GerberFormat.STEP_AND_REPEAT:
+            _, block, offsets = self._blocks.pop()
+            if block is not None:
+                return gf.GerberFormat.STEP_AND_REPEAT, StepRepeat(block, offsets)
+
+    def _step_and_repeat(self, command: tokenizer.Command):
+        # SR blocks don't nest: a new SR closes the open one
+        item = self._close_step_and_repeat()
+        match = re.match(r"X(\d+)Y(\d+)I([\d.]+)J([\d.]+)", command.content)
+        if match:
+            nx, ny = int(match[1]), int(match[2])
+            step_x, step_y = float(match[3]), float(match[4])
+            steps = np.stack(np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij"))
+            offsets = steps.reshape(2, -1).T * (step_x, step_y)
+            offsets = tuple(map(tuple, offsets.tolist()))
+            # A single copy is drawn in place, without a block
+            block = Block(self._compact) if nx * ny > 1 else None
+            self._blocks.append((gf.GerberFormat.STEP_AND_REPEAT, block, offsets))
+        return item
+
+    def _aperture_block(self, command: tokenizer.Command):
+        if command.content:
+            index = int(command.content.lstrip("D"))
+            block = Block(self._compact)
+            self._blocks.append((gf.GerberFormat.APERTURE_BLOCK, block, index))
+            return
+        if not self._blocks or self._blocks[-1][0] != gf.GerberFormat.APERTURE_BLOCK:
+            raise ValueError("%AB*% without an open aperture block")
+        _, block, index = self._blocks.pop()
+        self.apertures[index] = aperture_lib.Aperture(index, True, block)
+        logging.info(f"Add block aperture: {index}")
+
+    def _deprecated_select_aperture(self, command: tokenizer.Command):
+        if command.content:
+            return self._statement(command.content)  # no-op
+
+    def _no_op(self, command: tokenizer.Command):
+        pass
+
+    def _end_of_file(self, command: tokenizer.Command):
+        logging.info("End of file command.")
+        # An SR left open is closed by the end of the file
+        return self._close_step_and_repeat()
+
+    def _unknown(self, command: tokenizer.Command):
+        logging.warning(f"Unknown command: {command.data}")
+        if self._raise_on_unknown_command:
+            raise ValueError(f"Unknown command: {command.data}")
+
+    _TOKEN_HANDLERS = {
+        tokenizer.Operation: _operation,
+        tokenizer.SelectAperture: _select_aperture,
+        tokenizer.Command: _command,
+    }
+    _COMMAND_HANDLERS = {
+        gf.GerberFormat.INTERP_MODE_LINEAR: _set_interpolation,
+        gf.GerberFormat.INTERP_MODE_CW: _set_interpolation,
+        gf.GerberFormat.INTERP_MODE_CCW: _set_interpolation,
+        gf.GerberFormat.COMMENT: _comment,
+        gf.GerberFormat.UNITS: _set_units,
+        gf.GerberFormat.DEPRECATED_UNITS_MM: _set_deprecated_units,
+        gf.GerberFormat.DEPRECATED_UNITS_INCH: _set_deprecated_units,
+        gf.GerberFormat.QUADMODE_SINGLE: _set_quadrant_mode,
+        gf.GerberFormat.QUADMODE_MULTI: _set_quadrant_mode,
+        gf.GerberFormat.FORMAT: _set_format,
+        gf.GerberFormat.LOAD_POLARITY: _set_polarity,
+        gf.GerberFormat.APERTURE_DEFINE: _define_aperture,
+        gf.GerberFormat.APERTURE_MACRO: _define_macro,
+        gf.GerberFormat.ATTRIBUTE_FILE: _set_file_attribute,
+        # TODO: no-op for now - these are just comments
+        gf.GerberFormat.ATTRIBUTE_OBJECT: _no_op,
+        gf.GerberFormat.ATTRIBUTE_DELETE: _no_op,
+        gf.GerberFormat.ATTRIBUTE_APERTURE: _no_op,
+        gf.GerberFormat.STEP_AND_REPEAT: _step_and_repeat,
+        gf.GerberFormat.APERTURE_BLOCK: _aperture_block,
+        gf.GerberFormat.REGION_START: _set_region,
+        gf.GerberFormat.REGION_END: _set_region,
+        gf.GerberFormat.DEPRECATED_SELECT_APERTURE: _deprecated_select_aperture,
+        gf.GerberFormat.DEPRECATED_PROGRAM_STOP: _no_op,
+        gf.GerberFormat.DEPRECATED_ABSOLUTE_NOTATION: _no_op,
+        gf.GerberFormat.END_OF_FILE: _end_of_file,
+    }
 
     def point_to_text(self, point):
+        if isinstance(point[0], tuple):  # arc end point and center offset
+            (i, j), point = point[1], point[0]
+            i = int(i * pow(10, self.decimal_digits.x))
+            j = int(j * pow(10, self.decimal_digits.y))
+            return f"{self.point_to_text(point)}I{i}J{j}"
         assert point[0] < pow(10, self.integer_digits.x), "Overflow x value"
         assert point[1] < pow(10, self.integer_digits.y), "Overflow y value"
         x = int(point[0] * pow(10, self.decimal_digits.x))
         y = int(point[1] * pow(10, self.decimal_digits.y))
         return f"X{x}Y{y}"
 
-    def write(self, filename):
-        def write_line(message: str, _file, grouped=False):
+    def write(self, output):
+        """
+        Writes the layer as a Gerber file to a path or a binary stream, e.g. a
+        gzip file or io.BytesIO. Operations are formatted in bulk from columns,
+        with blocks written out expanded; regions aren't written.
+        """
+
+        def line(message: str, grouped=False) -> str:
             message += "*"
             if grouped:
                 message = f"%{message}%"
-            _file.write(message + "\n")
+            return message + "\n"
 
         state = self.operations[0][1]
-        with open(filename, "w") as f:
-            current_aperture = None
-            for comment in self.header:
-                write_line(gf.GerberFormat.COMMENT.value + comment, f)
-            write_line(gf.GerberFormat.UNITS.value + state.units.value, f, True)
-            format_spec = gf.Point(
-                x=(self.integer_digits.x * 10 + self.decimal_digits.x),
-                y=(self.integer_digits.y * 10 + self.decimal_digits.y),
-            )
+        header = [line(gf.GerberFormat.COMMENT.value + c) for c in self.header]
+        header.append(line(gf.GerberFormat.UNITS.value + state.units.value, True))
+        format_spec = gf.Point(
+            x=(self.integer_digits.x * 10 + self.decimal_digits.x),
+            y=(self.integer_digits.y * 10 + self.decimal_digits.y),
+        )
+        header.append(line("FSLA" + format_spec.to_text(), True))
+        header.append(line(state.quadrant_mode.value))
+        for macro in self.aperture_factory.macros.values():
+            header.append(line(self.aperture_factory.macro_to_str(macro)))
+        for aperture in self.apertures.values():
+            if isinstance(aperture.shape, Block):
+                continue  # written out expanded
+            for comment in aperture.comments:
+                header.append(line(gf.GerberFormat.COMMENT.value + comment))
+            statement = self.aperture_factory.to_aperture_define(aperture)
+            header.append(line(statement, True))
+        polarity = gf.GerberFormat.LOAD_POLARITY.value
+        header.append(line(polarity + ("D" if state.polarity else "C"), True))
+
+        store = self._written_operations()
+        is_path = isinstance(output, (str, os.PathLike))
+        with (
+            open(output, "wb", buffering=WRITE_BUFFER)
+            if is_path
+            else contextlib.nullcontext(output)
+        ) as f:
+            f.write("".join(header).encode())
+            for text in _format_operations(
+                store, self.integer_digits, self.decimal_digits, state.quadrant_mode
+            ):
+                f.write(text.encode())
+            f.write(line(gf.GerberFormat.END_OF_FILE.value).encode())
 
-            write_line("FSLA" + format_spec.to_text(), f, True)
-            write_line(state.quadrant_mode.value, f)
-            for macro in self.aperture_factory.macros.values():
-                write_line(self.aperture_factory.macro_to_str(macro), f)
-            for aperture in self.apertures.values():
-                for comment in aperture.comments:
-                    write_line(gf.GerberFormat.COMMENT.value + comment, f)
-                statement = self.aperture_factory.to_aperture_define(aperture)
-                write_line(statement, f, True)
-            polarity = gf.GerberFormat.LOAD_POLARITY.value
-            polarity += "D" if state.polarity else "C"
-            write_line(polarity, f, True)
-            for op_type, op in self.operations:
-                if op.aperture and op.aperture != current_aperture:
-                    write_line(f"D{op.aperture.index}", f)
-                    current_aperture = op.aperture
-                write_line(self.point_to_text(op.point) + op_type.value, f)
-            write_line(gf.GerberFormat.END_OF_FILE.value, f)
+    def _written_operations(self) -> store_lib.OperationStore:
+        # Operations in draw order with blocks expanded, less regions
+        blocks = self.step_repeats or any(
+            isinstance(a.shape, Block) for a in self.apertures.values()
+        )
+        if not blocks:
+            return store_lib.as_store(self.operations, OperationState)
+        store = store_lib.OperationStore(OperationState)
+        store.extend(
+            item for item in self.expand() if item[0] != gf.GerberFormat.REGION_END
+        )
+        return store
 
     def scale(self, point):
-        x = round(point[0] * self.scalars[0], self.decimal_digits.x)
-        y = round(point[1] * self.scalars[1], self.decimal_digits.y)
-        return x, y
+        return self.scale_x(point[0]), self.scale_y(point[1])
 
-    def _run_operation(self, content: str):
-        values = re.findall(r"[A-Z]([\+|-]*\d+)", content)
-        assert len(values) in [2, 4], f"Invalid operation parsing: {content}"
+    def scale_x(self, value):
+        return round(value * self.scalars[0], self.decimal_digits.x)
+
+    def scale_y(self, value):
+        return round(value * self.scalars[1], self.decimal_digits.y)
+
+    def _run_operation(self, token: tokenizer.Operation):
         assert self.region or self.current_aperture, "Invalid operation: no aperture!"
 
-        point = self.scale((float(values[0]), float(values[1])))
-        if len(values) == 4:
-            x, y, i, j = values
-            point = self.scale((float(x), float(y))), self.scale((float(i), float(j)))
+        # Omitted coordinates keep the value of the current point
+        current_x, current_y = self.current_point or (0.0, 0.0)
+        point = (
+            current_x if token.x is None else self.scale_x(token.x),
+            current_y if token.y is None else self.scale_y(token.y),
+        )
+        if token.i is not None or token.j is not None:
+            offset = self.scale_x(token.i or 0), self.scale_y(token.j or 0)
+            point = point, offset
         if self.region:
             return self.get_operation_state(None, point)
 
@@ -292,8 +954,9 @@ class GerberLayer:
     def flash(
         self, aperture: aperture_lib.APERTURES, position: Tuple[float, float]
     ) -> None:
-        if aperture not in self.apertures:
+        if aperture not in self.apertures.values():
             index = len(self.apertures) + 1
             self.apertures[index] = aperture
         state = self.get_operation_state(aperture, position)
         self.operations.append((gf.GerberFormat.OPERATION_FLASH, state))
+        self._bounds = None
@@ -0,0 +1,428 @@
+import bisect
+import itertools
+from collections.abc import Sequence
+from typing import Any, List, NamedTuple, Tuple
+
+import numpy as np
+
+import pygerber.standards.gerber as gf
+
+OPERATION_CODES = [
+    gf.GerberFormat.OPERATION_INTERP,
+    gf.GerberFormat.OPERATION_MOVE,
+    gf.GerberFormat.OPERATION_FLASH,
+]
+INTERPOLATION_CODES = [
+    None,
+    gf.GerberFormat.INTERP_MODE_LINEAR,
+    gf.GerberFormat.INTERP_MODE_CW,
+    gf.GerberFormat.INTERP_MODE_CCW,
+]
+NO_APERTURE = -1
+
+_FLOAT_COLUMNS = ["x", "y", "prev_x", "prev_y", "i", "j"]
+_CODE_COLUMNS = {"op": np.int8, "interpolation": np.int8, "aperture": np.int32}
+_NO_VALUE = object()  # before the first run
+REGION_BATCH = 1024  # regions appended to a RegionStore before they are stored
+
+
+def _pairs(pairs: List[Tuple[float, float]]) -> np.ndarray:
+    """The two columns of a list of pairs"""
+    flat = itertools.chain.from_iterable(pairs)
+    return np.fromiter(flat, np.float64, 2 * len(pairs)).reshape(-1, 2).T
+
+
+def _codes(values: List[Any], table: List[Any]) -> np.ndarray:
+    """Index of every value in table"""
+    # Looked up by identity first, enum members hash in Python code
+    by_id = {id(value): code for code, value in enumerate(table)}
+    try:
+        codes = map(by_id.__getitem__, map(id, values))
+        return np.fromiter(codes, np.int8, len(values))
+    except KeyError:
+        pass
+    codes = {value: code for code, value in enumerate(table)}
+    try:
+        return np.fromiter(map(codes.__getitem__, values), np.int8, len(values))
+    except KeyError as error:
+        raise ValueError(f"{error.args[0]} is not in {table}") from None
+
+
+class RunLengthColumn:
+    """
+    A column of values that rarely change, stored as runs of (start index, value)
+    """
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.values: List[Any] = []
+
+    def append(self, index: int, value: Any):
+        if not self.values or self.values[-1] != value:
+            self.starts.append(index)
+            self.values.append(value)
+
+    def __getitem__(self, index: int):
+        return self.values[bisect.bisect_right(self.starts, index) - 1]
+
+    def extend(self, start: int, values: List[Any]):
+        """Appends values for the indices from start on"""
+        last = self.values[-1] if self.values else _NO_VALUE
+        for index, value in enumerate(values, start):
+            if value is not last and value != last:
+                self.starts.append(index)
+                self.values.append(value)
+                last = value
+
+    def truncate(self, size: int):
+        """Drops the runs starting at or after index size"""
+        keep = bisect.bisect_left(self.starts, size)
+        del self.starts[keep:]
+        del self.values[keep:]
+
+    def runs(self, size: int) -> List[Tuple[int, int, Any]]:
+        """Returns the runs as (start, stop, value) for a column of `size` items"""
+        stops = self.starts[1:] + [size]
+        return list(zip(self.starts, stops, self.values))
+
+
+class OperationStore(Sequence):
+    """
+    Compact columnar storage for Gerber operations.
+    Coordinates are kept in contiguous float64 arrays, the operation type,
+    interpolation and aperture as small integer codes, and the rarely changing
+    parameters (polarity, units, quadrant mode, scalars) are run-length encoded.
+    Indexing and iterating yield (GerberFormat, OperationState) tuples so the store
+    can stand in for the list in GerberLayer.operations.
+    """
+
+    def __init__(self, state_type: NamedTuple):
+        self._state_type = state_type
+        self._size = 0
+        self._columns = {name: np.empty(0, np.float64) for name in _FLOAT_COLUMNS}
+        self._columns.update(
+            {name: np.empty(0, dtype) for name, dtype in _CODE_COLUMNS.items()}
+        )
+        self.apertures = []
+        self._aperture_codes = {}
+        self.polarity = RunLengthColumn()
+        self.units = RunLengthColumn()
+        self.quadrant_mode = RunLengthColumn()
+        self.scalars = RunLengthColumn()
+
+    def __len__(self):
+        return self._size
+
+    def __getattr__(self, name):
+        # Column views, e.g. store.x or store.op
+        columns = self.__dict__.get("_columns", {})
+        if name in columns:
+            return columns[name][: self._size]
+        raise AttributeError(name)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Operation index out of range")
+        row = {name: column[index].item() for name, column in self._columns.items()}
+        return self._build(
+            row,
+            self.polarity[index],
+            self.units[index],
+            self.quadrant_mode[index],
+            self.scalars[index],
+        )
+
+    def __iter__(self):
+        columns = {name: self.__getattr__(name).tolist() for name in self._columns}
+        rows = (dict(zip(columns, values)) for values in zip(*columns.values()))
+        polarity = self._expand(self.polarity)
+        units = self._expand(self.units)
+        quadrant_mode = self._expand(self.quadrant_mode)
+        scalars = self._expand(self.scalars)
+        for row, p, u, q, s in zip(rows, polarity, units, quadrant_mode, scalars):
+            yield self._build(row, p, u, q, s)
+
+    def __eq__(self, other):
+        if isinstance(other, OperationStore):
+            if len(self) != len(other):
+                return False
+            same_columns = all(
+                np.array_equal(getattr(self, n), getattr(other, n), equal_nan=True)
+                for n in _FLOAT_COLUMNS
+            )
+            if not same_columns:
+                return False
+        if isinstance(other, (OperationStore, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_columns"] = {
+            n: c[: self._size].copy() for n, c in self._columns.items()
+        }
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._aperture_codes = {id(a): i for i, a in enumerate(self.apertures)}
+
+    def append(self, item: Tuple[gf.GerberFormat, Any]):
+        op_type, state = item
+        if self._size == len(self._columns["x"]):
+            self._grow()
+        index = self._size
+        point = state.point
+        if isinstance(point[0], tuple):
+            (x, y), (i, j) = point
+        else:
+            (x, y), (i, j) = point, (np.nan, np.nan)
+        previous = state.previous_point or (np.nan, np.nan)
+        columns = self._columns
+        columns["x"][index], columns["y"][index] = x, y
+        columns["i"][index], columns["j"][index] = i, j
+        columns["prev_x"][index], columns["prev_y"][index] = previous[:2]
+        columns["op"][index] = OPERATION_CODES.index(op_type)
+        columns["interpolation"][index] = INTERPOLATION_CODES.index(state.interpolation)
+        columns["aperture"][index] = self._aperture_code(state.aperture)
+        self.polarity.append(index, state.polarity)
+        self.units.append(index, state.units)
+        self.quadrant_mode.append(index, state.quadrant_mode)
+        self.scalars.append(index, state.scalars)
+        self._size += 1
+
+    def extend(self, items):
+        """Appends many operations, filling the columns in bulk"""
+        items = list(items)
+        if not items:
+            return
+        count = len(items)
+        while self._size + count > len(self._columns["x"]):
+            self._grow()
+        rows = slice(self._size, self._size + count)
+        op_types, states = zip(*items)
+        # One transpose of the states into a tuple per field
+        fields = dict(zip(self._state_type._fields, zip(*states)))
+        nan = (np.nan, np.nan)
+        columns = self._columns
+        points = fields["point"]
+        if any(isinstance(point[0], tuple) for point in points):
+            arcs = [isinstance(point[0], tuple) for point in points]
+            ends = [p[0] if arc else p for p, arc in zip(points, arcs)]
+            offsets = [p[1] if arc else nan for p, arc in zip(points, arcs)]
+            columns["x"][rows], columns["y"][rows] = _pairs(ends)
+            columns["i"][rows], columns["j"][rows] = _pairs(offsets)
+        else:
+            columns["x"][rows], columns["y"][rows] = _pairs(points)
+            columns["i"][rows] = columns["j"][rows] = np.nan
+        previous = [(point or nan)[:2] for point in fields["previous_point"]]
+        columns["prev_x"][rows], columns["prev_y"][rows] = _pairs(previous)
+        columns["op"][rows] = _codes(op_types, OPERATION_CODES)
+        interpolations = fields["interpolation"]
+        columns["interpolation"][rows] = _codes(interpolations, INTERPOLATION_CODES)
+        # Consecutive operations mostly share their aperture
+        codes, last, code = [], _NO_VALUE, NO_APERTURE
+        for aperture in fields["aperture"]:
+            if aperture is not last:
+                last = aperture
+                code = self._aperture_code(last)
+            codes.append(code)
+        columns["aperture"][rows] = codes
+        self.polarity.extend(self._size, fields["polarity"])
+        self.units.extend(self._size, fields["units"])
+        self.quadrant_mode.extend(self._size, fields["quadrant_mode"])
+        self.scalars.extend(self._size, fields["scalars"])
+        self._size += count
+
+    def truncate(self, size: int):
+        """Drops the operations from index size on, keeping the capacity"""
+        self._size = min(size, self._size)
+        for column in (self.polarity, self.units, self.quadrant_mode, self.scalars):
+            column.truncate(self._size)
+
+    def section(self, start: int, stop: int) -> "OperationStore":
+        """A new store of the operations from index start up to stop"""
+        section = OperationStore(self._state_type)
+        section._size = max(0, stop - start)
+        section._columns = {
+            name: column[start:stop].copy() for name, column in self._columns.items()
+        }
+        section.apertures = list(self.apertures)
+        section._aperture_codes = dict(self._aperture_codes)
+        for name in ("polarity", "units", "quadrant_mode", "scalars"):
+            column = getattr(section, name)
+            for first, last, value in getattr(self, name).runs(self._size):
+                if first < stop and last > start:
+                    column.append(max(first, start) - start, value)
+        return section
+
+    def nbytes(self) -> int:
+        """Bytes used by the coordinate and code columns"""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def _aperture_code(self, aperture) -> int:
+        if aperture is None:
+            return NO_APERTURE
+        key = id(aperture)
+        if key not in self._aperture_codes:
+            self._aperture_codes[key] = len(self.apertures)
+            self.apertures.append(aperture)
+        return self._aperture_codes[key]
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._columns["x"]))
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[: self._size] = column[: self._size]
+            self._columns[name] = grown
+
+    def _expand(self, column: RunLengthColumn):
+        for start, stop, value in column.runs(self._size):
+            for _ in range(stop - start):
+                yield value
+
+    def _build(self, row, polarity, units, quadrant_mode, scalars):
+        point = (row["x"], row["y"])
+        if row["i"] == row["i"]:  # NaN when the operation has no offsets
+            point = point, (row["i"], row["j"])
+        previous = None
+        if row["prev_x"] == row["prev_x"]:
+            previous = (row["prev_x"], row["prev_y"])
+        aperture = None
+        if row["aperture"] != NO_APERTURE:
+            aperture = self.apertures[row["aperture"]]
+        state = self._state_type(
+            aperture=aperture,
+            interpolation=INTERPOLATION_CODES[row["interpolation"]],
+            point=point,
+            previous_point=previous,
+            polarity=polarity,
+            quadrant_mode=quadrant_mode,
+            scalars=scalars,
+            units=units,
+        )
+        return OPERATION_CODES[row["op"]], state
+
+
+def as_store(operations, state_type: NamedTuple) -> OperationStore:
+    """Returns operations as an OperationStore, converting a list if needed"""
+    if isinstance(operations, OperationStore):
+        return operations
+    store = OperationStore(state_type)
+    store.extend(operations)
+    return store
+
+
+class RegionStore(Sequence):
+    """
+    Compact storage for Gerber regions: the operations of every region's
+    contours in one OperationStore, region k being its rows offsets[k] up to
+    offsets[k + 1]. Indexing and iterating yield lists of (GerberFormat,
+    OperationState) tuples so the store can stand in for the list in
+    GerberLayer.collection_of_region. Appended regions are stored in batches of
+    REGION_BATCH, or when the store is next read.
+    """
+
+    def __init__(self, state_type: NamedTuple):
+        self._contours = OperationStore(state_type)
+        self._offsets = np.zeros(16, np.int64)
+        self._size = 0
+        self._pending = []
+
+    def __len__(self):
+        return self._size + len(self._pending)
+
+    @property
+    def contours(self) -> OperationStore:
+        self._flush()
+        return self._contours
+
+    @property
+    def offsets(self) -> np.ndarray:
+        self._flush()
+        return self._offsets[: self._size + 1]
+
+    def __getitem__(self, index):
+        self._flush()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("Region index out of range")
+        start, stop = self._offsets[index : index + 2].tolist()
+        return self._contours[start:stop]
+
+    def __iter__(self):
+        operations = iter(self.contours)
+        for size in np.diff(self.offsets).tolist():
+            yield list(itertools.islice(operations, size))
+
+    def __eq__(self, other):
+        if isinstance(other, RegionStore):
+            if not np.array_equal(self.offsets, other.offsets):
+                return False
+            return self.contours == other.contours
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __getstate__(self):
+        self._flush()
+        state = self.__dict__.copy()
+        state["_offsets"] = self.offsets.copy()
+        return state
+
+    def append(self, region: List[Tuple[gf.GerberFormat, Any]]):
+        self._pending.append(region)
+        if len(self._pending) >= REGION_BATCH:
+            self._flush()
+
+    def extend(self, regions):
+        """Appends many regions, filling the contour columns in bulk"""
+        self._pending.extend(regions)
+        self._flush()
+
+    def _flush(self):
+        regions, self._pending = self._pending, []
+        if not regions:
+            return
+        self._contours.extend(itertools.chain.from_iterable(regions))
+        count = len(regions)
+        if self._size + count >= len(self._offsets):
+            capacity = max(2 * len(self._offsets), self._size + count + 1)
+            grown = np.zeros(capacity, np.int64)
+            grown[: self._size + 1] = self._offsets[: self._size + 1]
+            self._offsets = grown
+        sizes = np.fromiter(map(len, regions), np.int64, count)
+        rows = slice(self._size + 1, self._size + count + 1)
+        self._offsets[rows] = self._offsets[self._size] + np.cumsum(sizes)
+        self._size += count
+
+    def truncate(self, size: int):
+        """Drops the regions from index size on, keeping the capacity"""
+        self._flush()
+        self._size = min(size, self._size)
+        self._contours.truncate(int(self._offsets[self._size]))
+
+    def store(self, index: int) -> OperationStore:
+        """The operations of one region as an OperationStore"""
+        start, stop = self.offsets[index : index + 2].tolist()
+        return self.contours.section(start, stop)
+
+    def nbytes(self) -> int:
+        """Bytes used by the contour columns and the offsets"""
+        return self.contours.nbytes() + self.offsets.nbytes
+
+
+def as_region_store(regions, state_type: NamedTuple) -> RegionStore:
+    """Returns regions as a RegionStore, converting a list if needed"""
+    if isinstance(regions, RegionStore):
+        return regions
+    store = RegionStore(state_type)
+    store.extend(regions)
+    return store
@@ -0,0 +1,545 @@
+import math
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import pygerber.aperture as aperture_lib
+import pygerber.arcs as arcs_lib
+import pygerber.drill_layer as drl
+import pygerber.geometry as geometry_lib
+import pygerber.gerber_layer as gl
+import pygerber.operation_store as store_lib
+import pygerber.spatial as spatial
+from pygerber.standards.gerber import GerberFormat
+from pygerber.standards.nc_drill import NCDrillFormat
+
+MM_PER_INCH = 25.4
+DARK = 255
+CLEAR = 0
+TILE_SIZE = 2048
+
+
+class _Geometry:
+    """Circles and polygons of one polarity batch, in layer units"""
+
+    def __init__(self):
+        self.circles = []
+        self.polygons = []
+        self.offset = 0.0, 0.0  # where the origin of a placed block is drawn
+
+    def add_circles(self, x, y, r):
+        x, y, r = np.broadcast_arrays(*(np.asarray(v, np.float64) for v in (x, y, r)))
+        self.circles.append((x, y, r))
+
+    def add_polygons(self, polygons: geometry_lib.Polygons):
+        self.polygons.append(polygons)
+
+    def as_polygons(self, tolerance) -> geometry_lib.Polygons:
+        """Everything in the batch as polygons placed at offset, circles as chords"""
+        polygons = list(self.polygons)
+        for x, y, r in self.circles:
+            for radius in np.unique(r):
+                ring = geometry_lib.circle(0.0, 0.0, radius, tolerance)
+                template = geometry_lib.from_rings([ring])
+                selected = r == radius
+                polygons.append(
+                    geometry_lib.instances(template, x[selected], y[selected])
+                )
+        return geometry_lib.concatenate(polygons).transform(
+            dx=self.offset[0], dy=self.offset[1]
+        )
+
+    def spans(self, scale, dx, dy, height, width):
+        """
+        Pixel spans (row, first column, end column) covered in a height x width
+        tile, where layer point (x, y) is at pixel (scale * x + dx, dy - scale * y).
+        A pixel is covered when its center is inside a shape.
+        """
+        dx, dy = dx + scale * self.offset[0], dy - scale * self.offset[1]
+        spans = [
+            _circle_spans(scale * x + dx, dy - scale * y, scale * r, height)
+            for x, y, r in self.circles
+        ]
+        if self.polygons:
+            polygons = geometry_lib.concatenate(self.polygons)
+            spans.append(_ring_spans(polygons.transform(scale, dx, dy, True), height))
+        if not spans:
+            return tuple(np.empty(0, np.int64) for _ in range(3))
+        row, starts, stops = (np.concatenate(column) for column in zip(*spans))
+        first = np.clip(np.ceil(starts - 0.5), 0, width)
+        end = np.clip(np.ceil(stops - 0.5), 0, width)
+        return row, first.astype(np.int64), end.astype(np.int64)
+
+
+def _expand_rows(low, high, height):
+    """Rows whose centers lie in [low, high), repeated per shape"""
+    first = np.clip(np.ceil(low - 0.5), 0, height).astype(np.int64)
+    stop = np.clip(np.ceil(high - 0.5), 0, height).astype(np.int64)
+    counts = np.maximum(stop - first, 0)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    steps = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, first[owner] + steps
+
+
+def _circle_spans(cx, cy, r, height):
+    owner, row = _expand_rows(cy - r, cy + r, height)
+    dy = row + 0.5 - cy[owner]
+    half = np.sqrt(np.maximum(r[owner] ** 2 - dy**2, 0))
+    return row, cx[owner] - half, cx[owner] + half
+
+
+def _ring_spans(polygons: geometry_lib.Polygons, height):
+    # Scanline crossings of every edge, paired up per polygon and row
+    start, end = polygons.edges()
+    x0, y0 = polygons.vertices[start].T
+    x1, y1 = polygons.vertices[end].T
+    polygon = np.repeat(polygons.ring_polygons, polygons.ring_sizes)
+    edge, row = _expand_rows(np.minimum(y0, y1), np.maximum(y0, y1), height)
+    ex0, ey0 = x0[edge], y0[edge]
+    x = ex0 + (row + 0.5 - ey0) * (x1[edge] - ex0) / (y1[edge] - ey0)
+    order = np.lexsort((x, row, polygon[edge]))
+    x, row = x[order], row[order]
+    return row[0::2], x[0::2], x[1::2]
+
+
+def _fingerprint(value) -> float:
+    """Hash of a value's repr, exact in a float64"""
+    return float(hash(repr(value)) % (1 << 52))
+
+
+def _paint(tile: np.ndarray, rows, starts, stops, value):
+    keep = stops > starts
+    if not keep.any():
+        return
+    rows, starts, stops = rows[keep], starts[keep], stops[keep]
+    top, left = rows.min(), starts.min()
+    height, width = rows.max() - top + 1, stops.max() - left
+    # Coverage counts per pixel, so overlapping spans within a batch are a union
+    coverage = np.zeros((height, width + 1), np.int32)
+    np.add.at(coverage, (rows - top, starts - left), 1)
+    np.add.at(coverage, (rows - top, stops - left), -1)
+    covered = np.cumsum(coverage[:, :-1], axis=1, dtype=np.int32) > 0
+    tile[top : top + height, left : left + width][covered] = value
+
+
+class _GerberScene:
+    """
+    Gerber layer or block primitives, indexed by the ids of build_index. Step
+    and repeat copies and block aperture flashes are drawn from one scene per
+    block, moved to where they are placed.
+    """
+
+    def __init__(self, layer: gl.Primitives, geometry: geometry_lib.ApertureGeometry):
+        units = getattr(layer, "units", None)
+        self.mm = MM_PER_INCH if units == gl.Units.INCH else 1.0
+        self.store = store_lib.as_store(layer.operations, gl.OperationState)
+        self.regions = store_lib.as_region_store(
+            layer.collection_of_region, gl.OperationState
+        )
+        self.placements = layer.placements()
+        self.index = spatial.SpatialIndex(layer.primitive_bounds())
+        count, regions = len(self.store), len(self.regions)
+        size = count + regions + len(self.placements)
+        self.polarity = np.ones(size, dtype=bool)
+        for start, stop, polarity in self.store.polarity.runs(count):
+            self.polarity[start:stop] = polarity is not False
+        contours, offsets = self.regions.contours, self.regions.offsets
+        for start, stop, polarity in contours.polarity.runs(len(contours)):
+            # Regions take the polarity of their first operation
+            first = (offsets[:-1] >= start) & (offsets[:-1] < stop)
+            first &= offsets[1:] > offsets[:-1]
+            self.polarity[count : count + regions][first] = polarity is not False
+        # Placed blocks, drawn by their own scene
+        self.nested = np.zeros(size, dtype=bool)
+        self.nested[count + regions :] = True
+        blocks = [
+            code
+            for code, aperture in enumerate(self.store.apertures)
+            if isinstance(aperture.shape, gl.Block)
+        ]
+        flash = store_lib.OPERATION_CODES.index(GerberFormat.OPERATION_FLASH)
+        self.nested[:count] = np.isin(self.store.aperture, blocks)
+        self.nested[:count] &= self.store.op == flash
+        self._scenes = {}
+
+        # Regions are drawn before the operation read after them, step and
+        # repeats after the regions read before them
+        positions = getattr(layer, "region_positions", [])
+        if len(positions) != len(self.regions):
+            positions = [0] * len(self.regions)
+        repeats = [
+            (position, before)
+            for (position, before), step_repeat in zip(
+                layer.step_repeat_positions, layer.step_repeats
+            )
+            for _ in step_repeat.offsets
+        ]
+        repeats = np.array(repeats, dtype=np.float64).reshape(-1, 2)
+        self.order = np.concatenate(
+            [
+                2 * np.arange(count) + 1,
+                2 * np.asarray(positions, dtype=np.int64),
+                2 * repeats[:, 0],
+            ]
+        )
+        self.suborder = np.concatenate(
+            [np.zeros(count), np.arange(regions), repeats[:, 1] - 0.5]
+        )
+        self.geometry = geometry
+        # Circular draws, flattened at the tolerance of each draw call
+        arc_ids, self.arcs = arcs_lib.store_arcs(self.store)
+        self.arc_of = np.full(count, -1, dtype=np.int64)
+        self.arc_of[arc_ids] = np.arange(len(arc_ids))
+        self._contours = {}
+        self._signatures = None
+
+    def draw(
+        self, box, tolerance, offset=(0.0, 0.0), invert=False
+    ) -> Iterator[Tuple[bool, _Geometry]]:
+        """
+        Geometry of the primitives in box, in draw order and batches of one
+        polarity. offset is where the scene's origin is drawn, invert swaps the
+        polarity of everything.
+        """
+        ids = self._ordered(self.index.query_bbox(*box))
+        if not len(ids):
+            return
+        nested, polarity = self.nested[ids], self.polarity[ids]
+        changes = (polarity[1:] != polarity[:-1]) | nested[1:] | nested[:-1]
+        for batch in np.split(ids, np.nonzero(changes)[0] + 1):
+            first = batch[0]
+            if not self.nested[first]:
+                geometry = self._geometry(batch, tolerance)
+                geometry.offset = offset
+                yield bool(self.polarity[first]) != invert, geometry
+                continue
+            block, x, y, clear = self._placement(first)
+            xmin, ymin, xmax, ymax = box
+            yield from self._scene(block).draw(
+                (xmin - x, ymin - y, xmax - x, ymax - y),
+                tolerance,
+                (offset[0] + x, offset[1] + y),
+                invert != clear,
+            )
+
+    def contents(self, box) -> Optional[np.ndarray]:
+        """
+        Signatures of the primitives in box in draw order: scenes with equal
+        contents draw the box alike. None when blocks are placed in the box.
+        """
+        ids = self._ordered(self.index.query_bbox(*box))
+        if self.nested[ids].any():
+            return None
+        return self.signatures()[ids]
+
+    def signatures(self) -> np.ndarray:
+        """One row per primitive of everything that changes how it is drawn"""
+        if self._signatures is None:
+            store, count = self.store, len(self.store)
+            single = np.zeros(count, dtype=bool)
+            for start, stop, mode in store.quadrant_mode.runs(count):
+                single[start:stop] = mode == GerberFormat.QUADMODE_SINGLE
+            apertures = np.array(
+                [_fingerprint(aperture) for aperture in store.apertures] or [np.nan]
+            )
+            rows = np.full((len(self.polarity), 11), np.nan)
+            columns = store.x, store.y, store.prev_x, store.prev_y, store.i, store.j
+            rows[:count, :6] = np.column_stack(columns)
+            rows[:count, 6] = store.op
+            rows[:count, 7] = store.interpolation
+            rows[:count, 8] = single
+            rows[:count, 9] = apertures[store.aperture]
+            regions = slice(count, count + len(self.regions))
+            rows[regions, 9] = [_fingerprint(region) for region in self.regions]
+            rows[:, 10] = self.polarity
+            self._signatures = rows
+        return self._signatures
+
+    def _ordered(self, ids) -> np.ndarray:
+        return ids[np.lexsort((ids, self.suborder[ids], self.order[ids]))]
+
+    def _placement(self, index) -> gl.Placement:
+        count = len(self.store)
+        if index >= count:
+            return self.placements[index - count - len(self.regions)]
+        _, state = self.store[index]
+        x, y = state.point
+        return gl.Placement(state.aperture.shape, x, y, state.polarity is False)
+
+    def _scene(self, block: gl.Block) -> "_GerberScene":
+        if id(block) not in self._scenes:
+            self._scenes[id(block)] = _GerberScene(block, self.geometry)
+        return self._scenes[id(block)]
+
+    def _template(self, code, tolerance) -> geometry_lib.Polygons:
+        return self.geometry.polygons(self.store.apertures[code], tolerance)
+
+    def _geometry(self, ids, tolerance) -> _Geometry:
+        geometry = _Geometry()
+        store, count = self.store, len(self.store)
+        operations = ids[ids < count]
+        codes = store_lib.OPERATION_CODES
+        kind = store.op[operations]
+        flashes = operations[kind == codes.index(GerberFormat.OPERATION_FLASH)]
+        draws = operations[kind == codes.index(GerberFormat.OPERATION_INTERP)]
+
+        for code in np.unique(store.aperture[flashes]):
+            selected = flashes[store.aperture[flashes] == code]
+            x, y = store.x[selected], store.y[selected]
+            shape = store.apertures[code].shape
+            if self._is_plain_circle(store.apertures[code]):
+                geometry.add_circles(x, y, shape.r)
+            else:
+                template = self._template(code, tolerance)
+                geometry.add_polygons(geometry_lib.instances(template, x, y))
+
+        # Straight draws and the chords of arcs, stroked per aperture
+        arcs = self.arc_of[draws]
+        lines = draws[arcs < 0]
+        chords = arcs_lib.flatten(self.arcs.take(arcs[arcs >= 0]), tolerance)
+        code = np.concatenate(
+            [store.aperture[lines], store.aperture[draws[arcs >= 0]][chords.owners()]]
+        )
+        x0, y0, x1, y1 = (
+            np.concatenate([line, chord])
+            for line, chord in zip(
+                (
+                    store.prev_x[lines],
+                    store.prev_y[lines],
+                    store.x[lines],
+                    store.y[lines],
+                ),
+                chords.segments(),
+            )
+        )
+        for aperture in np.unique(code):
+            selected = code == aperture
+            ends = x0[selected], y0[selected], x1[selected], y1[selected]
+            self._stroke(geometry, aperture, *ends, tolerance)
+
+        for index in (ids[ids >= count] - count).tolist():
+            geometry.add_polygons(self._region(index, tolerance))
+        return geometry
+
+    @staticmethod
+    def _is_plain_circle(aperture):
+        shape = aperture.shape
+        return isinstance(shape, aperture_lib.ApertureCircle) and not (
+            shape.cx or shape.cy or shape.hole or aperture.hole
+        )
+
+    def _stroke(self, geometry: _Geometry, code, x0, y0, x1, y1, tolerance):
+        aperture = self.store.apertures[code]
+        if self._is_plain_circle(aperture):
+            r = aperture.shape.r
+            geometry.add_polygons(geometry_lib.capsules(x0, y0, x1, y1, r, tolerance))
+            return
+        polygons = self._template(code, tolerance)
+        if len(polygons.ring_polygons) != 1:
+            raise NotImplementedError(f"Drawing with aperture {aperture.index}")
+        # Convex outlines only
+        geometry.add_polygons(geometry_lib.sweeps(polygons.vertices, x0, y0, x1, y1))
+
+    def _region(self, index, tolerance) -> geometry_lib.Polygons:
+        # A move inside a region starts a new contour
+        key = index, tolerance
+        if key not in self._contours:
+            region = self.regions.store(index)
+            points = arcs_lib.path_points(region, tolerance)
+            move = store_lib.OPERATION_CODES.index(GerberFormat.OPERATION_MOVE)
+            starts = points.offsets[:-1][region.op == move]
+            contours = np.split(points.vertices, starts)
+            self._contours[key] = geometry_lib.from_rings(
+                [contour for contour in contours if len(contour) > 2]
+            )
+        return self._contours[key]
+
+
+class _DrillScene:
+    """Drill hits and rout segments, indexed by operation like DrillLayer"""
+
+    def __init__(self, layer: drl.DrillLayer):
+        self.mm = (
+            MM_PER_INCH if layer.units == NCDrillFormat.SET_UNIT_INCH.value else 1.0
+        )
+        self.index = spatial.SpatialIndex(layer.primitive_bounds())
+        # Circular routs without an A word radius are drawn as chords
+        arrays = layer.arrays()
+        self.x, self.y, self.px, self.py = arrays.x, arrays.y, arrays.px, arrays.py
+        self.r, self.hit, self.segment = arrays.r, arrays.hit, arrays.segment
+        self.radius, self.clockwise = arrays.radius, arrays.clockwise
+
+    def contents(self, box) -> np.ndarray:
+        """Hits and rout segments in box, in operation order"""
+        ids = np.sort(self.index.query_bbox(*box))
+        columns = (self.x, self.y, self.r, self.hit, self.segment, self.clockwise)
+        rows = np.column_stack([column[ids] for column in columns])
+        ends = np.where(self.segment[ids], [self.px[ids], self.py[ids]], np.nan)
+        return np.column_stack([rows, ends.T, self.radius[ids]])
+
+    def draw(self, box, tolerance) -> Iterator[Tuple[bool, _Geometry]]:
+        ids = self.index.query_bbox(*box)
+        geometry = _Geometry()
+        hits = ids[self.hit[ids]]
+        geometry.add_circles(self.x[hits], self.y[hits], self.r[hits])
+        segments = ids[self.segment[ids]]
+        lines = segments[self.radius[segments] == 0]
+        arcs = segments[self.radius[segments] != 0]
+        chords = arcs_lib.flatten(
+            arcs_lib.from_radius(
+                self.px[arcs],
+                self.py[arcs],
+                self.x[arcs],
+                self.y[arcs],
+                self.radius[arcs],
+                self.clockwise[arcs],
+            ),
+            tolerance,
+        )
+        r = np.concatenate([self.r[lines], self.r[arcs][chords.owners()]])
+        x0, y0, x1, y1 = (
+            np.concatenate([line, chord])
+            for line, chord in zip(
+                (self.px[lines], self.py[lines], self.x[lines], self.y[lines]),
+                chords.segments(),
+            )
+        )
+        for radius in np.unique(r):
+            selected = r == radius
+            ends = x0[selected], y0[selected], x1[selected], y1[selected]
+            geometry.add_polygons(geometry_lib.capsules(*ends, radius, tolerance))
+        yield True, geometry
+
+
+def polarity_batches(
+    layer: gl.GerberLayer | drl.DrillLayer, tolerance=geometry_lib.DEFAULT_TOLERANCE
+) -> Iterator[Tuple[bool, geometry_lib.Polygons]]:
+    """
+    (dark, polygons) of everything a layer draws, in draw order and batches of
+    one polarity, in layer units. Arcs are split into chords at most tolerance
+    from the curve.
+    """
+    if isinstance(layer, gl.GerberLayer):
+        scene = _GerberScene(layer, geometry_lib.ApertureGeometry(tolerance))
+    elif isinstance(layer, drl.DrillLayer):
+        scene = _DrillScene(layer)
+    else:
+        raise ValueError(f"Invalid layer type: {type(layer)}")
+    bounds = scene.index.bounds
+    if bounds is None:
+        return
+    for dark, geometry in scene.draw(bounds, tolerance):
+        yield dark, geometry.as_polygons(tolerance)
+
+
+class RasterLayerRenderer:
+    """
+    Renders Gerber and drill layers into a uint8 NumPy bitmap at a given DPI:
+    DARK (255) where the layer has material and CLEAR (0) elsewhere. Dark and
+    clear polarity are applied in the order the file draws them.
+    Images are rendered tile by tile; only the primitives found in the layer's
+    spatial index for a tile are filled, with one vectorized scanline pass per
+    polarity batch, so tiles() keeps memory bounded for large panels.
+    bounds are (xmin, ymin, xmax, ymax) in millimeters and default to the extents
+    of the added layers. tolerance is the maximum chord error of arcs in pixels.
+    """
+
+    def __init__(self, dpi=1000, bounds=None, tolerance=0.25):
+        self.dpi = dpi
+        self.tolerance = tolerance
+        self.bounds: Optional[Tuple[float, float, float, float]] = bounds
+        self._fit_bounds = bounds is None
+        self._scenes = []
+        # Aperture polygons, built once and translated to every flash
+        self.geometry = geometry_lib.ApertureGeometry()
+        self.templates = self.geometry.templates
+
+    def add_layer(self, layer: gl.GerberLayer | drl.DrillLayer):
+        if isinstance(layer, gl.GerberLayer):
+            scene = _GerberScene(layer, self.geometry)
+        elif isinstance(layer, drl.DrillLayer):
+            scene = _DrillScene(layer)
+        else:
+            raise ValueError(f"Invalid layer type: {type(layer)}")
+        self._scenes.append(scene)
+        bounds = scene.index.bounds
+        if self._fit_bounds and bounds is not None:
+            bounds = [b * scene.mm for b in bounds]
+            boxes = [bounds] if self.bounds is None else [bounds, self.bounds]
+            self.bounds = spatial.total_bounds(boxes)
+        return self
+
+    @property
+    def pixels_per_mm(self) -> float:
+        return self.dpi / MM_PER_INCH
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(height, width) of the full image in pixels"""
+        if self.bounds is None:
+            return 0, 0
+        xmin, ymin, xmax, ymax = self.bounds
+        width = max(1, math.ceil((xmax - xmin) * self.pixels_per_mm))
+        height = max(1, math.ceil((ymax - ymin) * self.pixels_per_mm))
+        return height, width
+
+    def render(self, tile_size=TILE_SIZE) -> np.ndarray:
+        """The full image, row 0 at the top (ymax) of the bounds"""
+        image = np.zeros(self.shape, dtype=np.uint8)
+        for row, col, tile in self.tiles(tile_size):
+            image[row : row + tile.shape[0], col : col + tile.shape[1]] = tile
+        return image
+
+    def tiles(self, tile_size=TILE_SIZE) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """Yields (row, column, tile) covering the image, row by row"""
+        height, width = self.shape
+        for row in range(0, height, tile_size):
+            for col in range(0, width, tile_size):
+                tile_height = min(tile_size, height - row)
+                tile_width = min(tile_size, width - col)
+                yield row, col, self.render_tile(row, col, tile_height, tile_width)
+
+    def render_tile(self, row, col, height, width) -> np.ndarray:
+        """The height x width pixels of the image starting at (row, col)"""
+        tile = np.zeros((height, width), dtype=np.uint8)
+        for scene, box, factor, offset in self._scene_boxes(row, col, height, width):
+            for dark, geometry in scene.draw(box, self.tolerance / factor):
+                spans = geometry.spans(factor, *offset, height, width)
+                _paint(tile, *spans, DARK if dark else CLEAR)
+        return tile
+
+    def tile_contents(self, row, col, height, width) -> Optional[List[np.ndarray]]:
+        """
+        Signatures of what every layer draws in a tile, or None when they can't
+        be compared. Renderers with equal tile contents render the tile alike.
+        """
+        contents = []
+        for scene, box, _, _ in self._scene_boxes(row, col, height, width):
+            signatures = scene.contents(box)
+            if signatures is None:
+                return None
+            mm = np.full((len(signatures), 1), scene.mm)
+            contents.append(np.column_stack([signatures, mm]))
+        return contents
+
+    def _scene_boxes(self, row, col, height, width):
+        """
+        (scene, box, factor, offset) for every layer: box is the tile in layer
+        units padded by a pixel, factor and offset map layer units to tile pixels
+        """
+        if self.bounds is None:
+            return
+        xmin, _, _, ymax = self.bounds
+        scale = self.pixels_per_mm
+        left, top = xmin + col / scale, ymax - row / scale
+        right, bottom = left + width / scale, top - height / scale
+        for scene in self._scenes:
+            pad = 1 / scale
+            box = (
+                (left - pad) / scene.mm,
+                (bottom - pad) / scene.mm,
+                (right + pad) / scene.mm,
+                (top + pad) / scene.mm,
+            )
+            factor = scale * scene.mm
+            yield scene, box, factor, (-left * scale, top * scale)
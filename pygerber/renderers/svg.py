@@ -1,18 +1,39 @@
+import math
 import sys
 
 import svgwrite as svg
 
 import pygerber.aperture as aperture_lib
+import pygerber.arcs as arcs_lib
+import pygerber.boolean as boolean_lib
 import pygerber.drill_layer as drl
 import pygerber.gerber_layer as gl
+import pygerber.renderers.svg_stream as svg_stream
+import pygerber.spatial as spatial
 from pygerber.standards.gerber import GerberFormat
 from pygerber.standards.nc_drill import NCDrillFormat
 
 
+def _has_clear(layer: gl.GerberLayer) -> bool:
+    for op_type, state in layer.expand():
+        if op_type == GerberFormat.REGION_END:
+            state = state[0][1] if state else None
+        if state is not None and state.polarity is False:
+            return True
+    return False
+
+
 class SvgLayerRenderer:
-    def __init__(self, back_color="white", fore_color="black"):
+    """
+    Renders layers as SVG shapes. Clear polarity is painted in the background
+    color, unless resolve_polarity=True: Gerber layers with clear polarity are
+    then drawn as the polygons left dark once it is cut out.
+    """
+
+    def __init__(self, back_color="white", fore_color="black", resolve_polarity=False):
         self.background = back_color
         self.foreground = fore_color
+        self.resolve_polarity = resolve_polarity
         self.regions = []
         self.operations = []
         self.multilayer = []
@@ -21,9 +42,17 @@ class SvgLayerRenderer:
         self._drill_down = False
         self._layer = None
         self._previous_point = (0, 0)
+        self._bounds = None
+        # One <defs> group per aperture, referenced by every flash of it
+        self.templates = aperture_lib.TemplateCache()
+        self.definitions = []
 
     def add_layer(self, layer: gl.GerberLayer | drl.DrillLayer):
         self._layer = layer
+        bounds = layer.bounds()
+        if bounds is not None:
+            boxes = [bounds] if self._bounds is None else [bounds, self._bounds]
+            self._bounds = spatial.total_bounds(boxes)
         if isinstance(layer, gl.GerberLayer):
             self.add_gerber_layer(layer)
         elif isinstance(layer, drl.DrillLayer):
@@ -32,12 +61,16 @@ class SvgLayerRenderer:
             raise ValueError(f"Invalid layer type: {type(layer)}")
 
     def add_gerber_layer(self, layer: gl.GerberLayer):
-        operations, regions = layer.operations, layer.collection_of_region
-        for region in regions:
-            obj = self._render_region(region)
-            self.canvas.add(obj)
-
-        for op_type, state in operations:
+        if self.resolve_polarity and _has_clear(layer):
+            polygons = boolean_lib.layer_polygons(layer)
+            path = svg.path.Path(d=svg_stream.polygons_path(polygons))
+            self.canvas.add(path.fill(self.foreground, rule="evenodd"))
+            return self
+        # Step and repeat and block apertures are expanded into copies
+        for op_type, state in layer.expand():
+            if op_type == GerberFormat.REGION_END:
+                self.canvas.add(self._render_region(state))
+                continue
             self._color = self.foreground if state.polarity else self.background
             if op_type == GerberFormat.OPERATION_FLASH:
                 obj = self._flash_aperture(state)
@@ -51,27 +84,31 @@ class SvgLayerRenderer:
         return self
 
     def add_drill_layer(self, layer: drl.DrillLayer):
-        for operation in layer.read():
+        self._color = self.foreground
+        for operation in layer.operations:
             if isinstance(operation, drl.ToolOperation):
                 self._drill_down = operation.down
-                return
+                continue
             point = operation.point.get()
-            diameter = self._layer.tools[operation.tool]
+            diameter = layer.tools[operation.tool]
             if isinstance(operation, drl.RoutOperation):
-                if not self._drill_down:
-                    self._previous_point = point
+                previous, self._previous_point = self._previous_point, point
+                if operation.type == NCDrillFormat.ROUT_MODE or not self._drill_down:
                     continue
-                if operation.type == NCDrillFormat.LINEAR_ROUT:
-                    obj = svg.shapes.Line(start=self._previous_point, end=point)
-                    obj.stroke(self._color, width=diameter, linecap="round")
-                else:
-                    cw = int(operation.type == NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT)
-                    px, py = self._previous_point
-                    obj = svg.path.Path("M{px},{py}").push_arc(
-                        point, 0, r, large_arc=True, angle_dir="+", absolute=False
+                if operation.arc():
+                    clockwise = operation.type == NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT
+                    arc = arcs_lib.from_radius(
+                        [previous[0]],
+                        [previous[1]],
+                        [point[0]],
+                        [point[1]],
+                        operation.radius,
+                        clockwise,
                     )
-                    obj.stroke(self._color, width=diameter, linecap="round")
-                    raise NotImplementedError(operation.type)
+                    obj = self._arc(arc)
+                else:  # circular routs without an A word radius are chords
+                    obj = svg.shapes.Line(start=previous, end=point)
+                obj.stroke(self._color, width=diameter, linecap="round")
                 self.canvas.add(obj)
             elif isinstance(operation, drl.DrillOperation):
                 self.canvas.add(
@@ -83,8 +120,14 @@ class SvgLayerRenderer:
 
     def save(self, filepath: str):
         drawing = svg.Drawing(filepath, profile="tiny")
-        drawing.viewbox(width=50, height=50)
+        if self._bounds is None:
+            drawing.viewbox(width=50, height=50)
+        else:
+            xmin, ymin, xmax, ymax = self._bounds
+            drawing.viewbox(xmin, ymin, xmax - xmin, ymax - ymin)
         # self.canvas.scale(1, -1)
+        for definition in self.definitions:
+            drawing.defs.add(definition)
         drawing.add(self.canvas)
         drawing.save()
 
@@ -98,37 +141,71 @@ class SvgLayerRenderer:
         if state.interpolation == GerberFormat.INTERP_MODE_LINEAR:
             line = svg.shapes.Line(start=state.previous_point, end=state.point)
             return line.stroke(self._color, width=height, linecap=cap)
+        elif arcs_lib.is_arc(state):
+            arc = self._arc(arcs_lib.from_state(state))
+            return arc.stroke(self._color, width=height, linecap=cap)
         else:
             raise NotImplementedError(state.interpolation)
 
+    @staticmethod
+    def _arc(arc: arcs_lib.Arcs):
+        start = f"M{float(arc.x0[0])} {float(arc.y0[0])}"
+        return svg.path.Path(d=start + svg_stream.arc_to(arc), fill="none")
+
     def _flash_aperture(self, state: gl.OperationState):
-        shape = state.aperture.shape
+        template = self.templates.get_for(
+            state.aperture, lambda: self._aperture_template(state.aperture)
+        )
+        return svg.container.Use(template, insert=state.point, fill=self._color)
+
+    def _aperture_template(self, aperture: aperture_lib.Aperture):
+        group = svg.container.Group(id=f"aperture{len(self.definitions) + 1}")
+        shapes = (
+            aperture.shape if isinstance(aperture.shape, list) else [aperture.shape]
+        )
+        for shape in shapes:
+            group.add(self._shape(shape))
+        if aperture.rotation:  # macro rotation is about the origin, in degrees
+            group.rotate(aperture.rotation)
+        self.definitions.append(group)
+        return group
+
+    def _shape(self, shape):
         if isinstance(shape, aperture_lib.ApertureCircle):
-            return svg.shapes.Circle(center=state.point, r=shape.r).fill(self._color)
+            return svg.shapes.Circle(center=(shape.cx, shape.cy), r=shape.r)
         elif isinstance(shape, aperture_lib.ApertureRectangle):
             size = (shape.width, shape.height)
-            x = state.point[0] - (shape.width / 2)
-            y = state.point[1] - (shape.height / 2)
+            x = shape.cx - (shape.width / 2)
+            y = shape.cy - (shape.height / 2)
             r = shape.radius
-            return svg.shapes.Rect(insert=(x, y), size=size, rx=r, ry=r).fill(
-                self._color
-            )
+            rect = svg.shapes.Rect(insert=(x, y), size=size, rx=r, ry=r)
+            if shape.rotation:
+                rect.rotate(math.degrees(shape.rotation), center=(shape.cx, shape.cy))
+            return rect
+        elif isinstance(shape, aperture_lib.AperturePolygon):
+            r = shape.diameter / 2
+            angles = [
+                math.radians(shape.rotation) + 2 * math.pi * k / shape.vertices
+                for k in range(int(shape.vertices))
+            ]
+            points = [
+                (shape.cx + r * math.cos(a), shape.cy + r * math.sin(a)) for a in angles
+            ]
+            return svg.shapes.Polygon(points=points)
         elif isinstance(shape, aperture_lib.ApertureOutline):
-            color = self.foreground if state.polarity else self.background
-            return svg.shapes.Polyline(points=shape.points).fill(color)
+            return svg.shapes.Polygon(points=shape.points)
         else:
             raise NotImplementedError(shape)
 
     def _render_region(self, region):
-        points = []
         for op_type, state in region:
-            if op_type == GerberFormat.OPERATION_MOVE:
-                pass
-            elif op_type != GerberFormat.OPERATION_INTERP:
+            if op_type not in (
+                GerberFormat.OPERATION_MOVE,
+                GerberFormat.OPERATION_INTERP,
+            ):
                 raise ValueError(f"Invalid region operation: {op_type}")
-            points.append(state.point)
         color = self.foreground if state.polarity else self.background
-        return svg.shapes.Polyline(points=points, fill=color)
+        return svg.path.Path(d=svg_stream.region_path(region), fill=color)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,458 @@
+import contextlib
+import math
+import os
+from typing import Any, Iterable, Optional, Tuple
+
+import pygerber.aperture as aperture_lib
+import pygerber.arcs as arcs_lib
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+from pygerber.standards.gerber import GerberFormat
+from pygerber.standards.nc_drill import NCDrillFormat
+
+HEADER = (
+    '<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="tiny" version="1.2" xmlns="http://www.w3.org/2000/svg" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"'
+)
+# Room left in the header for a viewBox written once the extents are known
+VIEWBOX_WIDTH = 100
+FLUSH_SIZE = 4096
+
+
+def _n(value: float) -> str:
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _point(x, y) -> str:
+    return f"{_n(x)} {_n(y)}"
+
+
+def _offset(x, y, x0, y0) -> str:
+    """(x, y) relative to (x0, y0), both rounded first so offsets don't drift"""
+    dx = round(x * 1e6) - round(x0 * 1e6)
+    dy = round(y * 1e6) - round(y0 * 1e6)
+    return f"{_n(dx / 1e6)} {_n(dy / 1e6)}"
+
+
+def _arc_path(cx, cy, r) -> str:
+    return (
+        f"M{_n(cx + r)} {_n(cy)}A{_n(r)} {_n(r)} 0 1 1 {_n(cx - r)} {_n(cy)}"
+        f"A{_n(r)} {_n(r)} 0 1 1 {_n(cx + r)} {_n(cy)}Z"
+    )
+
+
+def _polygon_path(points) -> str:
+    path = "L".join(_point(x, y) for x, y in points)
+    return f"M{path}Z"
+
+
+def polygons_path(polygons) -> str:
+    """SVG path data of geometry Polygons, to be filled with the even-odd rule"""
+    return "".join(_polygon_path(ring.tolist()) for ring in polygons.rings())
+
+
+def _rotated(points, angle, cx=0, cy=0):
+    c, s = math.cos(angle), math.sin(angle)
+    return [(x * c - y * s + cx, x * s + y * c + cy) for x, y in points]
+
+
+def arc_to(arc: arcs_lib.Arcs, index=0, relative=False) -> str:
+    """
+    SVG elliptical arc commands for one of the arcs, from its start point. Full
+    circles are split in two halves since a single SVG arc can't close. With
+    relative=True end points are offsets from the previous point (a commands).
+    """
+    r, sweep = _n(arc.radius[index]), arc.sweep[index]
+    direction = 1 if sweep > 0 else 0
+    x0, y0 = arc.x0[index], arc.y0[index]
+    x1, y1 = arc.x1[index], arc.y1[index]
+    command = "a" if relative else "A"
+
+    def end(x, y, previous):
+        return _offset(x, y, *previous) if relative else _point(x, y)
+
+    if abs(sweep) >= arcs_lib.TAU - 1e-9:
+        x = 2 * arc.cx[index] - x0
+        y = 2 * arc.cy[index] - y0
+        half = f"{command}{r} {r} 0 0 {direction} {end(x, y, (x0, y0))}"
+        return f"{half}{command}{r} {r} 0 0 {direction} {end(x1, y1, (x, y))}"
+    large = 1 if abs(sweep) > math.pi else 0
+    return f"{command}{r} {r} 0 {large} {direction} {end(x1, y1, (x0, y0))}"
+
+
+def region_path(region, extend=None) -> str:
+    """
+    SVG path data of a region's contours, a move starts a new contour. Points
+    after the first are relative to the previous one. extend is called with the
+    (xmin, ymin, xmax, ymax) of every segment.
+    """
+    data, previous = [], None
+    for op_type, state in region:
+        if arcs_lib.is_arc(state) and state.previous_point is not None:
+            arc = arcs_lib.from_state(state)
+            if not data:
+                data.append(f"M{_point(*state.previous_point)}")
+            data.append(arc_to(arc, relative=True))
+            previous = state.point[0]
+            if extend is not None:
+                extend(*arcs_lib.bounds(arc)[0])
+            continue
+        point = state.point[0] if isinstance(state.point[0], tuple) else state.point
+        if previous is None:
+            data.append(f"M{_point(*point)}")
+        else:
+            command = "m" if op_type == GerberFormat.OPERATION_MOVE else "l"
+            data.append(f"{command}{_offset(*point, *previous)}")
+        previous = point
+        if extend is not None:
+            extend(point[0], point[1], point[0], point[1])
+    return "".join(data) + "Z" if data else ""
+
+
+def shape_path(shape) -> str:
+    """SVG path data of an aperture shape (or list of macro shapes)"""
+    if isinstance(shape, list):
+        return "".join(shape_path(s) for s in shape)
+    if isinstance(shape, aperture_lib.ApertureCircle):
+        path = _arc_path(shape.cx, shape.cy, shape.r)
+        if shape.hole:
+            path += _arc_path(shape.cx, shape.cy, shape.hole / 2)
+        return path
+    if isinstance(shape, aperture_lib.ApertureRectangle):
+        w, h = shape.width / 2, shape.height / 2
+        r = min(shape.radius, w, h)
+        if not r:
+            corners = [(w, h), (-w, h), (-w, -h), (w, -h)]
+            return _polygon_path(_rotated(corners, shape.rotation, shape.cx, shape.cy))
+        # Straight edges joined by quarter circles
+        points = _rotated(
+            [
+                (w, r - h),
+                (w, h - r),
+                (w - r, h),
+                (r - w, h),
+                (-w, h - r),
+                (-w, r - h),
+                (r - w, -h),
+                (w - r, -h),
+            ],
+            shape.rotation,
+            shape.cx,
+            shape.cy,
+        )
+        arc = f"A{_n(r)} {_n(r)} 0 0 1 "
+        path = [f"M{_n(points[0][0])} {_n(points[0][1])}"]
+        for index in range(1, 8, 2):
+            (x1, y1), (x2, y2) = points[index], points[(index + 1) % 8]
+            path.append(f"L{_n(x1)} {_n(y1)}{arc}{_n(x2)} {_n(y2)}")
+        return "".join(path) + "Z"
+    if isinstance(shape, aperture_lib.AperturePolygon):
+        vertices = int(shape.vertices)
+        r = shape.diameter / 2
+        start = math.radians(shape.rotation)
+        angles = [start + 2 * math.pi * k / vertices for k in range(vertices)]
+        return _polygon_path(
+            [(shape.cx + r * math.cos(a), shape.cy + r * math.sin(a)) for a in angles]
+        )
+    if isinstance(shape, aperture_lib.ApertureOutline):
+        return _polygon_path(shape.points)
+    raise NotImplementedError(shape)
+
+
+class SvgStreamRenderer:
+    """
+    Writes layers as SVG straight to a file while operations are consumed,
+    without building an svgwrite element tree.
+    Consecutive draws with the same aperture and polarity are merged into one
+    <path>, and flashes are <use> references to one <defs> entry per aperture.
+    Step and repeat copies and block aperture (AB) flashes likewise reference one
+    <defs> group per block.
+    If bounds (xmin, ymin, xmax, ymax) aren't given, the viewBox is filled in
+    on close() when the output can seek, and is 50x50 otherwise.
+    """
+
+    def __init__(self, output, bounds=None, back_color="white", fore_color="black"):
+        self.background = back_color
+        self.foreground = fore_color
+        self.bounds: Optional[Tuple[float, float, float, float]] = bounds
+        self.elements = 0
+        if isinstance(output, (str, os.PathLike)):
+            self._file = open(output, "w", encoding="utf-8")
+            self._owns_file = True
+        else:
+            self._file, self._owns_file = output, False
+        self._buffer = []
+        # One <defs> path per aperture, referenced by every flash of it
+        self.templates = aperture_lib.TemplateCache()
+        self._definitions = []
+        self._path = None
+        self._fill = None
+        self._nested = False  # writing a block definition
+        self._extents = [math.inf, math.inf, -math.inf, -math.inf]
+
+        self._file.write(HEADER)
+        self._viewbox_at = None
+        if bounds is None and self._file.seekable():
+            self._viewbox_at = self._file.tell()
+        self._file.write(self._viewbox().ljust(VIEWBOX_WIDTH) + ">\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_layer(self, layer: gl.GerberLayer | drl.DrillLayer):
+        if isinstance(layer, gl.GerberLayer):
+            self.add_operations(layer.draw_order())
+        elif isinstance(layer, drl.DrillLayer):
+            self.add_drill_layer(layer)
+        else:
+            raise ValueError(f"Invalid layer type: {type(layer)}")
+        return self
+
+    def add_operations(self, items: Iterable[Tuple[GerberFormat, Any]]):
+        """
+        Writes Gerber operations and regions, e.g. straight from
+        GerberLayer.iter_operations
+        """
+        for op_type, item in items:
+            if op_type == GerberFormat.OPERATION_INTERP:
+                self._draw(item)
+            elif op_type == GerberFormat.OPERATION_FLASH:
+                self._flash(item)
+            elif op_type == GerberFormat.REGION_END:
+                self._region(item)
+            elif op_type == GerberFormat.STEP_AND_REPEAT:
+                for x, y in item.offsets:
+                    self._place(item.block, x, y, False)
+            elif op_type != GerberFormat.OPERATION_MOVE:  # moves are no-ops
+                raise NotImplementedError(op_type)
+        return self
+
+    def add_drill_layer(self, layer: drl.DrillLayer):
+        tools = {
+            tool: aperture_lib.Aperture(tool, True, aperture_lib.ApertureCircle(d))
+            for tool, d in layer.tools.items()
+        }
+        previous = None
+        for operation in layer.operations:
+            if isinstance(operation, drl.ToolOperation):
+                continue
+            point = operation.point.get()
+            tool = tools[operation.tool]
+            if isinstance(operation, drl.DrillOperation):
+                self._use(tool, point, True)
+                continue
+            # Circular routs without an A word radius are drawn as chords
+            if previous is not None and operation.type != NCDrillFormat.ROUT_MODE:
+                diameter = tool.shape.diameter
+                arc = None
+                if operation.arc():
+                    clockwise = operation.type == NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT
+                    arc = arcs_lib.from_radius(
+                        [previous[0]],
+                        [previous[1]],
+                        [point[0]],
+                        [point[1]],
+                        operation.radius,
+                        clockwise,
+                    )
+                key = id(tool)
+                self._stroke(key, diameter, "round", previous, point, True, arc)
+            previous = point
+        return self
+
+    def close(self):
+        if self._file is None:
+            return
+        self._flush_path()
+        if self._fill is not None:
+            self._buffer.append("</g>\n")
+        if self._definitions:
+            self._buffer.append("<defs>\n")
+            self._buffer.extend(self._definitions)
+            self._buffer.append("</defs>\n")
+        self._buffer.append("</svg>\n")
+        self._write()
+        if self._viewbox_at is not None and self.bounds is None:
+            xmin, ymin, xmax, ymax = self._extents
+            if xmin <= xmax:
+                self.bounds = xmin, ymin, xmax, ymax
+                end = self._file.tell()
+                self._file.seek(self._viewbox_at)
+                self._file.write(self._viewbox().ljust(VIEWBOX_WIDTH))
+                self._file.seek(end)
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+        self._file = None
+
+    def _viewbox(self) -> str:
+        if self.bounds is None:
+            return ' viewBox="0 0 50 50"'
+        xmin, ymin, xmax, ymax = self.bounds
+        return f' viewBox="{_n(xmin)} {_n(ymin)} {_n(xmax - xmin)} {_n(ymax - ymin)}"'
+
+    def _color(self, polarity) -> str:
+        return self.background if polarity is False else self.foreground
+
+    def _extend(self, x, y, hx, hy):
+        self._extend_box(x - hx, y - hy, x + hx, y + hy)
+
+    def _extend_box(self, xmin, ymin, xmax, ymax):
+        extents = self._extents
+        extents[0] = min(extents[0], xmin)
+        extents[1] = min(extents[1], ymin)
+        extents[2] = max(extents[2], xmax)
+        extents[3] = max(extents[3], ymax)
+
+    def _element(self, text: str, fill: Optional[str] = None):
+        # Runs of filled elements share a group instead of a fill attribute each
+        if fill is not None and fill != self._fill:
+            if self._fill is not None:
+                self._buffer.append("</g>\n")
+            self._buffer.append(f'<g fill="{fill}">\n')
+            self._fill = fill
+        self._buffer.append(text)
+        self.elements += 1
+        if len(self._buffer) >= FLUSH_SIZE and not self._nested:
+            self._write()
+
+    def _write(self):
+        self._file.write("".join(self._buffer))
+        self._buffer.clear()
+
+    def _definition(self, aperture: aperture_lib.Aperture):
+        name = f"a{len(self._definitions) + 1}"
+        path = shape_path(aperture.shape)
+        if aperture.hole:
+            path += _arc_path(0, 0, aperture.hole / 2)
+        transform = ""
+        if aperture.rotation:  # macro rotation is about the origin, in degrees
+            transform = f' transform="rotate({_n(aperture.rotation)})"'
+        self._definitions.append(
+            f'<path id="{name}" fill-rule="evenodd" d="{path}"{transform}/>\n'
+        )
+        return name, aperture.extent()
+
+    def _use(self, aperture: aperture_lib.Aperture, point, polarity):
+        self._flush_path()
+        name, (hx, hy) = self.templates.get_for(
+            aperture, lambda: self._definition(aperture)
+        )
+        x, y = point
+        self._extend(x, y, hx, hy)
+        self._element(
+            f'<use xlink:href="#{name}" x="{_n(x)}" y="{_n(y)}"/>\n',
+            self._color(polarity),
+        )
+
+    def _flash(self, state: gl.OperationState):
+        if isinstance(state.aperture.shape, gl.Block):
+            x, y = state.point
+            self._place(state.aperture.shape, x, y, state.polarity is False)
+            return
+        self._use(state.aperture, state.point, state.polarity)
+
+    def _place(self, block: gl.Block, x, y, clear):
+        self._flush_path()
+        name = self.templates.get_for(
+            block, lambda: self._block_definition(block, clear), clear
+        )
+        bounds = block.bounds()
+        if bounds is not None:
+            xmin, ymin, xmax, ymax = bounds
+            self._extend_box(xmin + x, ymin + y, xmax + x, ymax + y)
+        self._element(f'<use xlink:href="#{name}" x="{_n(x)}" y="{_n(y)}"/>\n')
+
+    def _block_definition(self, block: gl.Block, clear) -> str:
+        """
+        Writes a block once into <defs> as a group, with swapped colors if clear
+        """
+        saved = self._buffer, self._fill, self._extents, self._nested
+        colors = self.background, self.foreground
+        self._buffer, self._fill, self._nested = [], None, True
+        self._extents = [math.inf, math.inf, -math.inf, -math.inf]
+        if clear:
+            self.background, self.foreground = self.foreground, self.background
+        self.add_operations(block.draw_order())
+        self._flush_path()
+        if self._fill is not None:
+            self._buffer.append("</g>\n")
+        content = "".join(self._buffer)
+        self._buffer, self._fill, self._extents, self._nested = saved
+        self.background, self.foreground = colors
+        name = f"b{len(self._definitions) + 1}"
+        self._definitions.append(f'<g id="{name}">\n{content}</g>\n')
+        return name
+
+    def _draw(self, state: gl.OperationState):
+        arc = None
+        point = state.point
+        if arcs_lib.is_arc(state):
+            arc, point = arcs_lib.from_state(state), state.point[0]
+        elif state.interpolation != GerberFormat.INTERP_MODE_LINEAR:
+            raise NotImplementedError(state.interpolation)
+        shape = state.aperture.shape
+        if isinstance(shape, aperture_lib.ApertureCircle):
+            width, cap = shape.diameter, "round"
+        elif isinstance(shape, aperture_lib.ApertureRectangle):
+            width, cap = shape.height, "square"
+        else:
+            raise NotImplementedError(shape)
+        start = state.previous_point or point
+        key = id(state.aperture)
+        self._stroke(key, width, cap, start, point, state.polarity, arc)
+
+    def _stroke(self, key, width, cap, start, end, polarity, arc=None):
+        path = self._path
+        if path is None or path[0] != (key, polarity):
+            self._flush_path()
+            path = self._path = [(key, polarity), width, cap, [], None]
+        # Relative commands from the pen position, after the first move
+        if path[4] is None:
+            path[3].append(f"M{_point(*start)}")
+        elif path[4] != start:
+            path[3].append(f"m{_offset(*start, *path[4])}")
+        path[4] = end
+        r = width / 2
+        if arc is not None:
+            path[3].append(arc_to(arc, relative=True))
+            xmin, ymin, xmax, ymax = arcs_lib.bounds(arc)[0]
+            self._extend_box(xmin - r, ymin - r, xmax + r, ymax + r)
+            return
+        path[3].append(f"l{_offset(*end, *start)}")
+        self._extend(*start, r, r)
+        self._extend(*end, r, r)
+
+    def _flush_path(self):
+        if self._path is None:
+            return
+        (_, polarity), width, cap, data, _ = self._path
+        self._path = None
+        self._element(
+            f'<path d="{"".join(data)}" fill="none" stroke="{self._color(polarity)}" '
+            f'stroke-width="{_n(width)}" stroke-linecap="{cap}" '
+            'stroke-linejoin="round"/>\n'
+        )
+
+    def _region(self, region):
+        self._flush_path()
+        data = region_path(region, self._extend_box)
+        if data:
+            polarity = region[-1][1].polarity
+            self._element(f'<path d="{data}"/>\n', self._color(polarity))
+
+
+def render_file(path, output, **kwargs) -> SvgStreamRenderer:
+    """
+    Streams a Gerber file into an SVG without keeping its operations in memory
+    """
+    layer = gl.GerberLayer()
+    with contextlib.closing(SvgStreamRenderer(output, **kwargs)) as renderer:
+        renderer.add_operations(layer.iter_operations(path))
+    return renderer
@@ -0,0 +1,128 @@
+import heapq
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+NODE_SIZE = 16
+
+
+def total_bounds(boxes: np.ndarray) -> Optional[Tuple[float, float, float, float]]:
+    """Box (xmin, ymin, xmax, ymax) around all boxes, ignoring NaN rows"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    boxes = boxes[~np.isnan(boxes).any(axis=1)]
+    if not len(boxes):
+        return None
+    (xmin, ymin, _, _), (_, _, xmax, ymax) = boxes.min(axis=0), boxes.max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+class SpatialIndex:
+    """
+    Static R-tree over axis aligned bounding boxes, bulk loaded with
+    Sort-Tile-Recursive packing. Boxes are (xmin, ymin, xmax, ymax) rows and every
+    node covers NODE_SIZE consecutive entries of the level below it, so a query is
+    a handful of vectorized passes, one per level.
+    Queries return the ids given for the boxes (their row index by default).
+    """
+
+    def __init__(self, boxes, ids=None, node_size=NODE_SIZE):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        ids = np.arange(len(boxes)) if ids is None else np.asarray(ids)
+        valid = ~np.isnan(boxes).any(axis=1)
+        boxes, ids = boxes[valid], ids[valid]
+
+        self.node_size = node_size
+        order = self._str_order(boxes, node_size)
+        self.ids = ids[order]
+        self.levels: List[np.ndarray] = [boxes[order]]
+        while len(self.levels[-1]) > node_size:
+            self.levels.append(self._pack(self.levels[-1], node_size))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        return total_bounds(self.levels[-1])
+
+    def query_bbox(self, xmin, ymin, xmax, ymax) -> np.ndarray:
+        """Ids of every box intersecting the rectangle, edges included"""
+        if not len(self):
+            return self.ids[:0]
+        nodes = np.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth][nodes]
+            hit = (
+                (boxes[:, 0] <= xmax)
+                & (boxes[:, 2] >= xmin)
+                & (boxes[:, 1] <= ymax)
+                & (boxes[:, 3] >= ymin)
+            )
+            nodes = nodes[hit]
+            if depth:
+                nodes = self._children(nodes, len(self.levels[depth - 1]))
+        return self.ids[nodes]
+
+    def query_point(self, x, y) -> np.ndarray:
+        """Ids of every box containing the point"""
+        return self.query_bbox(x, y, x, y)
+
+    def nearest(self, x, y, k=1) -> np.ndarray:
+        """Ids of the k boxes closest to the point, nearest first"""
+        if not len(self):
+            return self.ids[:0]
+        # Best first search: nodes and boxes are popped in order of distance
+        top = len(self.levels) - 1
+        distances = self._distance(self.levels[top], x, y)
+        heap = [(d, top, node) for node, d in enumerate(distances)]
+        heapq.heapify(heap)
+        found = []
+        while heap and len(found) < k:
+            _, depth, node = heapq.heappop(heap)
+            if depth == 0:
+                found.append(node)
+                continue
+            below = self.levels[depth - 1]
+            children = self._children(np.array([node]), len(below))
+            for child, d in zip(
+                children.tolist(), self._distance(below[children], x, y)
+            ):
+                heapq.heappush(heap, (d, depth - 1, child))
+        return self.ids[np.array(found, dtype=np.int64)]
+
+    def _children(self, nodes, count):
+        children = (nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+        return children[children < count]
+
+    @staticmethod
+    def _distance(boxes, x, y):
+        dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+        dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+        return np.hypot(dx, dy).tolist()
+
+    @staticmethod
+    def _str_order(boxes, node_size):
+        # Sort into vertical slices by x center, then by y center within a slice
+        count = len(boxes)
+        if not count:
+            return np.arange(0)
+        leaves = math.ceil(count / node_size)
+        per_slice = math.ceil(math.sqrt(leaves)) * node_size
+        cx = boxes[:, 0] + boxes[:, 2]
+        cy = boxes[:, 1] + boxes[:, 3]
+        rank = np.empty(count, dtype=np.int64)
+        rank[np.argsort(cx, kind="stable")] = np.arange(count)
+        return np.lexsort((cy, rank // per_slice))
+
+    @staticmethod
+    def _pack(boxes, node_size):
+        starts = np.arange(0, len(boxes), node_size)
+        return np.column_stack(
+            [
+                np.minimum.reduceat(boxes[:, 0], starts),
+                np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts),
+                np.maximum.reduceat(boxes[:, 3], starts),
+            ]
+        )
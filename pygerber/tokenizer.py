@@ -0,0 +1,205 @@
+import contextlib
+import itertools
+import mmap
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import pygerber.standards.gerber as gf
+
+CHUNK_SIZE = 1 << 16  # characters read from the stream at a time
+BATCH_SIZE = 4096  # statements tokenized at a time from a mapped file
+
+# One pass over the buffer: every alternative ends on its terminator, so an
+# unfinished statement at the end of a chunk falls through to `tail`.
+_TOKEN = re.compile(
+    r"\s*(?:"
+    r"%(?P<extended>[^%]*)%"
+    r"|(?:G0?(?P<g>[123]))?"
+    r"(?:X(?P<x>[+-]?\d+))?(?:Y(?P<y>[+-]?\d+))?"
+    r"(?:I(?P<i>[+-]?\d+))?(?:J(?P<j>[+-]?\d+))?"
+    r"D0?(?P<d>[123])\*"
+    r"|(?:G54)?D(?P<aperture>\d+)\*"
+    r"|(?P<word>[^%*]*)\*"
+    r"|(?P<tail>\S[\s\S]*)"
+    r")"
+)
+# The same over bytes, for mapped files
+_TOKEN_BYTES = re.compile(_TOKEN.pattern.encode())
+_SHORT_CODE = re.compile(r"([GM])(\d)(?!\d)")  # e.g. G1 for G01
+
+_OPERATIONS = {
+    "1": gf.GerberFormat.OPERATION_INTERP,
+    "2": gf.GerberFormat.OPERATION_MOVE,
+    "3": gf.GerberFormat.OPERATION_FLASH,
+}
+_INTERPOLATIONS = {
+    "1": gf.GerberFormat.INTERP_MODE_LINEAR,
+    "2": gf.GerberFormat.INTERP_MODE_CW,
+    "3": gf.GerberFormat.INTERP_MODE_CCW,
+}
+_OPERATIONS_BYTES = {code.encode(): op for code, op in _OPERATIONS.items()}
+_INTERPOLATIONS_BYTES = {code.encode(): op for code, op in _INTERPOLATIONS.items()}
+_COMMANDS = {
+    cmd.value: cmd for cmd in gf.GerberFormat if cmd != gf.GerberFormat.SET_APERTURE
+}
+
+
+class Operation(NamedTuple):
+    """A D01/D02/D03 with its coordinates, None where a coordinate is omitted"""
+
+    op_type: gf.GerberFormat
+    x: Optional[int]
+    y: Optional[int]
+    i: Optional[int]
+    j: Optional[int]
+    interpolation: Optional[gf.GerberFormat]
+
+
+class SelectAperture(NamedTuple):
+    index: int
+
+
+class Command(NamedTuple):
+    """Any other statement; op_type is None when the command isn't recognized"""
+
+    op_type: Optional[gf.GerberFormat]
+    content: str
+    data: str
+
+
+Token = Union[Operation, SelectAperture, Command]
+
+
+def classify(statement: str) -> Command:
+    """Looks up the command of a word or extended statement"""
+    for size in (2, 3):
+        if statement[:size] in _COMMANDS:
+            return Command(_COMMANDS[statement[:size]], statement[size:], statement)
+    match = _SHORT_CODE.match(statement)
+    if match:
+        letter, number = match.groups()
+        code = f"{letter}0{number}"
+        if code in _COMMANDS:
+            return Command(_COMMANDS[code], statement[2:], statement)
+    return Command(None, statement, statement)
+
+
+def _split_extended(block: str) -> Iterator[Command]:
+    block = block.strip()
+    if block.startswith(gf.GerberFormat.APERTURE_MACRO.value):
+        # Macro bodies are a list of '*' separated primitives
+        yield classify(block.rstrip("*"))
+        return
+    for statement in block.split("*"):
+        statement = statement.strip()
+        if statement:
+            yield classify(statement)
+
+
+def tokenize_buffer(buffer, pos: int = 0, limit: Optional[int] = None):
+    """
+    Tokenizes complete statements in buffer starting at pos, at most limit of
+    them if given. Returns the tokens and the position of the first unconsumed
+    character. buffer is a str or a bytes-like object such as an mmap; with
+    bytes, coordinates are parsed straight from the matched digits and only
+    other statements are decoded.
+    """
+    if isinstance(buffer, str):
+        pattern, decode = _TOKEN, str
+        operations, interpolations = _OPERATIONS, _INTERPOLATIONS
+    else:
+        pattern, decode = _TOKEN_BYTES, bytes.decode
+        operations, interpolations = _OPERATIONS_BYTES, _INTERPOLATIONS_BYTES
+    tokens = []
+    append = tokens.append
+    for m in itertools.islice(pattern.finditer(buffer, pos), limit):
+        extended, g, x, y, i, j, d, aperture, word, tail = m.groups()
+        if d is not None:
+            append(
+                Operation(
+                    operations[d],
+                    int(x) if x else None,
+                    int(y) if y else None,
+                    int(i) if i else None,
+                    int(j) if j else None,
+                    interpolations[g] if g else None,
+                )
+            )
+        elif aperture is not None:
+            append(SelectAperture(int(aperture)))
+        elif extended is not None:
+            tokens.extend(_split_extended(decode(extended)))
+        elif word is not None:
+            word = decode(word).strip()
+            if word:
+                append(classify(word))
+        else:
+            return tokens, m.start("tail")
+        pos = m.end()
+    return tokens, pos
+
+
+def tokenize_batches(
+    stream, chunk_size=CHUNK_SIZE, batch_size: Optional[int] = None
+) -> Iterator[Tuple[List[Token], str]]:
+    """
+    Tokenizes a Gerber stream like tokenize, in batches of at most batch_size
+    statements (or one per chunk). Yields (tokens, text) with the source text the
+    batch was read from, so the offset of every batch boundary is known.
+    """
+    pending = ""
+    for chunk in iter(lambda: stream.read(chunk_size), ""):
+        buffer = pending + chunk
+        pos = 0
+        while True:
+            tokens, end = tokenize_buffer(buffer, pos, batch_size)
+            if end == pos:
+                break
+            yield tokens, buffer[pos:end]
+            pos = end
+        pending = buffer[pos:]
+    if pending.strip():
+        yield [classify(pending.strip().strip("*%"))], pending
+    elif pending:
+        yield [], pending
+
+
+@contextlib.contextmanager
+def mapped(path):
+    """Memory-maps a file for reading; empty files, which can't be mapped, are b''"""
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+        with data:
+            yield data
+
+
+def tokenize_mapped(
+    data, batch_size: int = BATCH_SIZE, pos: int = 0
+) -> Iterator[Tuple[List[Token], int]]:
+    """
+    Tokenizes a bytes buffer, usually a mapped file, from pos in batches of at
+    most batch_size statements without decoding or copying it. Yields (tokens,
+    end) with the offset just past every batch.
+    """
+    while True:
+        tokens, end = tokenize_buffer(data, pos, batch_size)
+        if end == pos:
+            break
+        yield tokens, end
+        pos = end
+    tail = data[pos:].strip()
+    if tail:
+        yield [classify(tail.decode().strip("*%"))], len(data)
+
+
+def tokenize(stream, chunk_size=CHUNK_SIZE) -> Iterator[Token]:
+    """
+    Tokenizes a Gerber stream in a single pass, reading it in fixed size chunks.
+    Only the unfinished tail of the current chunk is kept between reads.
+    """
+    for tokens, _ in tokenize_batches(stream, chunk_size):
+        yield from tokens
@@ -0,0 +1,210 @@
+import collections
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+CELL_POINTS = 2  # average points per grid cell
+NEIGHBOURS = 8  # 2-opt candidates per point
+MAX_RING = 8  # grid rings searched before scanning every point left
+
+
+def travel(points, start=(0.0, 0.0)) -> float:
+    """Length of the path from start through the points in order"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    path = np.vstack([np.asarray(start, dtype=np.float64), points])
+    return float(np.hypot(*np.diff(path, axis=0).T).sum())
+
+
+class _Grid:
+    """
+    Points bucketed into square cells, for nearest neighbour queries over the
+    points not yet taken
+    """
+
+    def __init__(self, points: np.ndarray):
+        self.points = points
+        self.origin = points.min(axis=0)
+        width, height = np.ptp(points, axis=0)
+        area = max(width * height, width**2, height**2, 1e-12)
+        self.cell = math.sqrt(area * CELL_POINTS / len(points)) or 1.0
+        keys = np.floor((points - self.origin) / self.cell).astype(np.int64)
+        self.shape = keys.max(axis=0) + 1
+        self.cells: Dict[Tuple[int, int], List[int]] = collections.defaultdict(list)
+        for index, key in enumerate(map(tuple, keys.tolist())):
+            self.cells[key].append(index)
+        self.left = np.ones(len(points), dtype=bool)
+        self.xs, self.ys = points[:, 0].tolist(), points[:, 1].tolist()
+
+    def take(self, index: int):
+        x, y = self.xs[index], self.ys[index]
+        self.cells[self._key(x, y)].remove(index)
+        self.left[index] = False
+
+    def nearest(self, x: float, y: float) -> int:
+        """The closest point left to (x, y)"""
+        cx, cy = self._key(x, y)
+        best, best_distance = -1, math.inf
+        for ring in range(MAX_RING + 1):
+            for key in self._ring(cx, cy, ring):
+                for index in self.cells.get(key, ()):
+                    distance = math.hypot(self.xs[index] - x, self.ys[index] - y)
+                    if distance < best_distance:
+                        best, best_distance = index, distance
+            # Cells further out are at least ring cells away
+            if best_distance <= ring * self.cell:
+                return best
+        left = np.nonzero(self.left)[0]
+        distances = np.hypot(self.points[left, 0] - x, self.points[left, 1] - y)
+        return int(left[np.argmin(distances)])
+
+    def _key(self, x, y) -> Tuple[int, int]:
+        return (
+            math.floor((x - self.origin[0]) / self.cell),
+            math.floor((y - self.origin[1]) / self.cell),
+        )
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for dx in range(-ring, ring + 1):
+            yield cx + dx, cy - ring
+            yield cx + dx, cy + ring
+        for dy in range(-ring + 1, ring):
+            yield cx - ring, cy + dy
+            yield cx + ring, cy + dy
+
+
+def nearest_neighbour(points, start=(0.0, 0.0)) -> np.ndarray:
+    """Order visiting the points by always moving to the closest one left"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return np.arange(0)
+    grid = _Grid(points)
+    order = np.empty(len(points), dtype=np.int64)
+    x, y = start
+    for step in range(len(points)):
+        index = grid.nearest(x, y)
+        grid.take(index)
+        order[step] = index
+        x, y = grid.xs[index], grid.ys[index]
+    return order
+
+
+def neighbours(points, k=NEIGHBOURS) -> np.ndarray:
+    """
+    Up to k nearest other points of every point, -1 padded, found among the
+    points of the 3 by 3 grid cells around it
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    if count < 2:
+        return np.full((count, k), -1, dtype=np.int64)
+    grid = _Grid(points)
+    keys = np.floor((points - grid.origin) / grid.cell).astype(np.int64) + 1
+    columns = grid.shape[1] + 2
+    cells = keys[:, 0] * columns + keys[:, 1]
+    order = np.argsort(cells, kind="stable")
+    sorted_cells = cells[order]
+
+    owners, candidates = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            target = cells + dx * columns + dy
+            first = np.searchsorted(sorted_cells, target, "left")
+            last = np.searchsorted(sorted_cells, target, "right")
+            sizes = last - first
+            owner = np.repeat(np.arange(count), sizes)
+            steps = np.arange(len(owner)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            owners.append(owner)
+            candidates.append(order[np.repeat(first, sizes) + steps])
+    owner, candidate = np.concatenate(owners), np.concatenate(candidates)
+    keep = owner != candidate
+    owner, candidate = owner[keep], candidate[keep]
+    distance = np.hypot(*(points[owner] - points[candidate]).T)
+
+    # Rank candidates by distance per point and keep the first k
+    ranked = np.lexsort((distance, owner))
+    owner, candidate = owner[ranked], candidate[ranked]
+    starts = np.searchsorted(owner, np.arange(count))
+    rank = np.arange(len(owner)) - starts[owner]
+    result = np.full((count, k), -1, dtype=np.int64)
+    nearest = rank < k
+    result[owner[nearest], rank[nearest]] = candidate[nearest]
+    return result
+
+
+def two_opt(points, order, start=(0.0, 0.0), k=NEIGHBOURS) -> np.ndarray:
+    """
+    Improves an open path from start through the points with 2-opt moves: an
+    edge is swapped for one to a point among the k nearest when reversing the
+    path in between shortens it. Points are rechecked only after a move
+    touches them.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    if count < 3:
+        return np.asarray(order, dtype=np.int64)
+    # The start is a fixed extra point at the head of the path
+    points = np.vstack([points, np.asarray(start, dtype=np.float64)])
+    route = np.concatenate([[count], np.asarray(order, dtype=np.int64)])
+    size = len(route)
+    position = np.empty(size, dtype=np.int64)
+    position[route] = np.arange(size)
+    candidates = neighbours(points[:count], k).tolist()
+    xs, ys = points[:, 0].tolist(), points[:, 1].tolist()
+
+    def distance(a, b):
+        return math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+
+    def reverse(first, last):
+        segment = route[first : last + 1][::-1].copy()
+        route[first : last + 1] = segment
+        position[segment] = np.arange(first, last + 1)
+
+    queue = collections.deque(route[1:].tolist())
+    queued = [True] * size
+    moves = 0
+    while queue and moves < 20 * size:
+        a = queue.popleft()
+        queued[a] = False
+        i = int(position[a])
+        if i + 1 >= size:
+            continue
+        b = int(route[i + 1])
+        ab = distance(a, b)
+        for c in candidates[a]:
+            if c < 0:
+                break
+            j = int(position[c])
+            if j > i + 1:
+                # a b ... c d becomes a c ... b d
+                d = int(route[j + 1]) if j + 1 < size else -1
+                cd = distance(c, d) if d >= 0 else 0.0
+                bd = distance(b, d) if d >= 0 else 0.0
+                gain = ab + cd - distance(a, c) - bd
+                first, last, touched = i + 1, j, (a, b, c, d)
+            elif j < i:
+                # c e ... a b becomes c a ... e b
+                e = int(route[j + 1])
+                gain = ab + distance(c, e) - distance(c, a) - distance(e, b)
+                first, last, touched = j + 1, i, (a, b, c, e)
+            else:
+                continue
+            if gain > 1e-9:
+                reverse(first, last)
+                moves += 1
+                for point in touched:
+                    if point >= 0 and point != count and not queued[point]:
+                        queued[point] = True
+                        queue.append(point)
+                break
+    return route[1:]
+
+
+def optimize(points, start=(0.0, 0.0)) -> np.ndarray:
+    """Short open path from start through the points: nearest neighbour, then 2-opt"""
+    order = nearest_neighbour(points, start)
+    return two_opt(points, order, start)
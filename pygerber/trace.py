@@ -0,0 +1,33 @@
+import logging
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+
+class TraceEvent(NamedTuple):
+    """A statement about to be processed by a layer parser"""
+
+    path: str
+    index: int
+    statement: Any  # a tokenizer token for Gerber files, the line for drill files
+
+
+TraceHook = Callable[[TraceEvent], None]
+
+
+def traced(
+    path: str,
+    statements: Iterable[Any],
+    log: bool = False,
+    hook: Optional[TraceHook] = None,
+    start: int = 0,
+) -> Iterator[Any]:
+    """
+    Passes statements through, logging each one and/or handing it to a hook.
+    Parsers only wrap their statements with this when tracing is enabled so the
+    untraced loop pays nothing for it. Indices count from start.
+    """
+    for index, statement in enumerate(statements, start):
+        if log:
+            logging.debug("Line: %d, Processing: %s", index, statement)
+        if hook is not None:
+            hook(TraceEvent(path, index, statement))
+        yield statement
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import pytest
+
+import pygerber.arcs as arcs_lib
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+
+
+class TestArcs:
+    def test_resolve_multi_quadrant(self):
+        # Quarter counterclockwise, quarter clockwise and a full circle
+        arcs = arcs_lib.resolve(
+            [4, 4, 6], [1, 1, 5], [6, 2, 6], [3, -1, 5], [0, -2, -1], [2, 0, 0],
+            clockwise=[False, True, True],
+        )  # fmt: skip
+        assert arcs.cx == pytest.approx([4, 2, 5])
+        assert arcs.cy == pytest.approx([3, 1, 5])
+        assert arcs.sweep == pytest.approx([math.pi / 2, -math.pi / 2, -2 * math.pi])
+        expected = [[4, 1, 6, 3], [2, -1, 4, 1], [4, 4, 6, 6]]
+        assert np.allclose(arcs_lib.bounds(arcs), expected)
+
+    def test_resolve_single_quadrant(self):
+        # Unsigned offsets: the center giving a quarter clockwise arc is (9, 1)
+        arcs = arcs_lib.resolve([8], [1], [9], [2], [1], [0], True, single=True)
+        assert (arcs.cx[0], arcs.cy[0]) == (9, 1)
+        assert arcs.sweep[0] == pytest.approx(-math.pi / 2)
+
+    def test_from_radius(self):
+        short = arcs_lib.from_radius([1], [0], [0], [1], 1, clockwise=False)
+        assert (short.cx[0], short.cy[0]) == pytest.approx((0, 0))
+        long = arcs_lib.from_radius([1], [0], [0], [1], -1, clockwise=False)
+        assert (long.cx[0], long.cy[0]) == pytest.approx((1, 1))
+        assert long.sweep[0] == pytest.approx(1.5 * math.pi)
+
+    @pytest.mark.parametrize("tolerance", [0.1, 0.01, 0.001])
+    def test_flatten_tolerance(self, tolerance):
+        arcs = arcs_lib.resolve(
+            [3, 10], [0, 0], [0, 10], [3, 0], [-3, -10], [0, 0], [False, False]
+        )
+        lines = arcs_lib.flatten(arcs, tolerance)
+        assert len(lines.offsets) == 3
+        assert lines.vertices[0] == pytest.approx([3, 0])
+        assert lines.vertices[lines.offsets[1] - 1] == pytest.approx([0, 3])
+        # Vertices are on the circle and chord midpoints within tolerance of it
+        x0, y0, x1, y1 = lines.segments()
+        owner = lines.owners()
+        midpoint = np.hypot((x0 + x1) / 2, (y0 + y1) / 2)
+        radius = np.array([3.0, 10.0])[owner]
+        assert np.all(radius - midpoint <= tolerance + 1e-12)
+        assert np.hypot(x1, y1) == pytest.approx(radius)
+
+    def test_layer_bounds(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Arcs.gbr")
+        assert layer.bounds() == pytest.approx((0.75, 0.75, 9.25, 9.0))
+
+    def test_drill_arc_rout(self, tmp_path):
+        layer = drl.DrillLayer()
+        layer.units = drl.NCDrillFormat.SET_UNIT_MM.value
+        layer.add_rout([(0, 0)], 1.0, drl.NCDrillFormat.ROUT_MODE)
+        clockwise = drl.NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT
+        layer.add_rout([(4, 0)], 1.0, clockwise, radius=2.0)
+        assert layer.bounds() == pytest.approx((-0.5, -0.5, 4.5, 2.5))
+
+        layer.write(tmp_path / "arc.drl")
+        written = drl.DrillLayer()
+        written.read(tmp_path / "arc.drl")
+        assert written.operations[-1].radius == 2.0
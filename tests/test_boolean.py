@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import pygerber.boolean as boolean_lib
+import pygerber.geometry as geometry_lib
+import pygerber.gerber_layer as gl
+import pygerber.renderers.raster as raster
+import pygerber.renderers.svg as svg
+
+
+def square(x, y, size):
+    ring = np.array([(x, y), (x + size, y), (x + size, y + size), (x, y + size)])
+    return geometry_lib.from_rings([ring.astype(float)])
+
+
+class TestBoolean:
+    def test_union(self):
+        result = boolean_lib.union(square(0, 0, 2), square(1, 1, 2))
+        assert result.areas().sum() == pytest.approx(7.0)
+        assert len(result.ring_offsets) - 1 == 1
+
+    def test_difference_hole(self):
+        result = boolean_lib.difference(square(0, 0, 4), square(1, 1, 2))
+        assert result.areas().sum() == pytest.approx(12.0)
+        # One outline holding one hole
+        assert len(result.ring_offsets) - 1 == 2
+        assert len(set(result.ring_polygons.tolist())) == 1
+
+    def test_clear_then_dark(self):
+        result = boolean_lib.resolve(
+            [
+                (True, square(0, 0, 4)),
+                (False, square(1, 1, 2)),
+                (True, square(1.5, 1.5, 1)),
+            ]
+        )
+        assert result.areas().sum() == pytest.approx(13.0)
+
+    def test_layer_matches_raster(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        area = boolean_lib.layer_polygons(layer, 0.01).areas().sum()
+        renderer = raster.RasterLayerRenderer(1000, bounds=layer.bounds())
+        image = renderer.add_layer(layer).render()
+        assert area == pytest.approx(
+            np.count_nonzero(image) / renderer.pixels_per_mm**2, rel=0.01
+        )
+
+    def test_svg_resolve_polarity(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        renderer = svg.SvgLayerRenderer(back_color="red", resolve_polarity=True)
+        text = renderer.add_gerber_layer(layer).canvas.tostring()
+        assert 'fill-rule="evenodd"' in text
+        assert "red" not in text
@@ -0,0 +1,59 @@
+import math
+
+import numpy as np
+import pytest
+
+import pygerber.compare as compare_lib
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.renderers.raster as raster
+
+
+def copper():
+    layer = gl.GerberLayer()
+    layer.read("./testdata/Test_Copper.gtl")
+    return layer
+
+
+class TestCompareLayers:
+    def test_same_layer(self):
+        diff = compare_lib.compare_layers(copper(), copper(), dpi=500, tile_size=64)
+        assert diff.regions == []
+        assert diff.changed_area == 0
+        assert diff.skipped_tiles == diff.tiles > 1
+
+    @pytest.mark.parametrize("parallel", [1, 2])
+    def test_added_flash(self, parallel):
+        old, new = copper(), copper()
+        new.flash(new.apertures[10], (5.0, 5.0))
+        diff = compare_lib.compare_layers(
+            old, new, dpi=1000, tile_size=64, parallel=parallel
+        )
+        # Only the tiles around the new flash are rendered
+        assert diff.tiles - diff.skipped_tiles <= 4
+        (region,) = diff.regions
+        assert (region.added, region.removed) == (diff.added, 0)
+        radius = new.apertures[10].shape.r
+        assert region.xmin == pytest.approx(5.0 - radius, abs=0.03)
+        assert region.ymax == pytest.approx(5.0 + radius, abs=0.03)
+        assert region.area == pytest.approx(math.pi * radius**2, rel=0.1)
+
+        # Same pixels as XORing whole images
+        images = [
+            raster.RasterLayerRenderer(1000, bounds=old.bounds()).add_layer(layer)
+            for layer in (old, new)
+        ]
+        xor = (images[0].render() != 0) ^ (images[1].render() != 0)
+        assert np.count_nonzero(xor) == diff.added
+
+    def test_moved_hole(self):
+        old, new = drl.DrillLayer(), drl.DrillLayer()
+        for layer, x in ((old, 1.0), (new, 4.0)):
+            layer.units = drl.NCDrillFormat.SET_UNIT_MM.value
+            layer.add_hole(0.0, 0.0, 0.5)
+            layer.add_hole(x, 1.0, 0.5)
+            layer.add_hole(6.0, 2.0, 0.5)
+        diff = compare_lib.compare_layers(old, new, dpi=1000, tile_size=48)
+        assert len(diff.regions) == 2
+        assert diff.added == pytest.approx(diff.removed, rel=0.05)
+        assert sorted(round((r.xmin + r.xmax) / 2) for r in diff.regions) == [1, 4]
@@ -0,0 +1,30 @@
+import pytest
+
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+from benchmarks import corpus, suite
+
+
+class TestCorpus:
+    @pytest.mark.parametrize("kind", list(corpus.KINDS))
+    def test_generated_layers(self, tmp_path, kind):
+        assert corpus.KINDS[kind](50, seed=1) == corpus.KINDS[kind](50, seed=1)
+        assert corpus.KINDS[kind](50, seed=1) != corpus.KINDS[kind](50, seed=2)
+        path = corpus.write_file(str(tmp_path), kind, 50)
+        if kind == "drill":
+            layer = drl.DrillLayer(compact=True)
+            layer.read(path)
+            assert len(layer.operations) == 50
+        else:
+            layer = gl.GerberLayer()
+            layer.read(path)
+            assert len(layer.operations) + len(layer.collection_of_region) >= 50
+        assert layer.bounds() is not None
+
+    def test_measure(self):
+        cases = suite.cases(scale=0.001)
+        assert {case.name for case in cases} == set(suite.ACTIONS)
+        result = suite.measure(suite.Case("GerberLayer.read", "arcs", 40))
+        assert result.operations >= 40
+        assert result.ops_per_second > 0
+        assert result.peak_bytes_per_op >= result.retained_bytes_per_op > 0
@@ -0,0 +1,51 @@
+import math
+
+import numpy as np
+import pytest
+
+import pygerber.aperture as aperture_lib
+import pygerber.geometry as geometry_lib
+import pygerber.gerber_layer as gl
+
+
+class TestApertureGeometry:
+    @pytest.mark.parametrize(
+        "shape, area",
+        [
+            (aperture_lib.ApertureCircle(2.0), math.pi),
+            (aperture_lib.ApertureCircle(2.0, hole=1.0), math.pi * 0.75),
+            (aperture_lib.ApertureRectangle(2, 1), 2.0),
+            (
+                aperture_lib.ApertureRectangle(2, 1, radius=0.5),
+                2 - 0.25 * (4 - math.pi),
+            ),
+            (aperture_lib.AperturePolygon(2.0, 4), 2.0),
+        ],
+    )
+    def test_area_within_tolerance(self, shape, area):
+        aperture = aperture_lib.Aperture(10, True, shape)
+        polygons = geometry_lib.aperture_polygons(aperture, tolerance=0.001)
+        assert polygons.polygon_count == 1
+        assert polygons.areas()[0] == pytest.approx(area, rel=0.005)
+
+    def test_instances_match_translated_copies(self):
+        shape = aperture_lib.ApertureCircle(2.0, hole=1.0)
+        template = geometry_lib.shape_polygons(shape, 0.01)
+        x, y = np.array([0.0, 5.0, -3.0]), np.array([1.0, 2.0, 0.5])
+        polygons = geometry_lib.instances(template, x, y)
+        expected = geometry_lib.concatenate(
+            [template.transform(dx=dx, dy=dy) for dx, dy in zip(x, y)]
+        )
+        for actual, wanted in zip(polygons, expected):
+            assert np.array_equal(actual, wanted)
+        assert polygons.bounds()[1] == pytest.approx([4, 1, 6, 3], abs=0.01)
+
+    def test_templates_cached(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        geometry = geometry_lib.ApertureGeometry(tolerance=0.01)
+        polygons = layer.flash_polygons(geometry)
+        assert polygons.polygon_count == 5
+        assert (geometry.templates.hits, geometry.templates.misses) == (0, 3)
+        layer.flash_polygons(geometry)
+        assert (geometry.templates.hits, geometry.templates.misses) == (3, 3)
@@ -1,13 +1,28 @@
+import gzip
+import io
 import logging
 import os
+import pickle
+import shutil
 import tempfile
+import zipfile
 
+import numpy as np
 import pytest
 
+import board
+import pygerber
+import pygerber.aperture as aperture_lib
+import pygerber.arcs as arcs
+import pygerber.cache as cache_lib
 import pygerber.drill_layer as drl
 import pygerber.gerber_layer as gl
+import pygerber.operation_store as store_lib
 import pygerber.renderers.svg as renderer
+import pygerber.standards.gerber as gf
 import pygerber.standards.nc_drill as ds
+import pygerber.tokenizer as tokenizer
+import pygerber.trace as trace
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -28,6 +43,274 @@ class TestPythonGerber:
         layer.read(f"./testdata/{filename}")
         renderer.SvgLayerRenderer(layer)
 
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_gerber_layer_iter_operations(self, filename):
+        layer = gl.GerberLayer()
+        operations, regions = layer.read(f"./testdata/{filename}")
+
+        streamed = gl.GerberLayer()
+        with open(f"./testdata/{filename}") as f:
+            items = list(streamed.iter_operations(f, chunk_size=7))
+        assert streamed.operations == []
+        extras = (gf.GerberFormat.REGION_END, gf.GerberFormat.STEP_AND_REPEAT)
+        assert [i for i in items if i[0] not in extras] == operations
+        assert [r for t, r in items if t == gf.GerberFormat.REGION_END] == regions
+        step_repeats = [s for t, s in items if t == gf.GerberFormat.STEP_AND_REPEAT]
+        assert step_repeats == layer.step_repeats
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_gerber_layer_draw_order(self, filename):
+        layer = gl.GerberLayer()
+        layer.read(f"./testdata/{filename}")
+        streamed = gl.GerberLayer()
+        assert list(layer.draw_order()) == list(
+            streamed.iter_operations(f"./testdata/{filename}")
+        )
+
+    def test_tokenize(self):
+        text = "G04 a*\n%FSLAX46Y46*MOMM*%\n%AMOCT*\n5,1,8,$1,22.5*%G54D10*G1*"
+        text += "X10Y-20D02*G03X1I5J-6D01*Y3D03*"
+        tokens = list(tokenizer.tokenize(io.StringIO(text), chunk_size=3))
+        assert tokens == [
+            tokenizer.Command(gf.GerberFormat.COMMENT, " a", "G04 a"),
+            tokenizer.Command(gf.GerberFormat.FORMAT, "LAX46Y46", "FSLAX46Y46"),
+            tokenizer.Command(gf.GerberFormat.UNITS, "MM", "MOMM"),
+            tokenizer.Command(
+                gf.GerberFormat.APERTURE_MACRO,
+                "OCT*\n5,1,8,$1,22.5",
+                "AMOCT*\n5,1,8,$1,22.5",
+            ),
+            tokenizer.SelectAperture(10),
+            tokenizer.Command(gf.GerberFormat.INTERP_MODE_LINEAR, "", "G1"),
+            tokenizer.Operation(
+                gf.GerberFormat.OPERATION_MOVE, 10, -20, None, None, None
+            ),
+            tokenizer.Operation(
+                gf.GerberFormat.OPERATION_INTERP,
+                1,
+                None,
+                5,
+                -6,
+                gf.GerberFormat.INTERP_MODE_CCW,
+            ),
+            tokenizer.Operation(
+                gf.GerberFormat.OPERATION_FLASH, None, 3, None, None, None
+            ),
+        ]
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_tokenize_mapped(self, filename):
+        with open(f"./testdata/{filename}") as f:
+            expected = list(tokenizer.tokenize(f))
+        with tokenizer.mapped(f"./testdata/{filename}") as data:
+            batches = list(tokenizer.tokenize_mapped(data, batch_size=3))
+            assert batches[-1][1] <= len(data)
+        assert [token for tokens, _ in batches for token in tokens] == expected
+        assert max(len(tokens) for tokens, _ in batches) == 3
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_gerber_layer_compact_store(self, filename):
+        layer = gl.GerberLayer()
+        layer.read(f"./testdata/{filename}")
+        compact = gl.GerberLayer(compact=True)
+        compact.read(f"./testdata/{filename}")
+
+        assert len(compact.operations) == len(layer.operations)
+        assert list(compact.operations) == layer.operations
+        assert compact.operations[-1] == layer.operations[-1]
+        # Arcs keep their end point in x and the center offset in i
+        ends = [s.point[0] if arcs.is_arc(s) else s.point for _, s in layer.operations]
+        assert compact.operations.x.tolist() == [x for x, _ in ends]
+        assert pickle.loads(pickle.dumps(compact.operations)) == compact.operations
+
+        regions = compact.collection_of_region
+        assert isinstance(regions, store_lib.RegionStore)
+        assert regions == layer.collection_of_region
+        assert list(regions) == layer.collection_of_region
+        assert np.diff(regions.offsets).tolist() == [
+            len(region) for region in layer.collection_of_region
+        ]
+        if len(regions):
+            assert list(regions.store(len(regions) - 1)) == regions[-1]
+        assert pickle.loads(pickle.dumps(regions)) == regions
+        np.testing.assert_array_equal(
+            compact.primitive_bounds(), layer.primitive_bounds()
+        )
+
+        with tempfile.TemporaryDirectory() as folder:
+            layer.write(os.path.join(folder, "list.gbr"))
+            compact.write(os.path.join(folder, "compact.gbr"))
+            with open(os.path.join(folder, "list.gbr")) as expected:
+                with open(os.path.join(folder, "compact.gbr")) as actual:
+                    assert actual.read() == expected.read()
+
+    def test_store_rejects_unknown_codes(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        _, state = layer.operations[0]
+        store = store_lib.OperationStore(gl.OperationState)
+        with pytest.raises(ValueError):
+            store.append((gf.GerberFormat.REGION_END, state))
+        with pytest.raises(ValueError):
+            store.extend([(gf.GerberFormat.REGION_END, state)])
+        assert len(store) == 0
+
+    def test_region_store_batches(self, monkeypatch):
+        monkeypatch.setattr(store_lib, "REGION_BATCH", 2)
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        regions = store_lib.RegionStore(gl.OperationState)
+        for _ in range(3):
+            for region in layer.collection_of_region:
+                regions.append(region)
+        expected = layer.collection_of_region * 3
+        assert len(regions) == len(expected)
+        assert regions == expected
+        regions.truncate(len(expected) - 1)
+        assert list(regions) == expected[:-1]
+        regions.append(expected[-1])
+        assert regions[-1] == expected[-1]
+        assert len(regions.contours) == sum(len(region) for region in expected)
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_gerber_layer_write_stream(self, tmp_path, filename):
+        layer = gl.GerberLayer(compact=True)
+        layer.read(f"./testdata/{filename}")
+        layer.write(tmp_path / "layer.gbr")
+        expected = (tmp_path / "layer.gbr").read_bytes()
+
+        buffer = io.BytesIO()
+        layer.write(buffer)
+        assert buffer.getvalue() == expected
+        with gzip.open(tmp_path / "layer.gbr.gz", "wb") as f:
+            layer.write(f)
+        with gzip.open(tmp_path / "layer.gbr.gz", "rb") as f:
+            assert f.read() == expected
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_gerber_layer_trace_hook(self, filename):
+        events = []
+        layer = gl.GerberLayer(trace_hook=events.append)
+        layer.read(f"./testdata/{filename}")
+
+        with open(f"./testdata/{filename}") as f:
+            tokens = list(tokenizer.tokenize(f))
+        assert [e.statement for e in events] == tokens
+        assert [e.index for e in events] == list(range(len(tokens)))
+
+    def test_gerber_layer_bounds(self, tmp_path):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        assert layer.bounds() == pytest.approx((0.25, 0.875, 10.2727922, 10.125))
+
+        layer.flash(layer.apertures[10], (20.0, -1.0))
+        assert layer.bounds() == (0.25, -1.125, 20.125, 10.125)
+
+        pads = gl.GerberLayer()
+        pads.flash(layer.apertures[11], (1.0, 2.0))
+        pads.flash(layer.apertures[10], (4.0, 3.0))
+        svg_renderer = renderer.SvgLayerRenderer()
+        svg_renderer.add_layer(pads)
+        svg_renderer.save(str(tmp_path / "layer.svg"))
+        svg_text = (tmp_path / "layer.svg").read_text()
+        assert 'viewBox="0.25,1.6,3.875,1.525"' in svg_text
+
+    def test_step_and_repeat(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Panel.gbr")
+        # The SR block is kept once, with a 3 by 2 grid of offsets
+        (step_repeat,) = layer.step_repeats
+        assert len(step_repeat.offsets) == 6
+        assert step_repeat.offsets[-1] == (20.0, 5.0)
+        assert len(step_repeat.block.operations) == 3
+        assert len(step_repeat.block.collection_of_region) == 1
+        assert layer.bounds() == pytest.approx((0.75, 0.5, 36.5, 9.0))
+
+        op_type, placement = layer.primitive(len(layer.operations) + 5)
+        assert op_type == gf.GerberFormat.STEP_AND_REPEAT
+        assert placement == gl.Placement(step_repeat.block, 20.0, 5.0)
+        flashes = [
+            (state.point, state.polarity)
+            for op_type, state in layer.expand()
+            if op_type == gf.GerberFormat.OPERATION_FLASH
+        ]
+        # The AB flash in every copy expands to a dark and a clear flash
+        assert len(flashes) == 16
+        assert flashes[:3] == [
+            ((6.0, 2.0), True),
+            ((6.0, 2.0), False),
+            ((6.0, 7.0), True),
+        ]
+
+    @pytest.mark.parametrize("compact", [False, True])
+    @pytest.mark.parametrize("end", ["M02*\n", ""])
+    def test_step_and_repeat_open_at_end(self, tmp_path, compact, end):
+        path = tmp_path / "open.gbr"
+        path.write_text(
+            "%MOMM*%\n%FSLAX46Y46*%\n%ADD10C,0.5*%\n"
+            f"%SRX2Y2I1J1*%\nD10*\nX0Y0D03*\n{end}"
+        )
+        layer = gl.GerberLayer(compact=compact)
+        layer.read(str(path))
+        (step_repeat,) = layer.step_repeats
+        assert len(step_repeat.block.operations) == 1
+        assert len(list(layer.expand())) == 4
+
+    @pytest.mark.parametrize(
+        "blocks", ["%AB*%\n", "%ABD20*%\n%SRX2Y1I1J1*%\nX0Y0D03*\n%AB*%\n"]
+    )
+    def test_aperture_block_close_without_open(self, tmp_path, blocks):
+        path = tmp_path / "blocks.gbr"
+        path.write_text(f"%MOMM*%\n%FSLAX46Y46*%\n%ADD10C,0.5*%\nD10*\n{blocks}M02*\n")
+        with pytest.raises(ValueError, match="aperture block"):
+            gl.GerberLayer().read(str(path))
+
+    def test_svg_flash_templates(self, tmp_path):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        svg_renderer = renderer.SvgLayerRenderer()
+        svg_renderer.add_layer(layer)
+        svg_renderer.save(str(tmp_path / "layer.svg"))
+        # D11 is flashed three times, D12 and D13 once
+        assert (svg_renderer.templates.hits, svg_renderer.templates.misses) == (2, 3)
+        svg_text = (tmp_path / "layer.svg").read_text()
+        assert svg_text.count("<use ") == 5
+        assert svg_text.count('<g id="aperture') == 3
+
+    def test_macro_templates(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        factory = layer.aperture_factory
+        first = factory.from_aperture_define("D20OCT,1.8")
+        second = factory.from_aperture_define("D21OCT,1.8")
+        assert (factory.templates.hits, factory.templates.misses) == (2, 1)
+        assert (first.index, second.index) == (20, 21)
+        assert first.shape is second.shape is layer.apertures[13].shape
+
+    def test_template_owner_checked(self):
+        cache = aperture_lib.TemplateCache()
+        owners = [object() for _ in range(50)]
+        for index, owner in enumerate(owners):
+            cache.get_for(owner, lambda: index)
+        restored = pickle.loads(pickle.dumps(cache))
+        del owners
+        # Fresh objects may reuse the ids of the pickled owners
+        for _ in range(200):
+            assert restored.get_for(object(), lambda: "built") == "built"
+
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        factory = pickle.loads(pickle.dumps(layer.aperture_factory))
+        assert len(factory.templates) == 0
+
+    def test_drill_layer_bounds(self):
+        layer = drl.DrillLayer()
+        assert layer.bounds() is None
+        layer.add_hole(1, 1, 0.5)
+        assert layer.bounds() == (0.75, 0.75, 1.25, 1.25)
+        layer.add_rout([(10, 0), (20, 0)], 2.0)
+        assert layer.bounds() == (0.75, -1.0, 21.0, 1.25)
+
     @pytest.mark.parametrize("filename", DRILL_FILES)
     def test_drill_layer_read(self, filename):
         layer = drl.DrillLayer()
@@ -39,6 +322,23 @@ class TestPythonGerber:
         layer.read(f"./testdata/{filename}")
         renderer.SvgLayerRenderer(layer)
 
+    def test_drill_layer_trace_hook(self):
+        events = []
+        layer = drl.DrillLayer(trace=True, trace_hook=events.append)
+        layer.read("./testdata/Test_Drill.drl")
+        assert events[0] == trace.TraceEvent("./testdata/Test_Drill.drl", 0, ";COMMENT")
+        assert events[-1].statement == "M30"
+
+    @pytest.mark.parametrize("filename", DRILL_FILES)
+    def test_drill_layer_read_stream(self, filename):
+        mapped = drl.DrillLayer()
+        mapped.read(f"./testdata/{filename}")
+        streamed = drl.DrillLayer()
+        with open(f"./testdata/{filename}") as f:
+            streamed.read(f)
+        assert streamed.operations == mapped.operations
+        assert streamed.tools == mapped.tools
+
     def test_drill_layer_write(self):
         layer = drl.DrillLayer()
         layer.read("./testdata/Test_Drill.drl")
@@ -49,6 +349,222 @@ class TestPythonGerber:
             new_layer.read(output_file.name)
             assert layer.operations == new_layer.operations
 
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_drill_layer_write_after_rout(self, tmp_path, compact):
+        path = tmp_path / "rout.drl"
+        path.write_text(
+            "M48\nMETRIC\nT01C0.5\nT02C1.0\n%\nT01\nG00X0Y0\nM15\nG01X5Y0\nM16\n"
+            "G05\nX1.5Y2\nT02\nX3Y4\nM30\n"
+        )
+        layer = drl.DrillLayer(compact=compact)
+        layer.read(path)
+        layer.write(tmp_path / "written.drl")
+        text = (tmp_path / "written.drl").read_text()
+        assert "M16\nG05\nX0001.5Y000002\nT02\nX000003Y000004\n" in text
+        written = drl.DrillLayer(compact=compact)
+        written.read(tmp_path / "written.drl")
+        assert list(written.operations) == list(layer.operations)
+
+    @pytest.mark.parametrize("filename", DRILL_FILES)
+    def test_drill_layer_compact(self, filename, tmp_path):
+        listed = drl.DrillLayer()
+        listed.read(f"./testdata/{filename}")
+        compact = drl.DrillLayer(compact=True)
+        compact.read(f"./testdata/{filename}")
+        assert isinstance(compact.operations, drl.DrillStore)
+        assert list(compact.operations) == listed.operations
+        assert np.array_equal(
+            compact.primitive_bounds(), listed.primitive_bounds(), equal_nan=True
+        )
+        assert pickle.loads(pickle.dumps(compact)).operations == compact.operations
+
+        compact.write(tmp_path / "compact.drl")
+        written = drl.DrillLayer(compact=True)
+        written.read(tmp_path / "compact.drl")
+        assert written.operations == compact.operations
+        assert not len(written.operations.diff(compact.operations))
+
+    @pytest.mark.filterwarnings("error")
+    def test_drill_hit_runs(self, tmp_path):
+        path = tmp_path / "hits.drl"
+        path.write_bytes(
+            b"M48\r\nMETRIC\r\nT01C0.5\r\nT02C1.0\r\n%\r\nG05\r\nT01\r\n X1Y2 \r\n"
+            b"\r\nX+3.5Y-.5\rT02\nX7Y8\nG00X1Y1\nM30"
+        )
+        bulk = drl.DrillLayer(compact=True)
+        bulk.read(path)
+        # Traced reads decode every line on its own
+        lines = drl.DrillLayer(trace=True)
+        lines.read(path)
+        assert bulk.operations == lines.operations
+        assert bulk.operations.x.tolist() == [1, 3.5, 7, 1]
+        assert bulk.operations.tool.tolist() == [1, 1, 2, 2]
+
+        for hit in (b"X1.2.3Y4", b"X1Y2\nX.Y4"):
+            path.write_bytes(b"M48\nMETRIC\nT01C0.5\n%\nG05\nT01\n" + hit + b"\nM30\n")
+            with pytest.raises(ValueError, match="Invalid XY format"):
+                drl.DrillLayer().read(path)
+
+    def test_drill_store_diff(self):
+        store = drl.as_drill_store(
+            [
+                drl.DrillOperation(1, drl.DrillHit(1.0, 2.0)),
+                drl.ToolOperation(True),
+                drl.RoutOperation(
+                    2, ds.NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT, drl.DrillHit(3, 4), 1
+                ),
+            ]
+        )
+        assert store.nbytes() == 3 * (1 + 2 + 8 + 8)
+        assert store[-1].radius == 1
+        changed = store.take([0, 1, 2])
+        changed.radius[2] = 2.0
+        changed.append_hit(None, 5.0, 6.0)
+        assert changed[3] == drl.DrillOperation(None, drl.DrillHit(5.0, 6.0))
+        assert store != changed
+        assert changed.diff(store).tolist() == [2, 3]
+
+
+class TestApertureMacro:
+    def test_arithmetic_and_variables(self):
+        factory = aperture_lib.ApertureFactory()
+        factory.define_macro("DONUT*\n$3=$1x0.5*\n$4=($2-$1)/2*\n1,1,$3+$4,0,-$4*")
+        aperture = factory.from_aperture_define("D10DONUT,0.6X1.4")
+        (circle,) = aperture.shape
+        assert circle == pytest.approx(aperture_lib.ApertureCircle(0.7, 0.0, -0.4))
+        assert aperture.parameters == (0.6, 1.4)
+        assert factory.to_aperture_define(aperture) == "ADD10DONUT,0.6X1.4"
+
+    def test_compiled_once(self):
+        statements = ((aperture_lib.MacroPrimitive.CIRCLE, "1,$1x2,$2,-$2/4,0"),)
+        evaluate = aperture_lib.compile_macro(statements)
+        assert evaluate is aperture_lib.compile_macro(statements)
+        assert evaluate([1.5, 2.0]) == [
+            (aperture_lib.MacroPrimitive.CIRCLE, [1.0, 3.0, 2.0, -0.5, 0.0])
+        ]
+        # Parameters that aren't given are 0
+        assert evaluate([1.5])[0][1][2] == 0.0
+
+    @pytest.mark.parametrize(
+        "expression",
+        ["$1;import os", "__import__", "1,2", "$1++", "1.5$1", "2(3)", "($1", "$1)"],
+    )
+    def test_invalid_expression(self, expression):
+        with pytest.raises(ValueError):
+            aperture_lib.compile_expression(expression)
+
+    @pytest.mark.parametrize("row", ["1,1,$1++,0,0", "1,1,1.5$1,0,0", "1,1,2(3),0,0"])
+    def test_invalid_macro(self, row, recwarn):
+        factory = aperture_lib.ApertureFactory()
+        with pytest.raises(ValueError, match="BAD"):
+            factory.define_macro(f"BAD*\n{row}*")
+        assert not recwarn.list
+
+    def test_macro_evaluation_error(self):
+        factory = aperture_lib.ApertureFactory()
+        factory.define_macro("DIV*\n1,1,$1/0,0,0*")
+        with pytest.raises(ValueError, match="DIV"):
+            factory.from_aperture_define("D10DIV,0.5")
+
+    def test_macro_missing_parameters(self):
+        factory = aperture_lib.ApertureFactory()
+        factory.define_macro("T2*\n1,1,$1,$2,0*")
+        with pytest.raises(ValueError, match="T2 needs 2 parameters, got 1"):
+            factory.from_aperture_define("D11T2,1.0")
+
+
+class TestIncrementalRead:
+    @pytest.mark.parametrize("compact", [False, True])
+    def test_reread_after_edit(self, tmp_path, compact):
+        source = tmp_path / "Test_Copper.gtl"
+        shutil.copy("./testdata/Test_Copper.gtl", source)
+        events = []
+        layer = gl.GerberLayer(compact=compact, trace_hook=events.append)
+        layer.CHECKPOINT_INTERVAL = 4
+        layer.read(source)
+        statements = len(events)
+
+        # Only the statements after the last checkpoint before the edit are parsed
+        text = source.read_text()
+        source.write_text(text.replace("X8000000Y10000000D01*", "X8000000Y9000000D01*"))
+        events.clear()
+        layer.reread(source)
+        assert 0 < len(events) <= 4 + 4
+        assert events[-1].index == statements - 1
+        expected = gl.GerberLayer(compact=compact)
+        expected.read(source)
+        assert layer.operations == expected.operations
+        assert layer.collection_of_region == expected.collection_of_region
+        assert layer.bounds() == expected.bounds()
+
+        events.clear()
+        layer.reread(source)
+        assert events == []
+
+        # Resizing an aperture resumes ahead of its definition, statement 9
+        source.write_text(text.replace("ADD10C,0.250000", "ADD10C,0.500000"))
+        layer.reread(source)
+        assert events[0].index == 8
+        expected = gl.GerberLayer(compact=compact)
+        expected.read(source)
+        assert layer.operations == expected.operations
+        assert layer.bounds() == expected.bounds()
+
+
+class TestBoard:
+    def test_board_load_parallel(self):
+        folder = board.Board("./testdata")
+        serial = folder.load()
+        assert sorted(serial) == sorted(f"./testdata/{f}" for f in TEST_FILES)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, "board.zip")
+            with zipfile.ZipFile(archive, "w") as zipped:
+                for filename in TEST_FILES:
+                    zipped.write(f"./testdata/{filename}", filename)
+            parallel = board.Board(archive).load(parallel=2)
+
+        assert sorted(parallel) == sorted(TEST_FILES)
+        for filename in TEST_FILES:
+            expected, actual = serial[f"./testdata/{filename}"], parallel[filename]
+            assert type(actual) is type(expected)
+            assert actual.operations == expected.operations
+
+
+class TestLayerCache:
+    def test_cache_hit_and_invalidation(self, tmp_path, monkeypatch):
+        source = tmp_path / "Test_Drill.drl"
+        shutil.copy("./testdata/Test_Drill.drl", source)
+        cache = cache_lib.LayerCache(tmp_path / "cache")
+
+        parsed = cache.read(source, drl.DrillLayer)
+        cached = cache.read(source, drl.DrillLayer)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cached.operations == parsed.operations
+        assert cached.tools == parsed.tools
+
+        with open(source, "a") as f:
+            f.write("\n")
+        cache.read(source, drl.DrillLayer)
+        monkeypatch.setattr(pygerber, "__version__", "test")
+        cache.read(source, drl.DrillLayer)
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    @pytest.mark.parametrize("filename", GERBER_FILES)
+    def test_cache_gerber_layer(self, tmp_path, filename):
+        cache = cache_lib.LayerCache(tmp_path)
+        parsed = cache.read(f"./testdata/{filename}", gl.GerberLayer, compact=True)
+        cached = cache.read(f"./testdata/{filename}", gl.GerberLayer, compact=True)
+        assert cache.hits == 1
+        assert cached.operations == parsed.operations
+        assert cached.collection_of_region == parsed.collection_of_region
+        assert cached.apertures == parsed.apertures
+
+    def test_cache_eviction(self, tmp_path):
+        cache = cache_lib.LayerCache(tmp_path, max_bytes=1)
+        cache.read("./testdata/Test_Drill.drl", drl.DrillLayer)
+        assert not list(tmp_path.glob("*.layer"))
+
 
 if __name__ == "__main__":
     pytest.main(["-v", "test_gerber_layer.py"])
@@ -0,0 +1,126 @@
+import math
+
+import numpy as np
+import pytest
+
+import pygerber.aperture as aperture_lib
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.renderers.raster as raster
+
+
+def pixel(renderer, image, x, y):
+    """Value of the pixel under layer point (x, y) in millimeters"""
+    xmin, _, _, ymax = renderer.bounds
+    scale = renderer.pixels_per_mm
+    return image[int((ymax - y) * scale), int((x - xmin) * scale)]
+
+
+class TestRasterLayerRenderer:
+    def test_flash_area(self):
+        layer = gl.GerberLayer()
+        circle = aperture_lib.Aperture(10, True, aperture_lib.ApertureCircle(2.0))
+        square = aperture_lib.Aperture(11, True, aperture_lib.ApertureRectangle(2, 1))
+        layer.flash(circle, (0.0, 0.0))
+        layer.flash(square, (5.0, 0.0))
+        renderer = raster.RasterLayerRenderer(dpi=2540).add_layer(layer)
+        image = renderer.render()
+        assert image.dtype == np.uint8
+        assert renderer.shape == (200, 700)
+
+        pixel_area = 1 / renderer.pixels_per_mm**2
+        circle_area = np.count_nonzero(image[:, :300]) * pixel_area
+        square_area = np.count_nonzero(image[:, 300:]) * pixel_area
+        assert circle_area == pytest.approx(math.pi, rel=0.01)
+        assert square_area == pytest.approx(2.0, rel=0.01)
+
+    def test_polarity_and_draw_order(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        image = renderer.render()
+        assert pixel(renderer, image, 1.5, 8.5) == raster.DARK  # dark region
+        assert pixel(renderer, image, 2.5, 9.0) == raster.CLEAR  # clear region
+        assert pixel(renderer, image, 3.0, 1.0) == raster.DARK  # trace
+        assert pixel(renderer, image, 3.0, 1.5) == raster.CLEAR
+        assert pixel(renderer, image, 7.0, 9.0) == raster.DARK  # diagonal trace
+        assert pixel(renderer, image, 9.0, 6.8) == raster.DARK  # octagon macro
+
+    def test_flash_templates(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        renderer.render()
+        # One polygon template per flashed non circular aperture, all in one tile
+        assert (renderer.templates.hits, renderer.templates.misses) == (0, 3)
+        renderer.render()
+        assert (renderer.templates.hits, renderer.templates.misses) == (3, 3)
+
+    def test_arcs(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Arcs.gbr")
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        image = renderer.render()
+        corner = 4 + 2 * math.cos(-math.pi / 4), 3 + 2 * math.sin(-math.pi / 4)
+        assert pixel(renderer, image, *corner) == raster.DARK  # rounded corner
+        assert pixel(renderer, image, 4.0, 3.0) == raster.CLEAR
+        assert pixel(renderer, image, 5.0, 6.0) == raster.DARK  # full circle
+        assert pixel(renderer, image, 5.0, 5.0) == raster.CLEAR
+        assert pixel(renderer, image, 8.29, 1.71) == raster.DARK  # G74 quadrant
+        assert pixel(renderer, image, 8.7, 1.3) == raster.CLEAR
+        assert pixel(renderer, image, 4.8, 8.0) == raster.DARK  # region arc
+        assert pixel(renderer, image, 5.2, 8.0) == raster.CLEAR
+
+    def test_step_and_repeat(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Panel.gbr")
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        image = renderer.render()
+        for dx, dy in [(0, 0), (10, 5), (20, 0)]:
+            assert pixel(renderer, image, 2.5 + dx, 1 + dy) == raster.DARK  # trace
+            assert pixel(renderer, image, 2 + dx, 3.5 + dy) == raster.DARK  # region
+            assert pixel(renderer, image, 6.4 + dx, 2.4 + dy) == raster.DARK
+            assert pixel(renderer, image, 6 + dx, 2 + dy) == raster.CLEAR  # in block
+        # A clear flash of the block inverts its polarities
+        assert pixel(renderer, image, 35.0, 5.0) == raster.DARK
+        assert pixel(renderer, image, 35.4, 5.4) == raster.CLEAR
+
+    @pytest.mark.parametrize("tile_size", [7, 64, 4096])
+    def test_tiles_match_full_render(self, tile_size):
+        layer = gl.GerberLayer(compact=True)
+        layer.read("./testdata/Test_Copper.gtl")
+        renderer = raster.RasterLayerRenderer(dpi=600).add_layer(layer)
+        expected = renderer.render(tile_size=4096)
+        image = np.zeros_like(expected)
+        for row, col, tile in renderer.tiles(tile_size):
+            assert max(tile.shape) <= tile_size
+            image[row : row + tile.shape[0], col : col + tile.shape[1]] = tile
+        assert np.array_equal(image, expected)
+
+    def test_drill_layer(self):
+        layer = drl.DrillLayer()
+        layer.add_hole(1, 1, 1.0)
+        layer.add_rout([(3, 1), (6, 1)], 0.5)
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        image = renderer.render()
+        assert pixel(renderer, image, 1, 1) == raster.DARK
+        assert pixel(renderer, image, 4.5, 1) == raster.DARK
+        assert pixel(renderer, image, 2, 1) == raster.CLEAR
+
+    def test_drill_arc_rout(self):
+        layer = drl.DrillLayer()
+        layer.add_rout([(0, 0)], 0.5, drl.NCDrillFormat.ROUT_MODE)
+        clockwise = drl.NCDrillFormat.CIRCULAR_CLOCKWISE_ROUT
+        layer.add_rout([(4, 0)], 0.5, clockwise, radius=2.0)
+        renderer = raster.RasterLayerRenderer(dpi=254).add_layer(layer)
+        image = renderer.render()
+        assert pixel(renderer, image, 2, 2) == raster.DARK
+        assert pixel(renderer, image, 2, 0.5) == raster.CLEAR
+
+    def test_fixed_bounds(self):
+        layer = drl.DrillLayer()
+        layer.add_hole(1, 1, 1.0)
+        renderer = raster.RasterLayerRenderer(dpi=254, bounds=(0, 0, 10, 5))
+        image = renderer.add_layer(layer).render()
+        assert image.shape == (50, 100)
+        assert np.count_nonzero(image) == pytest.approx(78, abs=4)
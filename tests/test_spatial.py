@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.spatial as spatial
+
+
+def brute_force(boxes, xmin, ymin, xmax, ymax):
+    hit = (
+        (boxes[:, 0] <= xmax)
+        & (boxes[:, 2] >= xmin)
+        & (boxes[:, 1] <= ymax)
+        & (boxes[:, 3] >= ymin)
+    )
+    return sorted(np.nonzero(hit)[0].tolist())
+
+
+class TestSpatialIndex:
+    @pytest.mark.parametrize("count", [0, 1, 15, 16, 17, 5000])
+    def test_query_bbox_matches_brute_force(self, count):
+        rng = np.random.default_rng(count)
+        corners = rng.uniform(0, 100, (count, 2))
+        boxes = np.hstack([corners, corners + rng.uniform(0, 5, (count, 2))])
+        index = spatial.SpatialIndex(boxes)
+        assert len(index) == count
+        for query in rng.uniform(0, 100, (20, 2)):
+            window = (*query, *(query + 10))
+            assert sorted(index.query_bbox(*window).tolist()) == brute_force(
+                boxes, *window
+            )
+
+    def test_nearest(self):
+        rng = np.random.default_rng(1)
+        corners = rng.uniform(0, 100, (2000, 2))
+        boxes = np.hstack([corners, corners + 0.5])
+        index = spatial.SpatialIndex(boxes, ids=np.arange(2000) + 10)
+        nearest = index.nearest(50, 50, k=3)
+        dx = np.maximum(np.maximum(boxes[:, 0] - 50, 50 - boxes[:, 2]), 0)
+        dy = np.maximum(np.maximum(boxes[:, 1] - 50, 50 - boxes[:, 3]), 0)
+        expected = np.argsort(np.hypot(dx, dy))[:3] + 10
+        assert nearest.tolist() == expected.tolist()
+
+    def test_nan_boxes_are_skipped(self):
+        boxes = [[0, 0, 1, 1], [np.nan] * 4, [2, 2, 3, 3]]
+        index = spatial.SpatialIndex(boxes)
+        assert index.query_bbox(-10, -10, 10, 10).tolist() == [0, 2]
+
+
+class TestLayerIndex:
+    def test_gerber_layer_index(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        index = layer.build_index()
+
+        op_type, state = layer.primitive(index.query_point(3, 6)[0])
+        assert op_type == gl.gf.GerberFormat.OPERATION_FLASH
+        assert state.point == (3.0, 6.0)
+        regions = sorted(index.query_point(2.5, 9).tolist())
+        assert [layer.primitive(i)[0] for i in regions] == [
+            gl.gf.GerberFormat.REGION_END
+        ] * 2
+
+    def test_drill_layer_index(self):
+        layer = drl.DrillLayer()
+        layer.add_hole(1, 1, 0.5)
+        layer.add_hole(5, 5, 1.0)
+        layer.add_rout([(10, 0), (20, 0)], 2.0)
+        index = layer.build_index()
+        assert index.query_point(1.2, 1.2).tolist() == [0]
+        assert index.query_point(15, 0.9).tolist() == [3]
+        assert layer.tools == {1: 0.5, 2: 1.0, 3: 2.0}
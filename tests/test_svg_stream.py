@@ -0,0 +1,101 @@
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import pygerber.drill_layer as drl
+import pygerber.gerber_layer as gl
+import pygerber.renderers.svg_stream as svg_stream
+
+SVG = "{http://www.w3.org/2000/svg}"
+XLINK = "{http://www.w3.org/1999/xlink}"
+
+
+class TestSvgStreamRenderer:
+    def test_gerber_layer(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        output = io.StringIO()
+        with svg_stream.SvgStreamRenderer(output) as renderer:
+            renderer.add_layer(layer)
+
+        root = ET.fromstring(output.getvalue())
+        viewbox = [float(v) for v in root.get("viewBox").split()]
+        xmin, ymin, xmax, ymax = layer.bounds()
+        assert viewbox == pytest.approx([xmin, ymin, xmax - xmin, ymax - ymin])
+
+        definitions = root.findall(f"{SVG}defs/{SVG}path")
+        assert len(definitions) == 3  # D11, D12 and the OCT macro
+        uses = root.findall(f".//{SVG}use")
+        assert [u.get(f"{XLINK}href") for u in uses] == ["#a1"] * 3 + ["#a2", "#a3"]
+        assert (uses[0].get("x"), uses[0].get("y")) == ("1", "6")
+
+        # The three connected draws are merged into a single path
+        traces = [p for p in root.iter(f"{SVG}path") if p.get("stroke")]
+        assert [t.get("d") for t in traces] == [
+            "M1 1l4 0l0 3l4 0",
+            "M6 8l2 2",
+        ]
+        fills = [g.get("fill") for g in root.findall(f"{SVG}g")]
+        assert fills == ["black", "white"]
+
+    def test_render_file(self, tmp_path):
+        output = tmp_path / "copper.svg"
+        renderer = svg_stream.render_file("./testdata/Test_Copper.gtl", output)
+        assert renderer.elements == 9
+
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Copper.gtl")
+        expected = io.StringIO()
+        with svg_stream.SvgStreamRenderer(expected) as stream:
+            stream.add_layer(layer)
+        assert output.read_text() == expected.getvalue()
+
+    def test_drill_layer(self):
+        layer = drl.DrillLayer()
+        layer.add_hole(1, 1, 0.5)
+        layer.add_hole(2, 1, 0.5)
+        layer.add_rout([(3, 1), (6, 1), (6, 4)], 1.0)
+        output = io.StringIO()
+        with svg_stream.SvgStreamRenderer(output, bounds=(0, 0, 10, 10)) as renderer:
+            renderer.add_layer(layer)
+
+        root = ET.fromstring(output.getvalue())
+        assert root.get("viewBox") == "0 0 10 10"
+        assert len(root.findall(f".//{SVG}use")) == 2
+        traces = [p for p in root.iter(f"{SVG}path") if p.get("stroke")]
+        assert [t.get("d") for t in traces] == ["M3 1l3 0l0 3"]
+
+    def test_arcs(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Arcs.gbr")
+        output = io.StringIO()
+        with svg_stream.SvgStreamRenderer(output) as renderer:
+            renderer.add_layer(layer)
+
+        root = ET.fromstring(output.getvalue())
+        assert root.get("viewBox") == "0.75 0.75 8.5 8.25"
+        traces = [p for p in root.iter(f"{SVG}path") if p.get("stroke")]
+        # Full circles are drawn as two halves, all but the first point relative
+        assert [t.get("d") for t in traces] == [
+            "M1 1l3 0a2 2 0 0 1 2 2l0 2a1 1 0 0 0 -2 0a1 1 0 0 0 2 0"
+            "m2 -4a1 1 0 0 0 1 1"
+        ]
+        region = root.find(f"{SVG}g/{SVG}path")
+        assert region.get("d") == "M2 7l2 0a1 1 0 0 1 0 2l-2 0l0 -2Z"
+
+    def test_step_and_repeat(self):
+        layer = gl.GerberLayer()
+        layer.read("./testdata/Test_Panel.gbr")
+        output = io.StringIO()
+        with svg_stream.SvgStreamRenderer(output) as renderer:
+            renderer.add_layer(layer)
+
+        root = ET.fromstring(output.getvalue())
+        assert root.get("viewBox") == "0.75 0.5 35.75 8.5"
+        # One group per block and polarity, placed by reference
+        blocks = root.findall(f"{SVG}defs/{SVG}g")
+        assert len(blocks) == 3
+        panel = [u for u in root.findall(f"{SVG}use") if u.get(f"{XLINK}href") == "#b4"]
+        assert [(u.get("x"), u.get("y")) for u in panel][-1] == ("20", "5")
+        assert len(panel) == 6
@@ -0,0 +1,82 @@
+import collections
+import math
+
+import numpy as np
+import pytest
+
+import pygerber.drill_layer as drl
+import pygerber.toolpath as toolpath_lib
+
+
+def brute_force_nearest_neighbour(points, start):
+    left, order = set(range(len(points))), []
+    x, y = start
+    while left:
+        index = min(left, key=lambda k: (math.hypot(*(points[k] - (x, y))), k))
+        order.append(index)
+        left.remove(index)
+        x, y = points[index]
+    return order
+
+
+class TestToolpath:
+    def test_nearest_neighbour(self):
+        rng = np.random.default_rng(3)
+        # A far cluster forces the search past the grid rings
+        points = np.vstack(
+            [rng.uniform(0, 10, (300, 2)), rng.uniform(500, 510, (5, 2))]
+        )
+        order = toolpath_lib.nearest_neighbour(points, (0.0, 0.0))
+        assert order.tolist() == brute_force_nearest_neighbour(points, (0.0, 0.0))
+
+    def test_neighbours(self):
+        rng = np.random.default_rng(4)
+        points = rng.uniform(0, 20, (200, 2))
+        found = toolpath_lib.neighbours(points, k=4)
+        distances = np.hypot(*(points[:, None] - points[None]).transpose(2, 0, 1))
+        np.fill_diagonal(distances, np.inf)
+        expected = np.sort(distances, axis=1)[:, :4]
+        actual = np.take_along_axis(distances, found, axis=1)
+        # Candidates come from the surrounding cells, which hold the nearest ones
+        # whenever they are that close
+        close = expected[:, -1] < 0.9 * np.sqrt(20 * 20 * 2 / 200)
+        assert np.allclose(actual[close], expected[close])
+
+    @pytest.mark.parametrize("count", [3, 50, 2000])
+    def test_two_opt_shortens(self, count):
+        rng = np.random.default_rng(count)
+        points = rng.uniform(0, 100, (count, 2))
+        order = toolpath_lib.nearest_neighbour(points)
+        improved = toolpath_lib.two_opt(points, order)
+        assert sorted(improved.tolist()) == list(range(count))
+        before = toolpath_lib.travel(points[order])
+        after = toolpath_lib.travel(points[improved])
+        assert after <= before
+        if count > 100:
+            assert after < 0.97 * before
+
+    def test_drill_layer_optimize(self, tmp_path):
+        layer = drl.DrillLayer()
+        layer.units = drl.NCDrillFormat.SET_UNIT_MM.value
+        rng = np.random.default_rng(5)
+        for x, y in rng.uniform(0, 50, (400, 2)).round(3).tolist():
+            layer.add_hole(x, y, 0.8 if x > y else 0.3)
+        layer.add_rout([(0, 0)], 1.0, drl.NCDrillFormat.ROUT_MODE)
+        layer.add_rout([(10, 0), (10, 10)], 1.0)
+        holes = [op for op in layer.operations if isinstance(op, drl.DrillOperation)]
+        routs = [op for op in layer.operations if isinstance(op, drl.RoutOperation)]
+
+        report = layer.optimize()
+        assert report.travel_after < report.travel_before / 5
+        assert report.tool_changes_after == 3 < report.tool_changes_before
+        hits = [op for op in layer.operations if isinstance(op, drl.DrillOperation)]
+        assert collections.Counter(hits) == collections.Counter(holes)
+        # Small tools first, then the routs in their original order
+        small = min(layer.tools, key=layer.tools.get)
+        assert layer.operations[0].tool == small
+        assert layer.operations[-3:] == routs
+
+        layer.write(tmp_path / "optimized.drl")
+        written = drl.DrillLayer()
+        written.read(tmp_path / "optimized.drl")
+        assert written.operations == layer.operations